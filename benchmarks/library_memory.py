@@ -0,0 +1,113 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+
+import synthetic_library
+from lib.music_library import MusicLibrary, TrackRecord
+
+def parseArgs():
+	parser = argparse.ArgumentParser(
+		"library_memory",
+		description="Compares the memory used by the MusicLibrary collection when tracks are stored as plain dicts "
+		"of XML attributes, and when they are stored as compact TrackRecords. A synthetic Rekordbox export is "
+		"generated for the comparison."
+	)
+
+	parser.add_argument(
+		"-n",
+		"--tracks",
+		type=int,
+		default=100000,
+		help="Number of tracks in the synthetic export (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"--xml",
+		help="Path to write the synthetic export to. Defaults to a temporary file, which is deleted afterwards."
+	)
+
+	return parser.parse_args()
+
+def readTrackAttributes(xmlPath:str):
+	import lxml.etree as ET
+
+	for _, element in ET.iterparse(xmlPath, events=("end",), tag="TRACK"):
+		if element.getparent().tag == "COLLECTION":
+			yield element.attrib
+
+		element.clear()
+
+def measureCollection(xmlPath:str, makeTrack) -> tuple:
+	# Returns (bytes retained by the collection, seconds taken to build it).
+	gc.collect()
+	tracemalloc.start()
+	start = time.perf_counter()
+
+	collection = {}
+
+	for attributes in readTrackAttributes(xmlPath):
+		collection[attributes["TrackID"]] = makeTrack(attributes)
+
+	elapsed = time.perf_counter() - start
+	gc.collect()
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	del collection
+	return (size, elapsed)
+
+def measureLibraryLoad(xmlPath:str) -> tuple:
+	# Returns (bytes retained by the library, peak bytes while loading, seconds taken).
+	gc.collect()
+	tracemalloc.start()
+	start = time.perf_counter()
+
+	library = MusicLibrary(xmlPath)
+
+	elapsed = time.perf_counter() - start
+	gc.collect()
+	size, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	del library
+	return (size, peak, elapsed)
+
+def formatSize(size:int) -> str:
+	return f"{size / (1024 * 1024):.1f}MB"
+
+def main():
+	args = parseArgs()
+
+	with tempfile.TemporaryDirectory() as tempDir:
+		xmlPath = args.xml if args.xml else os.path.join(tempDir, "library.xml")
+
+		print(f"Generating synthetic export with {args.tracks} tracks: {xmlPath}")
+		synthetic_library.write_rekordbox_xml(xmlPath, args.tracks)
+		print(f"  {formatSize(os.path.getsize(xmlPath))} on disk")
+		print()
+
+		dictSize, dictTime = measureCollection(xmlPath, dict)
+		recordSize, recordTime = measureCollection(xmlPath, TrackRecord)
+
+		print("Collection only (memory retained by Python objects):")
+		print(f"  dict of attributes: {formatSize(dictSize)} ({dictTime:.2f}s)")
+		print(f"  TrackRecord:        {formatSize(recordSize)} ({recordTime:.2f}s)")
+		print(f"  Reduction:          {(1 - recordSize / dictSize) * 100:.0f}%")
+		print()
+
+		librarySize, libraryPeak, libraryTime = measureLibraryLoad(xmlPath)
+
+		print("Full MusicLibrary load:")
+		print(f"  Retained: {formatSize(librarySize)}, peak: {formatSize(libraryPeak)} ({libraryTime:.2f}s)")
+
+if __name__ != "__main__":
+	raise RuntimeError("Expected file to be run as a script")
+
+main()
@@ -0,0 +1,111 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Each entry point is run with --help, which exits as soon as the arguments are parsed.
+# This measures the cost of starting the interpreter and importing everything the script
+# imports at the top level, which is paid on every invocation.
+ENTRY_POINTS = [
+	"checkdj.py",
+	"libutils.py",
+	"listtags.py",
+	"makedj.py",
+	"toflac.py",
+	"ytdraft.py",
+]
+
+def parseArgs():
+	parser = argparse.ArgumentParser(
+		"startup_time",
+		description="Reports the cold-start cost of each script entry point."
+	)
+
+	parser.add_argument(
+		"-n",
+		"--runs",
+		type=int,
+		default=10,
+		help="Number of times to run each entry point (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"--top",
+		type=int,
+		default=5,
+		help="Number of most expensive imports to list for each entry point (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"scripts",
+		nargs="*",
+		help="Entry points to measure. Defaults to all of them."
+	)
+
+	return parser.parse_args()
+
+def timeRun(args:list) -> float:
+	start = time.perf_counter()
+	subprocess.run([sys.executable] + args, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+	return time.perf_counter() - start
+
+def medianRunTime(args:list, runs:int) -> float:
+	return statistics.median(timeRun(args) for _ in range(runs))
+
+def topImports(script:str, count:int) -> list:
+	# -X importtime reports lines of "import time: self [us] | cumulative | imported package".
+	# Only top level imports (those without any indent) are of interest here.
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", script, "--help"],
+		cwd=REPO_DIR,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.PIPE,
+		text=True
+	)
+
+	imports = []
+
+	for line in result.stderr.splitlines():
+		if not line.startswith("import time:"):
+			continue
+
+		fields = line[len("import time:"):].split("|")
+
+		if len(fields) != 3 or not fields[0].strip().isdigit():
+			continue
+
+		name = fields[2]
+
+		if name.startswith("  "):
+			continue
+
+		imports.append((int(fields[1].strip()), name.strip()))
+
+	imports.sort(reverse=True)
+	return imports[:count]
+
+def main():
+	args = parseArgs()
+	scripts = args.scripts if args.scripts else ENTRY_POINTS
+
+	baseline = medianRunTime(["-c", "pass"], args.runs)
+	print(f"Interpreter startup: {baseline * 1000:.1f}ms (median of {args.runs} runs)")
+	print()
+
+	for script in scripts:
+		total = medianRunTime([script, "--help"], args.runs)
+		print(f"{script}: {total * 1000:.1f}ms ({(total - baseline) * 1000:+.1f}ms over interpreter startup)")
+
+		for cumulativeUs, name in topImports(script, args.top):
+			print(f"  {cumulativeUs / 1000:7.1f}ms  {name}")
+
+		print()
+
+if __name__ != "__main__":
+	raise RuntimeError("Expected file to be run as a script")
+
+main()
@@ -0,0 +1,128 @@
+"""
+Stand-ins for ffmpeg and yt-dlp, so that the benchmarks measure the scripts themselves
+rather than the external tools, and can run where the tools are not installed. Each stub
+does a small, constant amount of work, and writes output which passes the same validation
+as the real tool's output would.
+
+Run as: stub_tools.py ffmpeg|yt-dlp [tool arguments]
+"""
+
+import json
+import os
+import stat
+import sys
+import zlib
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+
+import synthetic_tree
+from lib import audio_hash, tag_mapping
+from lib.media_probe import MediaProbe
+
+STUB_VERSION = "benchmark-stub"
+STUB_VIDEO_SECONDS = 5
+
+# ffmpeg's names for metadata (as set with -metadata) match the Vorbis comment names.
+METADATA_FRAMES = tag_mapping.VORBIS_COMMENT_FRAMES
+
+def writeStubExecutable(dirPath:str, toolName:str) -> str:
+	# Writes an executable which runs this script as the given tool, and returns its path.
+	path = os.path.join(dirPath, toolName)
+
+	with open(path, "w") as outFile:
+		outFile.write("#!/bin/sh\n")
+		outFile.write(f'exec "{sys.executable}" "{os.path.realpath(__file__)}" {toolName} "$@"\n')
+
+	os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+	return path
+
+def getOutputPath(args:list) -> str:
+	# The scripts always pass the output file just before -nostdin.
+	return args[args.index("-nostdin") - 1] if "-nostdin" in args else args[-1]
+
+def getAudioSeed(inputPath:str) -> int:
+	# Derived from the input's audio, so that outputs have the same audio only if their inputs did,
+	# and the duplicate detection sees the same groups of duplicates in the outputs as in the inputs.
+	return int(audio_hash.hashAudioPayload(inputPath)[:16], 16)
+
+def runFFMPEG(args:list) -> int:
+	if "-version" in args:
+		print(f"ffmpeg version {STUB_VERSION}")
+		return 0
+
+	inputPath = args[args.index("-i") + 1]
+	outputPath = getOutputPath(args)
+
+	if os.path.exists(outputPath):
+		print(f"File '{outputPath}' already exists. Exiting.", file=sys.stderr)
+		return 1
+
+	probe = MediaProbe(inputPath)
+	tags = probe.getBasicTagDict() or {}
+	seed = getAudioSeed(inputPath)
+
+	for index, arg in enumerate(args):
+		if arg == "-metadata":
+			name, value = args[index + 1].split("=", 1)
+
+			if name in METADATA_FRAMES:
+				tags[METADATA_FRAMES[name]] = value
+
+	if outputPath.lower().endswith(".flac"):
+		frameNames = {frame: name for name, frame in METADATA_FRAMES.items()}
+		synthetic_tree.writeFLAC(outputPath, probe.getDuration(), {frameNames[frame]: value for frame, value in tags.items()}, seed)
+	else:
+		bitrate = int(args[args.index("-ab") + 1].rstrip("k")) if "-ab" in args else 128
+		synthetic_tree.writeMP3(outputPath, probe.getDuration(), synthetic_tree.mp3BitrateAtLeast(bitrate), tags, seed)
+
+	if "-progress" in args:
+		# Only the final report is written, with the keys which the scripts read.
+		print(f"total_size={os.path.getsize(outputPath)}")
+		print(f"out_time_us={int(probe.getDuration() * 1000000)}")
+		print("speed=N/A")
+		print("progress=end")
+
+	return 0
+
+def getPrintTemplate(args:list):
+	# Only the "after_move:" templates which the scripts pass are supported.
+	for index, arg in enumerate(args):
+		if arg == "--print" and args[index + 1].startswith("after_move:"):
+			return args[index + 1][len("after_move:"):]
+
+	return None
+
+def runYTDLP(args:list) -> int:
+	outputDir = args[args.index("--paths") + 1] if "--paths" in args else "."
+	printTemplate = getPrintTemplate(args)
+
+	for url in [arg for arg in args if arg.startswith("https://")]:
+		videoID = url.rsplit("=", 1)[-1]
+		outputPath = os.path.join(outputDir, f"Video {videoID}.mp3")
+		existed = os.path.exists(outputPath)
+
+		if not existed:
+			synthetic_tree.writeMP3(outputPath, STUB_VIDEO_SECONDS, 320, {"TIT2": f"Video {videoID}"}, zlib.crc32(videoID.encode()))
+
+		# Like yt-dlp, --print implies --quiet.
+		if printTemplate is not None:
+			print(printTemplate.replace("%(id)s", videoID).replace("%(filepath)j", json.dumps(outputPath)))
+			continue
+
+		print(f"[youtube] Extracting URL: {url}")
+
+		if existed:
+			print(f"[ExtractAudio] Not converting audio {outputPath}; file is already in target format mp3")
+		else:
+			print(f"[ExtractAudio] Destination: {outputPath}")
+
+	return 0
+
+TOOLS = {
+	"ffmpeg": runFFMPEG,
+	"yt-dlp": runYTDLP,
+}
+
+if __name__ == "__main__":
+	sys.exit(TOOLS[sys.argv[1]](sys.argv[2:]))
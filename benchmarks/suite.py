@@ -0,0 +1,376 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+
+import stub_tools
+import synthetic_library
+import synthetic_tree
+from lib import config
+
+# Bump this whenever the benchmarks change in a way that makes their
+# results incomparable with those from earlier versions.
+RESULTS_FORMAT_VERSION = 2
+
+YTDRAFT_VIDEO_COUNT = 10
+
+def parseArgs():
+	parser = argparse.ArgumentParser(
+		"suite",
+		description="Times validation, makedj, checkdj, ytdraft and MusicLibrary loading against a synthetic library. "
+		"ffmpeg and yt-dlp are replaced with stubs, so that the scripts themselves are measured. Results are saved as "
+		"JSON, and can be compared against the results of an earlier run."
+	)
+
+	parser.add_argument(
+		"benchmarks",
+		nargs="*",
+		help="Names of the benchmarks to run. Defaults to all of them."
+	)
+
+	parser.add_argument(
+		"-n",
+		"--tracks",
+		type=int,
+		default=200,
+		help="Number of tracks in the synthetic Personal directory (default: %(default)s). A further 5%% are "
+		"written to the Draft directory."
+	)
+
+	parser.add_argument(
+		"--seconds",
+		type=float,
+		default=5,
+		help="Duration of each synthetic track (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"--library-tracks",
+		type=int,
+		default=20000,
+		help="Number of tracks in the synthetic Rekordbox export (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"-r",
+		"--runs",
+		type=int,
+		default=3,
+		help="Number of times to run each benchmark (default: %(default)s)."
+	)
+
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Value of --jobs passed to the scripts. Defaults to the number of CPUs (%(default)s)."
+	)
+
+	parser.add_argument(
+		"-o",
+		"--output",
+		help="Path to write the results to, as JSON."
+	)
+
+	parser.add_argument(
+		"-c",
+		"--compare",
+		help="Path to the JSON results of an earlier run, to compare against."
+	)
+
+	parser.add_argument(
+		"--keep",
+		help="Directory to generate the synthetic library in, which is kept afterwards. Defaults to a temporary "
+		"directory, which is deleted."
+	)
+
+	parser.add_argument(
+		"-l",
+		"--list",
+		action="store_true",
+		help="Lists the available benchmarks and exits."
+	)
+
+	return parser.parse_args()
+
+class Environment:
+	"""
+	The synthetic library, and the paths which the benchmarks need.
+	"""
+
+	def __init__(self, args, rootDir:str):
+		self.args = args
+		self.rootDir = rootDir
+		self.binDir = os.path.join(rootDir, "bin")
+		os.makedirs(self.binDir, exist_ok=True)
+
+		self.configPath = synthetic_tree.writeTree(
+			rootDir,
+			args.tracks,
+			args.seconds,
+			ffmpegPath=stub_tools.writeStubExecutable(self.binDir, "ffmpeg"),
+			ytdlpPath=stub_tools.writeStubExecutable(self.binDir, "yt-dlp")
+		)
+
+		self.configFile = config.Config(self.configPath)
+		self.xmlPath = os.path.join(rootDir, "library.xml")
+		self.ytdraftDir = os.path.join(rootDir, "YouTube")
+		synthetic_library.write_rekordbox_xml(self.xmlPath, args.library_tracks)
+
+	def getSourcePaths(self) -> list:
+		paths = []
+
+		for dirPath in (self.configFile.getPersonalDirPath(), self.configFile.getDraftDirPath()):
+			for parentDir, _, fileNames in os.walk(dirPath):
+				paths += [os.path.join(parentDir, fileName) for fileName in fileNames]
+
+		return sorted(paths)
+
+	def runScript(self, script:str, scriptArgs:list, allowedReturnCodes:tuple=(0,)):
+		env = dict(os.environ)
+		env[config.CONFIG_PATH_ENV_VAR] = self.configPath
+
+		result = subprocess.run(
+			[sys.executable, os.path.join(REPO_DIR, script)] + scriptArgs,
+			cwd=self.rootDir,
+			env=env,
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.PIPE,
+			text=True
+		)
+
+		if result.returncode not in allowedReturnCodes:
+			raise RuntimeError(f"{script} returned error code {result.returncode}:\n{result.stderr}")
+
+	def runMakeDJ(self, extraArgs:list):
+		self.runScript("makedj.py", [
+			"-r", ".",
+			self.configFile.getDraftDirPath(),
+			"--jobs", str(self.args.jobs),
+			"--no-transcode-cache"
+		] + extraArgs)
+
+	def runCheckDJ(self, extraArgs:list):
+		# checkdj returns 1 if any files fail validation, which some synthetic files do.
+		self.runScript("checkdj.py", ["--jobs", str(self.args.jobs)] + extraArgs, (0, 1))
+
+	def clearDJDir(self):
+		djDir = self.configFile.getDJDirPath()
+		shutil.rmtree(djDir)
+		os.makedirs(djDir)
+
+def setUpNothing(env:Environment):
+	pass
+
+def benchValidateFile(env:Environment):
+	from lib import validation
+
+	for path in env.getSourcePaths():
+		validation.validateFile(path)
+
+def benchMakeDJDiscovery(env:Environment):
+	# A dry run discovers and validates every file, but doesn't transfer anything.
+	env.runMakeDJ([])
+
+def setUpMakeDJTransfer(env:Environment):
+	env.clearDJDir()
+
+def benchMakeDJTransfer(env:Environment):
+	env.runMakeDJ(["--commit"])
+
+def setUpMakeDJSync(env:Environment):
+	env.clearDJDir()
+	env.runMakeDJ(["--commit"])
+
+def benchMakeDJSync(env:Environment):
+	env.runMakeDJ(["--commit", "--sync"])
+
+def setUpCheckDJ(env:Environment):
+	if not os.listdir(env.configFile.getDJDirPath()):
+		env.runMakeDJ(["--commit"])
+
+def benchCheckDJUncached(env:Environment):
+	env.runCheckDJ(["--no-cache"])
+
+def setUpCheckDJCached(env:Environment):
+	setUpCheckDJ(env)
+	env.runCheckDJ([])
+
+def benchCheckDJCached(env:Environment):
+	env.runCheckDJ([])
+
+def benchLibraryParse(env:Environment):
+	from lib.music_library import MusicLibrary
+	MusicLibrary(env.xmlPath, use_snapshot=False)
+
+def setUpLibrarySnapshot(env:Environment):
+	from lib import library_snapshot
+	from lib.music_library import MusicLibrary
+
+	# Parses the XML and saves the snapshot, so that the timed run only loads it.
+	MusicLibrary(env.xmlPath, use_snapshot=True)
+	snapshotPath = library_snapshot.default_snapshot_path(env.xmlPath)
+
+	if library_snapshot.load_snapshot(env.xmlPath, snapshotPath) is None:
+		raise RuntimeError(f"No valid library snapshot was saved to {snapshotPath}")
+
+def benchLibrarySnapshot(env:Environment):
+	from lib.music_library import MusicLibrary
+	MusicLibrary(env.xmlPath, use_snapshot=True)
+
+def setUpYTDraft(env:Environment):
+	if os.path.isdir(env.ytdraftDir):
+		shutil.rmtree(env.ytdraftDir)
+
+def benchYTDraft(env:Environment):
+	videoIDs = [f"video{index:04}" for index in range(YTDRAFT_VIDEO_COUNT)]
+	env.runScript("ytdraft.py", videoIDs + ["-o", env.ytdraftDir])
+
+def benchYTDraftBatched(env:Environment):
+	videoIDs = [f"video{index:04}" for index in range(YTDRAFT_VIDEO_COUNT)]
+	env.runScript("ytdraft.py", videoIDs + ["-o", env.ytdraftDir, "--batch-size", str(YTDRAFT_VIDEO_COUNT)])
+
+# Name: (set up function, which is run before every run but not timed, benchmark function).
+BENCHMARKS = {
+	"validation.validateFile": (setUpNothing, benchValidateFile),
+	"makedj.discovery": (setUpNothing, benchMakeDJDiscovery),
+	"makedj.transfer": (setUpMakeDJTransfer, benchMakeDJTransfer),
+	"makedj.sync": (setUpMakeDJSync, benchMakeDJSync),
+	"checkdj.uncached": (setUpCheckDJ, benchCheckDJUncached),
+	"checkdj.cached": (setUpCheckDJCached, benchCheckDJCached),
+	"MusicLibrary.parse": (setUpNothing, benchLibraryParse),
+	"MusicLibrary.snapshot": (setUpLibrarySnapshot, benchLibrarySnapshot),
+	"ytdraft": (setUpYTDraft, benchYTDraft),
+	"ytdraft.batched": (setUpYTDraft, benchYTDraftBatched),
+}
+
+def runBenchmark(env:Environment, name:str, runs:int) -> dict:
+	setUp, bench = BENCHMARKS[name]
+	times = []
+
+	for _ in range(runs):
+		setUp(env)
+		start = time.perf_counter()
+		bench(env)
+		times.append(time.perf_counter() - start)
+
+	return {
+		"runs": times,
+		"median": statistics.median(times),
+		"min": min(times)
+	}
+
+def getGitRevision():
+	try:
+		result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+		return result.stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def describeRun(args) -> dict:
+	# The parameters are everything that affects whether two sets of results can be compared.
+	return {
+		"revision": getGitRevision(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpus": os.cpu_count(),
+		"runs": args.runs,
+		"parameters": {
+			"tracks": args.tracks,
+			"seconds": args.seconds,
+			"libraryTracks": args.library_tracks,
+			"jobs": args.jobs
+		}
+	}
+
+def loadResults(path:str) -> dict:
+	with open(path, "r") as inFile:
+		results = json.load(inFile)
+
+	if results.get("version") != RESULTS_FORMAT_VERSION:
+		raise ValueError(f"{path} was written by a different version of the benchmark suite, so can't be compared")
+
+	return results
+
+def printComparison(previous:dict, current:dict):
+	if previous["run"]["parameters"] != current["run"]["parameters"]:
+		print("Warning: the benchmarks were run with different parameters, so may not be comparable.")
+
+	print(f"{'Benchmark':<28}{'Previous':>12}{'Current':>12}{'Change':>10}")
+
+	for name, result in current["benchmarks"].items():
+		if name not in previous["benchmarks"]:
+			print(f"{name:<28}{'-':>12}{result['median']:>11.3f}s{'-':>10}")
+			continue
+
+		previousMedian = previous["benchmarks"][name]["median"]
+		change = (result["median"] - previousMedian) / previousMedian * 100 if previousMedian else 0
+		print(f"{name:<28}{previousMedian:>11.3f}s{result['median']:>11.3f}s{change:>+9.1f}%")
+
+def runAll(args, rootDir:str, names:list) -> dict:
+	print(f"Generating synthetic library in {rootDir}")
+	env = Environment(args, rootDir)
+	results = {}
+
+	for name in names:
+		results[name] = runBenchmark(env, name, args.runs)
+		print(f"  {name}: {results[name]['median']:.3f}s (median of {args.runs} runs, min {results[name]['min']:.3f}s)")
+
+	return results
+
+def main():
+	args = parseArgs()
+
+	if args.list:
+		for name in BENCHMARKS:
+			print(name)
+
+		return
+
+	names = args.benchmarks if args.benchmarks else list(BENCHMARKS)
+
+	for name in names:
+		if name not in BENCHMARKS:
+			print(f"Unknown benchmark \"{name}\". Use --list to list the available benchmarks.", file=sys.stderr)
+			sys.exit(1)
+
+	# Loaded first, so that a bad path is reported before spending time on the benchmarks.
+	previous = loadResults(args.compare) if args.compare else None
+
+	if args.keep:
+		os.makedirs(args.keep, exist_ok=True)
+		benchmarkResults = runAll(args, os.path.realpath(args.keep), names)
+	else:
+		with tempfile.TemporaryDirectory() as tempDir:
+			benchmarkResults = runAll(args, tempDir, names)
+
+	results = {
+		"version": RESULTS_FORMAT_VERSION,
+		"run": describeRun(args),
+		"benchmarks": benchmarkResults
+	}
+
+	if args.output:
+		with open(args.output, "w") as outFile:
+			json.dump(results, outFile, indent=4)
+
+		print(f"Results written to {args.output}")
+
+	if previous:
+		print()
+		printComparison(previous, results)
+
+if __name__ != "__main__":
+	raise RuntimeError("Expected file to be run as a script")
+
+main()
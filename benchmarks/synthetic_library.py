@@ -0,0 +1,100 @@
+import random
+from xml.sax.saxutils import quoteattr
+
+GENRES = ["Drum & Bass", "Liquid Funk", "Neurofunk", "Jungle", "Dubstep", "House", "Techno"]
+KINDS = ["MP3 File", "FLAC File", "WAV File"]
+TONALITIES = ["1A", "2A", "3A", "4A", "5A", "6A", "7A", "8A", "9A", "10A", "11A", "12A", "1B", "5B", "8B", "11B"]
+
+def track_attributes(rng: random.Random, track_id: int, artist_count: int, album_count: int):
+	artist = f"Artist {rng.randrange(artist_count)}"
+	album = f"Album {rng.randrange(album_count)}"
+	title = f"Track {track_id}" if rng.random() > 0.02 else f"DRAFT Track {track_id}"
+
+	return {
+		"TrackID": str(track_id),
+		"Name": title,
+		"Artist": artist,
+		"Composer": "",
+		"Album": album,
+		"Grouping": "",
+		"Genre": rng.choice(GENRES),
+		"Kind": rng.choice(KINDS),
+		"Size": str(rng.randrange(5000000, 20000000)),
+		"TotalTime": str(rng.randrange(180, 480)),
+		"DiscNumber": "0",
+		"TrackNumber": str(rng.randrange(1, 13)),
+		"Year": str(rng.randrange(1995, 2025)),
+		"AverageBpm": f"{rng.choice([170, 172, 174, 175]):.2f}",
+		"DateAdded": f"20{rng.randrange(15, 25)}-{rng.randrange(1, 13):02}-{rng.randrange(1, 29):02}",
+		"BitRate": "320",
+		"SampleRate": "44100",
+		"Comments": "",
+		"PlayCount": str(rng.randrange(20)),
+		"Rating": str(rng.choice([0, 51, 102, 153, 204, 255])),
+		"Location": f"file://localhost/Music/DJ/{artist}/{album}/{track_id:06}.mp3",
+		"Remixer": "",
+		"Tonality": rng.choice(TONALITIES),
+		"Label": f"Label {rng.randrange(200)}",
+		"Mix": "",
+	}
+
+def write_attributes(out_file, attributes: dict):
+	out_file.write(" ".join(f"{key}={quoteattr(value)}" for key, value in attributes.items()))
+
+def write_playlist(out_file, name: str, track_ids: list, indent: str):
+	out_file.write(f'{indent}<NODE Name={quoteattr(name)} Type="1" KeyType="0" Entries="{len(track_ids)}">\n')
+
+	for track_id in track_ids:
+		out_file.write(f'{indent}  <TRACK Key="{track_id}"/>\n')
+
+	out_file.write(f"{indent}</NODE>\n")
+
+def write_rekordbox_xml(path: str, track_count: int, playlist_count: int = 50, seed: int = 1):
+	"""
+	Writes a synthetic Rekordbox XML export to the given path. The collection
+	contains track_count tracks with a realistic set of attributes, and the
+	playlists include the DnB/Everything layout that libutils checks.
+	"""
+
+	rng = random.Random(seed)
+	artist_count = max(track_count // 20, 1)
+	album_count = max(track_count // 8, 1)
+	track_ids = list(range(1, track_count + 1))
+
+	with open(path, "w", encoding="utf-8") as out_file:
+		out_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+		out_file.write('<DJ_PLAYLISTS Version="1.0.0">\n')
+		out_file.write('  <PRODUCT Name="rekordbox" Version="6.0.0" Company="AlphaTheta"/>\n')
+		out_file.write(f'  <COLLECTION Entries="{track_count}">\n')
+
+		for track_id in track_ids:
+			out_file.write("    <TRACK ")
+			write_attributes(out_file, track_attributes(rng, track_id, artist_count, album_count))
+			out_file.write(">\n")
+			out_file.write('      <TEMPO Inizio="0.025" Bpm="174.00" Metro="4/4" Battito="1"/>\n')
+
+			for cue in range(4):
+				out_file.write(f'      <POSITION_MARK Name="" Type="0" Start="{cue * 22.068:.3f}" Num="{cue}" Red="40" Green="226" Blue="20"/>\n')
+
+			out_file.write("    </TRACK>\n")
+
+		out_file.write("  </COLLECTION>\n")
+		out_file.write("  <PLAYLISTS>\n")
+		out_file.write('    <NODE Type="0" Name="ROOT" Count="2">\n')
+		out_file.write('      <NODE Name="DnB" Type="0" Count="4">\n')
+
+		write_playlist(out_file, "Everything", [track_id for track_id in track_ids if rng.random() > 0.001], "        ")
+		write_playlist(out_file, "[Import]", rng.sample(track_ids, min(100, track_count)), "        ")
+		write_playlist(out_file, "Drafts", rng.sample(track_ids, min(50, track_count)), "        ")
+
+		out_file.write(f'        <NODE Name="Sets" Type="0" Count="{playlist_count}">\n')
+
+		for index in range(playlist_count):
+			write_playlist(out_file, f"Set {index}", rng.sample(track_ids, min(40, track_count)), "          ")
+
+		out_file.write("        </NODE>\n")
+		out_file.write("      </NODE>\n")
+		write_playlist(out_file, "Unsorted", rng.sample(track_ids, min(200, track_count)), "      ")
+		out_file.write("    </NODE>\n")
+		out_file.write("  </PLAYLISTS>\n")
+		out_file.write("</DJ_PLAYLISTS>\n")
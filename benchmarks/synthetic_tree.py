@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import struct
+
+# Valid MPEG-1 layer III bitrates, in kbps, indexed by their value in the frame header.
+MP3_BITRATES = [None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+MP3_SAMPLE_RATE = 44100
+MP3_SAMPLES_PER_FRAME = 1152
+
+FLAC_SAMPLE_RATE = 44100
+FLAC_STREAMINFO_SIZE = 34
+
+def mp3BitrateAtLeast(bitrate:int) -> int:
+	# Returns the lowest valid MP3 bitrate which is at least the given one.
+	for validBitrate in MP3_BITRATES[1:]:
+		if validBitrate >= bitrate:
+			return validBitrate
+
+	return MP3_BITRATES[-1]
+
+def writeMP3(path:str, seconds:float, bitrate:int=320, tags:dict=None, seed:int=0):
+	"""
+	Writes a constant bitrate MP3 of silent frames, which mutagen reads as having the given duration
+	and bitrate. The seed is written into the first frame, so that each file has distinct audio. Tags
+	are keyed on ID3 frame, and are not written at all if None.
+	"""
+
+	from mutagen import id3
+
+	header = bytes([0xFF, 0xFB, MP3_BITRATES.index(bitrate) << 4, 0xC4])
+	frameSize = 144 * bitrate * 1000 // MP3_SAMPLE_RATE
+	frame = header + bytes(frameSize - len(header))
+	firstFrame = header + struct.pack(">Q", seed) + bytes(frameSize - len(header) - 8)
+	frameCount = max(int(seconds * MP3_SAMPLE_RATE / MP3_SAMPLES_PER_FRAME), 1)
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	with open(path, "wb") as outFile:
+		outFile.write(firstFrame)
+		outFile.write(frame * (frameCount - 1))
+
+	if tags is not None:
+		id3Tags = id3.ID3()
+
+		for frameID, value in tags.items():
+			id3Tags.add(id3.Frames[frameID](encoding=id3.Encoding.UTF8, text=value))
+
+		id3Tags.save(path, v2_version=3)
+
+def writeFLAC(path:str, seconds:float, tags:dict=None, seed:int=0):
+	"""
+	Writes a FLAC stub, which has a valid STREAMINFO block describing the given duration, but only
+	a token amount of audio data. Tags are keyed on Vorbis comment name, and are not written at all
+	if None.
+	"""
+
+	from mutagen.flac import FLAC
+
+	sampleCount = int(seconds * FLAC_SAMPLE_RATE)
+
+	# Sample rate (20 bits), channels - 1 (3 bits), bits per sample - 1 (5 bits), total samples (36 bits).
+	audioFormat = (FLAC_SAMPLE_RATE << 44) | (1 << 41) | (15 << 36) | sampleCount
+	streamInfo = struct.pack(">HH", 4096, 4096) + bytes(6) + audioFormat.to_bytes(8, "big") + bytes(16)
+	audio = b"\xff\xf8" + struct.pack(">Q", seed) + bytes(128)
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	with open(path, "wb") as outFile:
+		# The top bit of the block header marks STREAMINFO as the last metadata block.
+		outFile.write(b"fLaC" + bytes([0x80]) + FLAC_STREAMINFO_SIZE.to_bytes(3, "big") + streamInfo + audio)
+
+	if tags is not None:
+		flacFile = FLAC(path)
+
+		for key, value in tags.items():
+			flacFile[key] = value
+
+		flacFile.save()
+
+def writeTrack(rng:random.Random, dirPath:str, index:int, seconds:float):
+	# Roughly the mix of files found in a real Personal directory: mostly 320k MP3s, some
+	# FLACs, and a few files which fail validation for one reason or another.
+	title = f"Track {index}"
+	artist = f"Artist {rng.randrange(50)}"
+	album = f"Album {rng.randrange(200)}"
+	roll = rng.random()
+
+	if roll < 0.15:
+		tags = {"title": title, "artist": artist, "album": album} if roll < 0.13 else {"title": title}
+		writeFLAC(os.path.join(dirPath, f"{index:05} {title}.flac"), seconds, tags, index)
+		return
+
+	bitrate = 128 if roll > 0.9 else 320
+	tags = {"TIT2": title, "TPE1": artist, "TALB": album} if roll < 0.95 else None
+	writeMP3(os.path.join(dirPath, f"{index:05} {title}.mp3"), seconds, bitrate, tags, index)
+
+def writeTree(rootDir:str, trackCount:int, seconds:float=5, seed:int=1, ffmpegPath:str=None, ytdlpPath:str=None) -> str:
+	"""
+	Writes a synthetic Personal/DJ/Draft tree under the root directory, along with a config.json
+	which refers to it (and to the given stub executables), and returns the path to the config.
+	The DJ directory is left empty, for makedj to fill.
+	"""
+
+	rng = random.Random(seed)
+	personalDir = os.path.join(rootDir, "Personal")
+	draftDir = os.path.join(rootDir, "Draft")
+
+	for index in range(trackCount):
+		dirPath = os.path.join(personalDir, f"Artist {index % 17}", f"Album {index % 5}")
+		writeTrack(rng, dirPath, index, seconds)
+
+	for index in range(trackCount, trackCount + max(trackCount // 20, 1)):
+		writeTrack(rng, draftDir, index, seconds)
+
+	os.makedirs(os.path.join(rootDir, "DJ"), exist_ok=True)
+
+	configContents = {
+		"personal": "Personal",
+		"dj": "DJ",
+		"draft": "Draft"
+	}
+
+	if ffmpegPath:
+		configContents["ffmpeg"] = ffmpegPath
+
+	if ytdlpPath:
+		configContents["yt-dlp"] = ytdlpPath
+
+	configPath = os.path.join(rootDir, "config.json")
+
+	with open(configPath, "w") as outFile:
+		json.dump(configContents, outFile, indent=4)
+
+	return configPath
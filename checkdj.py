@@ -1,9 +1,16 @@
 import argparse
 import os
 import sys
-from lib import config, validation
+import itertools
+from collections import deque
+from concurrent.futures import Future
+from lib import config, validation, utils, crawler, instrumentation, jsonl_output
+from lib.file_cache import FileCache, FileIdentity
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
+VALIDATION_CACHE_FILE_NAME = "validation_cache.sqlite3"
+VALIDATION_CACHE_TABLE = "validation_results"
+VALIDATION_CHUNK_SIZE = 64
 
 def parseArgs():
 	parser = argparse.ArgumentParser(
@@ -26,6 +33,37 @@ def parseArgs():
 		"root directory."
 	)
 
+	cacheGroup = parser.add_mutually_exclusive_group()
+
+	cacheGroup.add_argument(
+		"--no-cache",
+		action="store_true",
+		help="If set, the validation cache is neither read from nor written to, and every file is validated."
+	)
+
+	cacheGroup.add_argument(
+		"--rebuild-cache",
+		action="store_true",
+		help="If set, all entries in the validation cache are discarded, and every file is validated and "
+		"written back to the cache."
+	)
+
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Number of processes to validate files in. Defaults to the number of CPUs (%(default)s)."
+	)
+
+	parser.add_argument(
+		"--scan-threads",
+		type=int,
+		default=1,
+		help="Number of threads to list directories on. Values above 1 help on high-latency network mounts, but "
+		"files are then reported in a non-deterministic order. Defaults to 1."
+	)
+
 	parser.add_argument(
 		"dirs",
 		nargs="*",
@@ -33,35 +71,134 @@ def parseArgs():
 		"directory which holds the library config file. If no paths are specified, the configured DJ directory is used."
 	)
 
+	jsonl_output.addArgument(parser, "the validation errors for each file")
+	instrumentation.addArguments(parser)
+
 	return parser.parse_args()
 
 def loadConfig():
-	return config.Config(os.path.join(SCRIPT_DIR, "config.json"))
+	return config.Config(config.getConfigFilePath(SCRIPT_DIR))
 
-def computePaths(configFile:config.Config, paths:list):
-	outPaths = []
+def openValidationCache(args, configFile:config.Config):
+	if args.no_cache:
+		return None
 
-	for path in paths:
-		if os.path.isabs(path):
-			outPaths.append(path)
-		else:
-			outPaths.append(os.path.join(configFile.getBaseDirPath(), path))
+	cache = FileCache(
+		os.path.join(configFile.getBaseDirPath(), VALIDATION_CACHE_FILE_NAME),
+		VALIDATION_CACHE_TABLE,
+		validation.VALIDATION_RULES_VERSION
+	)
 
-	return outPaths
+	if args.rebuild_cache:
+		cache.clear()
 
-def addResult(results:dict, key:str, value:str):
-	if key not in results:
-		results[key] = [value]
-	else:
-		results[key].append(value)
+	return cache
 
-def main():
-	args = parseArgs()
+def lookupCachedResults(cache:FileCache, filePaths:list):
+	cachedResults = {}
+	identities = {}
+	uncachedPaths = []
 
-	configFile = loadConfig()
-	paths = computePaths(configFile, args.dirs) if args.dirs else [configFile.getDJDirPath()]
+	for filePath in filePaths:
+		if cache:
+			try:
+				identity = FileIdentity.fromPath(filePath)
+			except OSError:
+				# Let validation report the problem with the file.
+				identity = None
+
+			if identity:
+				validationErrors = cache.get(filePath, identity)
+
+				if validationErrors is not None:
+					cachedResults[filePath] = validationErrors
+					continue
+
+				identities[filePath] = identity
+
+		uncachedPaths.append(filePath)
+
+	return (cachedResults, identities, uncachedPaths)
+
+def validateChunk(filePaths:list, timed:bool) -> tuple:
+	# Returns (validation errors for each file, timings). Chunks may be validated in worker processes,
+	# which don't share the timings of the main process, so the timings are returned with the results.
+	if not timed:
+		return (validation.validateFiles(filePaths), None)
+
+	timings = instrumentation.PhaseTimings()
+	results = []
+
+	for filePath in filePaths:
+		with timings.phase(instrumentation.PHASE_VALIDATION, instrumentation.getFileType(filePath)):
+			results.append(validation.validateFile(filePath))
+
+	return (results, timings.getEntries())
+
+def submitChunk(executor, filePaths:list) -> Future:
+	if executor:
+		return executor.submit(validateChunk, filePaths, instrumentation.timingsEnabled())
+
+	future = Future()
+	future.set_result(validateChunk(filePaths, instrumentation.timingsEnabled()))
+	return future
 
-	filesToProcess = {}
+def finishChunk(cache:FileCache, chunk:list, cachedResults:dict, identities:dict, uncachedPaths:list, future:Future):
+	validationResults, timings = future.result()
+	instrumentation.mergeTimings(timings)
+	validatedResults = dict(zip(uncachedPaths, validationResults))
+
+	for filePath, displayPath in chunk:
+		if filePath in cachedResults:
+			yield (displayPath, cachedResults[filePath])
+			continue
+
+		validationErrors = validatedResults[filePath]
+
+		# Unexpected errors may be transient (eg. a network share dropping out),
+		# so don't remember them.
+		if filePath in identities and validation.UNEXPECTED_ERROR not in validationErrors:
+			cache.put(filePath, identities[filePath], validationErrors)
+
+		yield (displayPath, validationErrors)
+
+def validateAllFiles(args, cache:FileCache, files):
+	# Takes an iterable of (file path, display path), and yields (display path, validation errors)
+	# in the same order. Files are validated in chunks as soon as enough of them have been provided,
+	# and multiple chunks are in flight at once if more than one job is used.
+	executor = None
+
+	if args.jobs > 1:
+		# Only imported when needed, as it is comparatively expensive to import.
+		from concurrent.futures import ProcessPoolExecutor
+		executor = ProcessPoolExecutor(max_workers=args.jobs)
+	maxChunksInFlight = max(args.jobs, 1) * 2
+	inFlight = deque()
+	files = iter(files)
+
+	try:
+		while True:
+			chunk = list(itertools.islice(files, VALIDATION_CHUNK_SIZE))
+
+			if not chunk:
+				break
+
+			with instrumentation.phase(instrumentation.PHASE_CACHE):
+				cachedResults, identities, uncachedPaths = lookupCachedResults(cache, [filePath for filePath, _ in chunk])
+			inFlight.append((chunk, cachedResults, identities, uncachedPaths, submitChunk(executor, uncachedPaths)))
+
+			while inFlight and (len(inFlight) >= maxChunksInFlight or inFlight[0][-1].done()):
+				yield from finishChunk(cache, *inFlight.popleft())
+
+		while inFlight:
+			yield from finishChunk(cache, *inFlight.popleft())
+	finally:
+		if executor:
+			executor.shutdown(cancel_futures=True)
+
+def discoverFiles(args, paths:list):
+	# Yields (real path, display path) for each media file as it is found.
+	seenPaths = set()
 
 	for inputPath in paths:
 		print("Checking:", inputPath)
@@ -69,46 +206,96 @@ def main():
 		if not os.path.isdir(inputPath):
 			continue
 
-		for root, dirs, files in os.walk(inputPath):
-			for file in files:
-				if not os.path.splitext(file)[1] in validation.ALL_MEDIA_FORMATS:
-					continue
+		for filePath in crawler.crawlFiles(inputPath, True, isMediaFile, threads=args.scan_threads):
+			fileAbsPath = os.path.realpath(filePath)
 
-				fileAbsPath = os.path.realpath(os.path.join(root, file))
-				filesToProcess[fileAbsPath] = os.path.relpath(fileAbsPath, inputPath)
+			if fileAbsPath in seenPaths:
+				continue
 
-	print(f"Found {len(filesToProcess)} files to validate")
+			seenPaths.add(fileAbsPath)
+			yield (fileAbsPath, fileAbsPath if args.absolute_paths else os.path.relpath(fileAbsPath, inputPath))
 
-	if not filesToProcess:
-		sys.exit(0)
+def isMediaFile(fileName:str) -> bool:
+	return os.path.splitext(fileName)[1] in validation.ALL_MEDIA_FORMATS
+
+def printProgress(count:int, finished:bool=False):
+	print(f"\rValidated {count} files", end="\n" if finished else "", file=sys.stderr, flush=True)
+
+def addResult(results:dict, key:str, value:str):
+	if key not in results:
+		results[key] = [value]
+	else:
+		results[key].append(value)
+
+def writeResult(writer:jsonl_output.JSONLWriter, errorCounts:dict, filePath:str, validationErrors:list):
+	# Only the number of files with each error is kept, so that memory use does not grow with the number of files.
+	with instrumentation.phase(instrumentation.PHASE_OUTPUT):
+		writer.write(jsonl_output.EVENT_RESULT, {"path": filePath, "errors": validationErrors})
+
+	for error in validationErrors:
+		errorCounts[error] = errorCounts.get(error, 0) + 1
+
+def run(args, writer:jsonl_output.JSONLWriter):
+	configFile = loadConfig()
+	paths = utils.convertRelativePathsToAbsolute(configFile.getBaseDirPath(), args.dirs) if args.dirs else [configFile.getDJDirPath()]
 
 	results = {}
+	errorCounts = {}
+	cache = openValidationCache(args, configFile)
+	files = instrumentation.timeIterator(instrumentation.PHASE_DISCOVERY, discoverFiles(args, paths))
+	count = 0
+
+	try:
+		for count, (filePath, validationErrors) in enumerate(validateAllFiles(args, cache, files), 1):
+			if writer:
+				writeResult(writer, errorCounts, filePath, validationErrors)
+			else:
+				for error in validationErrors:
+					addResult(results, error, filePath)
 
-	for fileKey in filesToProcess:
-		filePath = fileKey if args.absolute_paths else filesToProcess[fileKey]
-		validationErrors = validation.validateFile(fileKey)
+			if count % VALIDATION_CHUNK_SIZE == 0:
+				printProgress(count)
+	finally:
+		printProgress(count, True)
 
-		for error in validationErrors:
-			addResult(results, error, filePath)
+		if cache:
+			cache.close()
+			print(f"Validation cache: {cache.getHits()} hits, {cache.getMisses()} misses")
+
+	if writer:
+		writer.write(jsonl_output.EVENT_SUMMARY, {"files": count, "errors": errorCounts})
+		sys.exit(1 if errorCounts else 0)
+
+	if count == 0:
+		sys.exit(0)
 
 	if not results:
 		print("All files validated")
 		sys.exit(0)
 
-	print("Results:")
+	with instrumentation.phase(instrumentation.PHASE_OUTPUT):
+		print("Results:")
 
-	for key in results:
-		values = results[key]
-		print(f"  {key}: {len(values)} files")
+		for key in results:
+			values = results[key]
+			print(f"  {key}: {len(values)} files")
 
-		if args.list_files:
-			for value in values:
-				print(f"    {value}")
-			print()
+			if args.list_files:
+				for value in values:
+					print(f"    {value}")
+				print()
 
 	sys.exit(1)
 
-if __name__ != "__main__":
-	raise RuntimeError("Expected file to be run as a script")
+def main():
+	args = parseArgs()
 
-main()
+	with instrumentation.instrument(args), jsonl_output.openOutput(args.format) as writer:
+		run(args, writer)
+
+# Worker processes may import this file as "__mp_main__"
+# when they are spawned, in which case main() must not run.
+if __name__ == "__main__":
+	main()
+elif __name__ != "__mp_main__":
+	raise RuntimeError("Expected file to be run as a script")
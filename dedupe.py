@@ -0,0 +1,159 @@
+import argparse
+import os
+import sys
+from lib import config, validation, utils, crawler, audio_hash
+
+SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
+PROGRESS_INTERVAL = 64
+
+def parseArgs():
+	parser = argparse.ArgumentParser(
+		"dedupe",
+		description="Searches for tracks whose audio is duplicated across the Personal, DJ and Draft directories. "
+		"Only the audio data in each file is compared, so files which differ only in their tags are reported as "
+		"duplicates."
+	)
+
+	parser.add_argument(
+		"dirs",
+		nargs="*",
+		help="One or more directories to scan recursively. Relative paths are treated as being relative to the "
+		"directory which holds the library config file. If no paths are specified, the configured Personal, DJ and "
+		"Draft directories are used."
+	)
+
+	parser.add_argument(
+		"--include-mirrors",
+		action="store_true",
+		help="If set, reports files in the DJ directory which are simply the copy made by makedj of a single file in "
+		"the Personal or Draft directory. By default, these are not reported as duplicates."
+	)
+
+	parser.add_argument(
+		"--rebuild-cache",
+		action="store_true",
+		help="If set, all cached hashes are discarded, and every file is hashed again."
+	)
+
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Number of files to hash concurrently. Defaults to the number of CPUs (%(default)s)."
+	)
+
+	parser.add_argument(
+		"--scan-threads",
+		type=int,
+		default=1,
+		help="Number of threads to list directories on. Values above 1 help on high-latency network mounts, but "
+		"files are then hashed in a non-deterministic order. Defaults to 1."
+	)
+
+	return parser.parse_args()
+
+def loadConfig():
+	return config.Config(config.getConfigFilePath(SCRIPT_DIR))
+
+def discoverFiles(args, paths:list):
+	# Yields the real path of each media file as it is found, in the same way as makedj finds them.
+	seenPaths = set()
+
+	for inputPath in paths:
+		print("Checking:", inputPath)
+
+		if not os.path.isdir(inputPath):
+			continue
+
+		for filePath in crawler.crawlFiles(inputPath, True, validation.fileTypeIsSupported, True, args.scan_threads):
+			fileAbsPath = os.path.realpath(filePath)
+
+			if fileAbsPath in seenPaths:
+				continue
+
+			seenPaths.add(fileAbsPath)
+			yield fileAbsPath
+
+def getMirrorPath(configFile:config.Config, path:str):
+	# Returns the path that makedj would copy the file to with its default input and output roots,
+	# or None if the file is not in the Personal or Draft directory.
+	if utils.fileIsDraft(configFile, path):
+		return os.path.join(configFile.getDJDirPath(), "_Draft", os.path.splitext(os.path.basename(path))[0] + ".mp3")
+
+	if utils.isChildPath(configFile.getPersonalDirPath(), path):
+		return os.path.join(configFile.getDJDirPath(), os.path.relpath(path, configFile.getPersonalDirPath()))
+
+	return None
+
+def isDuplicateGroup(args, configFile:config.Config, paths:list) -> bool:
+	if args.include_mirrors:
+		return len(paths) > 1
+
+	# A track in Personal and its copy in DJ are expected to have the same audio, so a DJ file
+	# only counts towards the group if it is not the copy of another file in the group.
+	mirrorPaths = set()
+
+	for path in paths:
+		mirrorPath = getMirrorPath(configFile, path)
+
+		if mirrorPath:
+			mirrorPaths.add(os.path.realpath(mirrorPath))
+
+	return len([path for path in paths if path not in mirrorPaths]) > 1
+
+def printProgress(count:int, finished:bool=False):
+	print(f"\rHashed {count} files", end="\n" if finished else "", file=sys.stderr, flush=True)
+
+def main():
+	args = parseArgs()
+
+	configFile = loadConfig()
+
+	if args.dirs:
+		paths = utils.convertRelativePathsToAbsolute(configFile.getBaseDirPath(), args.dirs)
+	else:
+		paths = [configFile.getPersonalDirPath(), configFile.getDJDirPath(), configFile.getDraftDirPath()]
+
+	pathsByHash = {}
+	count = 0
+
+	with audio_hash.openIndex(configFile, args.jobs) as hashIndex:
+		if args.rebuild_cache:
+			hashIndex.clear()
+
+		try:
+			for count, (filePath, audioHash) in enumerate(hashIndex.hashFiles(discoverFiles(args, paths)), 1):
+				if audioHash is None:
+					print(f"Could not read {filePath}", file=sys.stderr)
+				elif audioHash in pathsByHash:
+					pathsByHash[audioHash].append(filePath)
+				else:
+					pathsByHash[audioHash] = [filePath]
+
+				if count % PROGRESS_INTERVAL == 0:
+					printProgress(count)
+		finally:
+			printProgress(count, True)
+			print(f"Hash cache: {hashIndex.getHits()} hits, {hashIndex.getMisses()} misses")
+
+	groups = [paths for paths in pathsByHash.values() if isDuplicateGroup(args, configFile, paths)]
+
+	if not groups:
+		print("No duplicates found")
+		sys.exit(0)
+
+	print(f"Duplicates: {len(groups)} groups, {sum(len(paths) for paths in groups)} files")
+
+	for paths in groups:
+		print()
+
+		for path in paths:
+			print(f"  {path}")
+
+	sys.exit(1)
+
+if __name__ != "__main__":
+	raise RuntimeError("Expected file to be run as a script")
+
+main()
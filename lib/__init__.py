@@ -1,13 +1,65 @@
+import os
+import sys
+
+def __versionTuple(version:str) -> tuple:
+	parts = []
+
+	for part in version.split("."):
+		digits = ""
+
+		for char in part:
+			if not char.isdigit():
+				break
+
+			digits += char
+
+		if not digits:
+			break
+
+		parts.append(int(digits))
+
+		if len(digits) < len(part):
+			break
+
+	return tuple(parts)
+
+def __findInstalledVersion(pkg:str):
+	# Much cheaper than importlib.metadata or pkg_resources, which both import a
+	# lot of machinery and may scan every installed distribution. The installed
+	# version is read straight from the name of the package's metadata directory.
+	prefix = pkg.lower().replace("-", "_") + "-"
+
+	for path in sys.path:
+		try:
+			entries = os.listdir(path or ".")
+		except OSError:
+			continue
+
+		for entry in entries:
+			name = entry.lower()
+
+			if name.startswith(prefix) and (name.endswith(".dist-info") or name.endswith(".egg-info")):
+				return entry[len(prefix):].rsplit(".", 1)[0]
+
+	return None
+
 def __ensureInstalled(pkg:str, minVersion:str):
-	from pkg_resources import WorkingSet , DistributionNotFound
+	from importlib.util import find_spec
+
+	version = __findInstalledVersion(pkg)
+
+	if version is not None:
+		found = __versionTuple(version) >= __versionTuple(minVersion)
+	else:
+		# No metadata (eg. a package installed by the system package manager),
+		# so the best we can do is check that the module exists at all.
+		found = find_spec(pkg) is not None
 
-	try:
-		WorkingSet().require(pkg)
-	except DistributionNotFound:
+	if not found:
 		print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
 		print(f"Dependency {pkg} {minVersion} was not found - run `python3 -m pip install {pkg}`")
 		print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
 		print()
-		raise
+		raise ImportError(f"Dependency {pkg} {minVersion} was not found" + (f" (found {version})" if version else ""))
 
 __ensureInstalled("mutagen", "1.47.0")
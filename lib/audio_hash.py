@@ -0,0 +1,362 @@
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import config, instrumentation
+from .file_cache import FileCache, FileIdentity
+
+# Bump this whenever the way that hashes are computed changes,
+# so that any cached hashes are discarded.
+AUDIO_HASH_VERSION = 1
+
+AUDIO_HASH_CACHE_FILE_NAME = "audio_hash_cache.sqlite3"
+AUDIO_HASH_TABLE = "audio_hashes"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+ID3V1_SIZE = 128
+APE_FOOTER_SIZE = 32
+ASF_HEADER_GUID = bytes.fromhex("3026b2758e66cf11a6d900aa0062ce6c")
+
+# Number of header packets at the start of an Ogg stream, keyed on the start of the first packet.
+# The second Vorbis packet and the second Opus packet hold the comments.
+OGG_HEADER_PACKET_COUNTS = {
+	b"\x01vorbis": 3,
+	b"OpusHead": 2,
+}
+
+def __readAt(inFile, offset:int, size:int) -> bytes:
+	inFile.seek(offset)
+	return inFile.read(size)
+
+def __skipID3v2Tags(inFile, offset:int) -> int:
+	# A file may (incorrectly, but not unusually) have more than one ID3v2 tag at the start.
+	while True:
+		header = __readAt(inFile, offset, 10)
+
+		if len(header) < 10 or header[:3] != b"ID3":
+			return offset
+
+		# The tag size is a 28 bit "syncsafe" integer, and excludes the header and any footer.
+		size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+		hasFooter = bool(header[5] & 0x10)
+		offset += 10 + size + (10 if hasFooter else 0)
+
+def __skipTrailingTags(inFile, start:int, end:int) -> int:
+	# ID3v1 tags are the last 128 bytes of the file. APEv2 tags may come either
+	# before or after them, depending on which tagger wrote them last.
+	while True:
+		previousEnd = end
+
+		if end - start >= ID3V1_SIZE and __readAt(inFile, end - ID3V1_SIZE, 3) == b"TAG":
+			end -= ID3V1_SIZE
+
+		if end - start >= APE_FOOTER_SIZE:
+			footer = __readAt(inFile, end - APE_FOOTER_SIZE, APE_FOOTER_SIZE)
+
+			if footer[:8] == b"APETAGEX":
+				# The size includes the footer but not the header, if the tag has one.
+				size = int.from_bytes(footer[12:16], "little")
+				hasHeader = bool(int.from_bytes(footer[20:24], "little") & 0x80000000)
+				end = max(end - size - (APE_FOOTER_SIZE if hasHeader else 0), start)
+
+		if end == previousEnd:
+			return end
+
+def __findMP3Payload(inFile, fileSize:int) -> list:
+	start = __skipID3v2Tags(inFile, 0)
+	return [(start, __skipTrailingTags(inFile, start, fileSize))]
+
+def __findFLACPayload(inFile, fileSize:int) -> list:
+	offset = __skipID3v2Tags(inFile, 0)
+
+	if __readAt(inFile, offset, 4) != b"fLaC":
+		return None
+
+	offset += 4
+
+	# Skip the metadata blocks, which hold the Vorbis comments and any pictures.
+	while True:
+		header = __readAt(inFile, offset, 4)
+
+		if len(header) < 4:
+			return None
+
+		offset += 4 + int.from_bytes(header[1:4], "big")
+
+		if header[0] & 0x80:
+			break
+
+	return [(offset, __skipTrailingTags(inFile, offset, fileSize))]
+
+def __findChunks(inFile, offset:int, end:int, byteOrder:str, chunkIds:set) -> list:
+	# Returns the ranges of the contents of the matching RIFF or IFF chunks.
+	ranges = []
+
+	while offset + 8 <= end:
+		header = __readAt(inFile, offset, 8)
+		size = int.from_bytes(header[4:8], byteOrder)
+
+		if header[:4] in chunkIds:
+			ranges.append((offset + 8, min(offset + 8 + size, end)))
+
+		# Chunks are padded to an even number of bytes.
+		offset += 8 + size + (size & 1)
+
+	return ranges
+
+def __findWAVPayload(inFile, fileSize:int) -> list:
+	header = __readAt(inFile, 0, 12)
+
+	if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+		return None
+
+	# Tags live in LIST and id3 chunks, so only the sample data is hashed.
+	return __findChunks(inFile, 12, fileSize, "little", set([b"data"]))
+
+def __findAIFFPayload(inFile, fileSize:int) -> list:
+	header = __readAt(inFile, 0, 12)
+
+	if header[:4] != b"FORM" or header[8:12] not in (b"AIFF", b"AIFC"):
+		return None
+
+	return __findChunks(inFile, 12, fileSize, "big", set([b"SSND"]))
+
+def __findMP4Payload(inFile, fileSize:int) -> list:
+	# Tags live in the moov atom, so only the contents of the mdat atoms are hashed.
+	ranges = []
+	offset = 0
+
+	while offset + 8 <= fileSize:
+		header = __readAt(inFile, offset, 16)
+		size = int.from_bytes(header[:4], "big")
+		headerSize = 8
+
+		if size == 1:
+			size = int.from_bytes(header[8:16], "big")
+			headerSize = 16
+		elif size == 0:
+			size = fileSize - offset
+
+		if size < headerSize:
+			return None
+
+		if header[4:8] == b"mdat":
+			ranges.append((offset + headerSize, min(offset + size, fileSize)))
+
+		offset += size
+
+	return ranges
+
+def __findWMAPayload(inFile, fileSize:int) -> list:
+	# The tags are held in the ASF header object, which is always the first object in the file.
+	header = __readAt(inFile, 0, 24)
+
+	if header[:16] != ASF_HEADER_GUID:
+		return None
+
+	return [(int.from_bytes(header[16:24], "little"), fileSize)]
+
+PAYLOAD_FINDERS = {
+	".mp3": __findMP3Payload,
+	".flac": __findFLACPayload,
+	".wav": __findWAVPayload,
+	".aiff": __findAIFFPayload,
+	".m4a": __findMP4Payload,
+	".alac": __findMP4Payload,
+	".wma": __findWMAPayload,
+}
+
+def __hashRange(inFile, hasher, start:int, end:int):
+	inFile.seek(start)
+	remaining = end - start
+
+	while remaining > 0:
+		chunk = inFile.read(min(remaining, HASH_CHUNK_SIZE))
+
+		if not chunk:
+			break
+
+		hasher.update(chunk)
+		remaining -= len(chunk)
+
+def __hashOggPackets(inFile, hasher) -> bool:
+	# Comments in Ogg files are held in a header packet, and changing them may move
+	# packets between pages, which changes the page headers. The audio packets are
+	# therefore hashed without any of the page framing. Returns False if the stream
+	# is not one that we know the headers of.
+	headerPacketCount = None
+	serial = None
+	packetIndex = 0
+
+	inFile.seek(0)
+
+	while True:
+		header = inFile.read(27)
+
+		if len(header) < 27:
+			return headerPacketCount is not None
+
+		if header[:4] != b"OggS":
+			return False
+
+		segmentSizes = inFile.read(header[26])
+		body = inFile.read(sum(segmentSizes))
+		pageSerial = header[14:18]
+
+		if serial is None:
+			serial = pageSerial
+			headerPacketCount = next((count for prefix, count in OGG_HEADER_PACKET_COUNTS.items() if body.startswith(prefix)), None)
+
+			if headerPacketCount is None:
+				return False
+
+		if pageSerial != serial:
+			# Some other logical stream multiplexed alongside the audio.
+			hasher.update(body)
+			continue
+
+		offset = 0
+
+		for segmentSize in segmentSizes:
+			if packetIndex >= headerPacketCount:
+				hasher.update(body[offset:offset + segmentSize])
+
+			offset += segmentSize
+
+			# A segment of less than 255 bytes ends a packet.
+			if segmentSize < 255:
+				packetIndex += 1
+
+def hashAudioPayload(filePath:str) -> str:
+	"""
+	Returns a hex digest of the audio data in a file. Tag blocks such as ID3,
+	APE, Vorbis comments, RIFF INFO and MP4 metadata are excluded where the
+	format is recognised, so retagging a file does not change its hash. Files
+	which are not recognised are hashed in their entirety.
+	"""
+
+	hasher = hashlib.sha256()
+	extension = os.path.splitext(filePath)[1].lower()
+
+	with open(filePath, "rb") as inFile:
+		if extension in (".ogg", ".opus") and __hashOggPackets(inFile, hasher):
+			return hasher.hexdigest()
+
+		hasher = hashlib.sha256()
+		fileSize = os.fstat(inFile.fileno()).st_size
+		finder = PAYLOAD_FINDERS.get(extension)
+		ranges = finder(inFile, fileSize) if finder else None
+
+		if not ranges or all(start >= end for start, end in ranges):
+			ranges = [(0, fileSize)]
+
+		for start, end in ranges:
+			__hashRange(inFile, hasher, start, end)
+
+	return hasher.hexdigest()
+
+class AudioHashIndex:
+	"""
+	Hashes the audio of files on a pool of threads, and caches the hashes on
+	disk keyed on the identity of each file. The cache doubles as an index
+	from hashes to the files that have been hashed so far. The cache may
+	only be used from the thread that created the index, so hashes computed
+	by the pool are recorded when their results are collected via finish().
+	"""
+
+	def __init__(self, dbPath:str, threads:int=1):
+		self.__cache = FileCache(dbPath, AUDIO_HASH_TABLE, AUDIO_HASH_VERSION, indexValues=True)
+		self.__executor = ThreadPoolExecutor(max_workers=max(threads, 1))
+		self.__threads = max(threads, 1)
+		self.__pendingIdentities = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def getHits(self) -> int:
+		return self.__cache.getHits()
+
+	def getMisses(self) -> int:
+		return self.__cache.getMisses()
+
+	def clear(self) -> None:
+		self.__cache.clear()
+
+	def submit(self, filePath:str) -> Future:
+		# The result of the future is the hash, or None if the file could not be read.
+		# The identity is taken before hashing, so that any modification made while
+		# hashing means that the hash is not used again.
+		try:
+			identity = FileIdentity.fromPath(filePath)
+		except OSError:
+			identity = None
+
+		if identity:
+			audioHash = self.__cache.get(filePath, identity)
+
+			if audioHash is not None:
+				future = Future()
+				future.set_result(audioHash)
+				return future
+
+			self.__pendingIdentities[filePath] = identity
+
+		return self.__executor.submit(AudioHashIndex.__hashFile, filePath)
+
+	def finish(self, filePath:str, future:Future):
+		# Waits for a future returned by submit(), records the hash, and returns it.
+		audioHash = future.result()
+		identity = self.__pendingIdentities.pop(filePath, None)
+
+		if identity and audioHash is not None:
+			self.__cache.put(filePath, identity, audioHash)
+
+		return audioHash
+
+	def hashFiles(self, filePaths):
+		# Yields (file path, hash) in the same order as the file paths are provided.
+		inFlight = deque()
+		maxInFlight = self.__threads * 4
+
+		for filePath in filePaths:
+			inFlight.append((filePath, self.submit(filePath)))
+
+			while inFlight and (len(inFlight) >= maxInFlight or inFlight[0][1].done()):
+				filePath, future = inFlight.popleft()
+				yield (filePath, self.finish(filePath, future))
+
+		while inFlight:
+			filePath, future = inFlight.popleft()
+			yield (filePath, self.finish(filePath, future))
+
+	def __hashFile(filePath:str):
+		try:
+			with instrumentation.phase(instrumentation.PHASE_HASHING, instrumentation.getFileType(filePath)):
+				return hashAudioPayload(filePath)
+		except OSError:
+			return None
+
+	def findPaths(self, audioHash:str) -> list:
+		# Returns the paths of files which were last hashed to the given hash,
+		# and which have not changed since.
+		paths = []
+
+		for filePath, identity in self.__cache.findPaths(audioHash):
+			try:
+				if FileIdentity.fromPath(filePath) == identity:
+					paths.append(filePath)
+			except OSError:
+				pass
+
+		return paths
+
+	def close(self) -> None:
+		self.__executor.shutdown(cancel_futures=True)
+		self.__cache.close()
+
+def openIndex(configFile:config.Config, threads:int=1) -> AudioHashIndex:
+	return AudioHashIndex(os.path.join(configFile.getBaseDirPath(), AUDIO_HASH_CACHE_FILE_NAME), threads)
@@ -1,6 +1,14 @@
 import json
 import os
 
+# If set, the config file at this path is used instead of the one alongside the scripts.
+# This allows the scripts to be run against a different library, eg. by the benchmarks.
+CONFIG_PATH_ENV_VAR = "MUSICMGR_CONFIG"
+
+def getConfigFilePath(scriptDir:str) -> str:
+	path = os.environ.get(CONFIG_PATH_ENV_VAR)
+	return path if path else os.path.join(scriptDir, "config.json")
+
 class Config:
 	def __init__(self, configFilePath:str) -> None:
 		self.__baseDirPath:str = os.path.dirname(configFilePath)
@@ -9,6 +17,7 @@ class Config:
 		self.__draftDir:str = ""
 		self.__ffmpeg = None
 		self.__ytdlp = None
+		self.__transcodeCache = None
 
 		self.__loadJSON(configFilePath)
 
@@ -39,6 +48,9 @@ class Config:
 	def getYTDLPOverridePath(self):
 		return self.__ytdlp
 
+	def getTranscodeCacheDirPath(self):
+		return self.__makePath(self.__transcodeCache) if self.__transcodeCache else None
+
 	def __makePath(self, path:str):
 		return path if os.path.isabs(path) else os.path.join(self.getBaseDirPath(), path)
 
@@ -51,6 +63,7 @@ class Config:
 			self.__draftDir = self.__tryRead(contents, "draft", str)
 			self.__ffmpeg = self.__tryRead(contents, "ffmpeg", str, optional=True)
 			self.__ytdlp = self.__tryRead(contents, "yt-dlp", str, optional=True)
+			self.__transcodeCache = self.__tryRead(contents, "transcode-cache", str, optional=True)
 
 	def __tryRead(self, jsonObj:dict, prop:str, valueType:type, optional:bool=False):
 		if prop not in jsonObj:
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+EXCLUDE_FILE_NAME = ".exclude"
+
+def readExcludedFiles(dirPath:str) -> set:
+	try:
+		with open(os.path.join(dirPath, EXCLUDE_FILE_NAME), "r") as inFile:
+			return set(line.strip() for line in inFile.readlines())
+	except Exception:
+		return set()
+
+def scanDirectory(dirPath:str, fileFilter=None, useExcludeFiles:bool=False):
+	# Returns a tuple of (file paths, subdirectory paths) for the immediate contents of the directory.
+	# The type information from each DirEntry is used, so that no extra stat calls are required
+	# on platforms which report it (any symlinks still have to be followed).
+	files = []
+	subdirs = []
+
+	try:
+		with os.scandir(dirPath) as entries:
+			entries = sorted(entries, key=lambda entry: entry.name)
+	except OSError:
+		# Match os.walk(), which skips directories it cannot list.
+		return (files, subdirs)
+
+	excludedFiles = readExcludedFiles(dirPath) if useExcludeFiles else set()
+
+	for entry in entries:
+		try:
+			if entry.is_dir(follow_symlinks=False):
+				subdirs.append(entry.path)
+			elif entry.is_file() and entry.name not in excludedFiles and (fileFilter is None or fileFilter(entry.name)):
+				files.append(entry.path)
+		except OSError:
+			continue
+
+	return (files, subdirs)
+
+def __crawlSerially(root:str, recursive:bool, fileFilter, useExcludeFiles:bool):
+	# Depth first, yielding the files in a directory before descending into
+	# its subdirectories, which is the same order that os.walk() visits them in.
+	stack = [root]
+
+	while stack:
+		files, subdirs = scanDirectory(stack.pop(), fileFilter, useExcludeFiles)
+		yield from files
+
+		if recursive:
+			stack.extend(reversed(subdirs))
+
+def __crawlConcurrently(root:str, fileFilter, useExcludeFiles:bool, threads:int):
+	# Directories are listed concurrently, and files are yielded as soon as each listing completes.
+	# This hides the latency of listing directories on network mounts, but the order in which
+	# files are yielded is not deterministic.
+	executor = ThreadPoolExecutor(max_workers=threads)
+
+	try:
+		pending = {executor.submit(scanDirectory, root, fileFilter, useExcludeFiles)}
+
+		while pending:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+			for future in done:
+				files, subdirs = future.result()
+
+				for subdir in subdirs:
+					pending.add(executor.submit(scanDirectory, subdir, fileFilter, useExcludeFiles))
+
+				yield from files
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
+
+def crawlFiles(path:str, recursive:bool=True, fileFilter=None, useExcludeFiles:bool=False, threads:int=1):
+	"""
+	Generator which yields the paths of files found under the given directory.
+	fileFilter is called with the name of each file, and the file is only
+	yielded if it returns True. If useExcludeFiles is set, files listed in an
+	.exclude file within a directory are not yielded. If more than one thread
+	is requested, subdirectories are crawled concurrently.
+	"""
+
+	if os.path.isfile(path):
+		yield path
+		return
+
+	if not os.path.isdir(path):
+		return
+
+	if recursive and threads > 1:
+		yield from __crawlConcurrently(path, fileFilter, useExcludeFiles, threads)
+	else:
+		yield from __crawlSerially(path, recursive, fileFilter, useExcludeFiles)
@@ -1,22 +1,132 @@
+import hashlib
 import subprocess
+import threading
+import time
 from . import config
 
-def runFFMPEG(configFile:config.Config, args:list):
+# Digests of the -version output of each ffmpeg executable that has been run.
+VERSION_DIGESTS = {}
+VERSION_DIGESTS_LOCK = threading.Lock()
+
+class Progress:
+	"""
+	The progress of one ffmpeg job, updated from the key=value lines
+	which ffmpeg writes with -progress each time it reports.
+	"""
+
+	def __init__(self):
+		self.__startTime = time.perf_counter()
+		self.__elapsed = 0.0
+		self.__outTime = 0.0
+		self.__totalSize = 0
+		self.__speed = None
+		self.__finished = False
+
+	def getElapsed(self) -> float:
+		# Wall time since the job was started, in seconds.
+		return self.__elapsed
+
+	def getOutTime(self) -> float:
+		# Duration of the audio written so far, in seconds.
+		return self.__outTime
+
+	def getTotalSize(self) -> int:
+		# Bytes written to the output so far.
+		return self.__totalSize
+
+	def getSpeed(self):
+		# Seconds of audio written per second of wall time, as reported by ffmpeg, or None if not known yet.
+		return self.__speed
+
+	def getFinished(self) -> bool:
+		return self.__finished
+
+	def update(self, key:str, value:str) -> bool:
+		# Returns True once a whole report has been read. Values are "N/A" until they are known.
+		value = value.strip()
+
+		try:
+			if key == "out_time_us":
+				self.__outTime = int(value) / 1000000
+			elif key == "total_size":
+				self.__totalSize = int(value)
+			elif key == "speed":
+				self.__speed = float(value.rstrip("x"))
+		except ValueError:
+			pass
+
+		if key != "progress":
+			return False
+
+		self.__elapsed = time.perf_counter() - self.__startTime
+		self.__finished = value == "end"
+		return True
+
+def runFFMPEG(configFile:config.Config, args:list, quiet:bool=False, onProgress=None):
+	# If onProgress is given, it is called with a Progress each time ffmpeg reports on the job, on the calling thread.
+	if quiet:
+		# Only report errors, so that output from concurrent jobs is readable.
+		args = ["-hide_banner", "-loglevel", "error", "-nostats"] + args
+
+	args = [getExecutable(configFile)] + args
+
+	if onProgress is None:
+		return subprocess.run(args, shell=False)
+
+	# Nothing else is written to stdout, as the output always goes to a file.
+	args = args[:1] + ["-progress", "pipe:1"] + args[1:]
+	progress = Progress()
+
+	with subprocess.Popen(args, shell=False, stdout=subprocess.PIPE, text=True) as process:
+		try:
+			for line in process.stdout:
+				key, _, value = line.partition("=")
+
+				if progress.update(key, value):
+					onProgress(progress)
+		except BaseException:
+			process.kill()
+			raise
+
+	return subprocess.CompletedProcess(args, process.returncode)
+
+def getExecutable(configFile:config.Config) -> str:
 	ffmpeg = configFile.getFFMPEGOverridePath()
-	args = [ffmpeg if ffmpeg else "ffmpeg"] + args
-	return subprocess.run(args, shell=False)
+	return ffmpeg if ffmpeg else "ffmpeg"
+
+def getVersionDigest(configFile:config.Config) -> str:
+	# The whole of the output is used, as it includes the versions of the libraries
+	# and the build configuration, all of which may affect the output of a transcode.
+	executable = getExecutable(configFile)
 
-def toMP3(configFile:config.Config, inputFile:str, outputFile:str, quality:int=320):
+	with VERSION_DIGESTS_LOCK:
+		if executable not in VERSION_DIGESTS:
+			result = subprocess.run([executable, "-version"], shell=False, capture_output=True, check=True)
+			VERSION_DIGESTS[executable] = hashlib.sha256(result.stdout).hexdigest()
+
+		return VERSION_DIGESTS[executable]
+
+def metadataArgs(metadata:dict) -> list:
+	# Metadata set this way overrides anything of the same name mapped from the input.
+	args = []
+
+	for key, value in (metadata or {}).items():
+		args += ["-metadata", f"{key}={value}"]
+
+	return args
+
+def toMP3(configFile:config.Config, inputFile:str, outputFile:str, quality:int=320, quiet:bool=False, metadata:dict=None, onProgress=None):
 	return runFFMPEG(configFile, [
 		"-i", inputFile,
 		"-ab", f"{quality}k",
-		"-map_metadata", "0",
+		"-map_metadata", "0"
+	] + metadataArgs(metadata) + [
 		"-id3v2_version", "3",
 		outputFile,
 		"-nostdin"
-	])
+	], quiet, onProgress)
 
-def toFLAC(configFile:config.Config, inputFile:str, outputFile:str):
+def toFLAC(configFile:config.Config, inputFile:str, outputFile:str, quiet:bool=False, onProgress=None):
 	return runFFMPEG(configFile, [
 		"-i", inputFile,
 		"-c:a", "flac",
@@ -24,4 +134,4 @@ def toFLAC(configFile:config.Config, inputFile:str, outputFile:str):
 		"-id3v2_version", "3",
 		outputFile,
 		"-nostdin"
-	])
+	], quiet, onProgress)
@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+
+# Number of pending writes after which the cache is committed to disk.
+COMMIT_INTERVAL = 500
+
+class FileIdentity:
+	def __init__(self, size:int, mtimeNs:int, inode:int):
+		self.__size = size
+		self.__mtimeNs = mtimeNs
+		self.__inode = inode
+
+	@staticmethod
+	def fromStat(statResult:os.stat_result):
+		return FileIdentity(statResult.st_size, statResult.st_mtime_ns, statResult.st_ino)
+
+	@staticmethod
+	def fromPath(path:str):
+		return FileIdentity.fromStat(os.stat(path))
+
+	def getSize(self) -> int:
+		return self.__size
+
+	def getMTimeNs(self) -> int:
+		return self.__mtimeNs
+
+	def getInode(self) -> int:
+		return self.__inode
+
+	def __eq__(self, other) -> bool:
+		return isinstance(other, FileIdentity) and \
+			self.__size == other.__size and \
+			self.__mtimeNs == other.__mtimeNs and \
+			self.__inode == other.__inode
+
+	def __hash__(self) -> int:
+		return hash((self.__size, self.__mtimeNs, self.__inode))
+
+class FileCache:
+	"""
+	On-disk SQLite cache which stores a JSON-serialisable value per file path.
+	An entry is only returned if the size, modification time and inode of
+	the file are the same as when the entry was stored. If the version
+	passed in does not match the version the table was created with,
+	all entries in the table are discarded. If indexValues is set, the
+	values are also indexed so that files can be looked up by value.
+	"""
+
+	def __init__(self, dbPath:str, table:str, version:int=1, indexValues:bool=False):
+		self.__table = table
+		self.__hits = 0
+		self.__misses = 0
+		self.__pendingWrites = 0
+
+		self.__db = sqlite3.connect(dbPath)
+		self.__db.execute("PRAGMA journal_mode=WAL")
+		self.__db.execute("PRAGMA synchronous=NORMAL")
+
+		self.__db.execute("CREATE TABLE IF NOT EXISTS cache_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+		self.__db.execute(
+			f"CREATE TABLE IF NOT EXISTS {table} ("
+			"path TEXT PRIMARY KEY, "
+			"size INTEGER NOT NULL, "
+			"mtime_ns INTEGER NOT NULL, "
+			"inode INTEGER NOT NULL, "
+			"value TEXT NOT NULL)"
+		)
+
+		if indexValues:
+			self.__db.execute(f"CREATE INDEX IF NOT EXISTS {table}_value ON {table} (value)")
+
+		row = self.__db.execute("SELECT version FROM cache_versions WHERE name = ?", (table,)).fetchone()
+
+		if row is None or row[0] != version:
+			self.clear()
+			self.__db.execute("INSERT OR REPLACE INTO cache_versions (name, version) VALUES (?, ?)", (table, version))
+
+		self.__db.commit()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def getHits(self) -> int:
+		return self.__hits
+
+	def getMisses(self) -> int:
+		return self.__misses
+
+	def get(self, path:str, identity:FileIdentity):
+		row = self.__db.execute(f"SELECT size, mtime_ns, inode, value FROM {self.__table} WHERE path = ?", (path,)).fetchone()
+
+		if row is None or FileIdentity(row[0], row[1], row[2]) != identity:
+			self.__misses += 1
+			return None
+
+		self.__hits += 1
+		return json.loads(row[3])
+
+	def put(self, path:str, identity:FileIdentity, value) -> None:
+		self.__db.execute(
+			f"INSERT OR REPLACE INTO {self.__table} (path, size, mtime_ns, inode, value) VALUES (?, ?, ?, ?, ?)",
+			(path, identity.getSize(), identity.getMTimeNs(), identity.getInode(), json.dumps(value))
+		)
+
+		self.__pendingWrites += 1
+
+		if self.__pendingWrites >= COMMIT_INTERVAL:
+			self.commit()
+
+	def findPaths(self, value) -> list:
+		# Returns (path, identity) for each file whose stored value is equal to the given value.
+		# The files may have changed since the values were stored, so callers should check the
+		# identities before relying on them.
+		rows = self.__db.execute(
+			f"SELECT path, size, mtime_ns, inode FROM {self.__table} WHERE value = ? ORDER BY path",
+			(json.dumps(value),)
+		).fetchall()
+
+		return [(row[0], FileIdentity(row[1], row[2], row[3])) for row in rows]
+
+	def remove(self, path:str) -> None:
+		self.__db.execute(f"DELETE FROM {self.__table} WHERE path = ?", (path,))
+		self.__pendingWrites += 1
+
+	def clear(self) -> None:
+		self.__db.execute(f"DELETE FROM {self.__table}")
+		self.__pendingWrites += 1
+
+	def commit(self) -> None:
+		self.__db.commit()
+		self.__pendingWrites = 0
+
+	def close(self) -> None:
+		self.commit()
+		self.__db.close()
@@ -0,0 +1,153 @@
+import errno
+import os
+import shutil
+
+LINK_MODE_AUTO = "auto"
+LINK_MODE_COPY = "copy"
+LINK_MODE_REFLINK = "reflink"
+LINK_MODE_HARDLINK = "hardlink"
+
+LINK_MODES = [
+	LINK_MODE_AUTO,
+	LINK_MODE_COPY,
+	LINK_MODE_REFLINK,
+	LINK_MODE_HARDLINK
+]
+
+# The method that was actually used to produce a destination file.
+METHOD_REFLINK = "reflink"
+METHOD_HARDLINK = "hardlink"
+METHOD_COPY_FILE_RANGE = "copy_file_range"
+METHOD_COPY = "copy"
+
+# ioctl request to share the extents of one file with another (Linux, on btrfs, XFS and similar).
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Errors which mean that a method is not supported for a pair of files,
+# rather than that something is wrong with the files themselves.
+UNSUPPORTED_ERRNOS = frozenset([
+	errno.EXDEV,
+	errno.EINVAL,
+	errno.ENOSYS,
+	errno.ENOTTY,
+	errno.EOPNOTSUPP,
+	errno.ENOTSUP,
+])
+
+def __unsupported(message:str) -> OSError:
+	return OSError(errno.EOPNOTSUPP, message)
+
+def __removePartialFile(path:str):
+	try:
+		os.unlink(path)
+	except FileNotFoundError:
+		pass
+
+def reflinkFile(sourcePath:str, destPath:str) -> None:
+	# Raises OSError if the file system (or platform) does not support reflinks.
+	try:
+		import fcntl
+	except ImportError:
+		raise __unsupported("Reflinks are not supported on this platform")
+
+	with open(sourcePath, "rb") as inFile, open(destPath, "wb") as outFile:
+		fcntl.ioctl(outFile.fileno(), FICLONE, inFile.fileno())
+
+def __copyRangeInKernel(inFile, outFile, offset:int, count:int) -> int:
+	# Returns the number of bytes copied, which may be less than requested
+	# if copy_file_range() turns out not to be supported part way through.
+	copied = 0
+
+	try:
+		while copied < count:
+			result = os.copy_file_range(inFile.fileno(), outFile.fileno(), count - copied, offset + copied)
+
+			if result == 0:
+				break
+
+			copied += result
+	except OSError as ex:
+		if ex.errno not in UNSUPPORTED_ERRNOS:
+			raise
+
+	return copied
+
+def __copyRangeInUserspace(inFile, outFile, offset:int, count:int) -> None:
+	inFile.seek(offset)
+
+	while count > 0:
+		chunk = inFile.read(min(count, COPY_CHUNK_SIZE))
+
+		if not chunk:
+			break
+
+		outFile.write(chunk)
+		count -= len(chunk)
+
+def spliceFile(destPath:str, sourcePath:str, prefix:bytes, start:int, end:int, suffix:bytes) -> str:
+	"""
+	Writes a destination file made up of the prefix, the bytes of the source
+	file between start and end, and the suffix. Where possible, the bytes from
+	the source are copied by the kernel without passing through this process.
+	Returns the method that was used to copy the bytes from the source.
+	"""
+
+	method = METHOD_COPY
+
+	try:
+		with open(sourcePath, "rb") as inFile, open(destPath, "wb") as outFile:
+			outFile.write(prefix)
+			count = max(end - start, 0)
+
+			if hasattr(os, "copy_file_range") and count > 0:
+				# copy_file_range() writes at the file descriptor's position, so anything
+				# buffered must be written out first.
+				outFile.flush()
+				copied = __copyRangeInKernel(inFile, outFile, start, count)
+
+				if copied > 0:
+					method = METHOD_COPY_FILE_RANGE
+
+				start += copied
+				count -= copied
+
+				# The file object's idea of its position is not updated by copy_file_range().
+				outFile.seek(0, os.SEEK_END)
+
+			__copyRangeInUserspace(inFile, outFile, start, count)
+			outFile.write(suffix)
+	except BaseException:
+		__removePartialFile(destPath)
+		raise
+
+	return method
+
+def copyFile(sourcePath:str, destPath:str, linkMode:str=LINK_MODE_AUTO) -> str:
+	"""
+	Produces the destination file from the source file using the given link mode, and
+	returns the method that was used. The reflink and hardlink modes raise OSError if
+	the files are on a file system (or are on different file systems) which do not
+	support them. The auto mode tries a reflink, and falls back to copying the data,
+	so it never shares the source file's inode with the destination.
+	"""
+
+	if linkMode == LINK_MODE_HARDLINK:
+		os.link(sourcePath, destPath)
+		return METHOD_HARDLINK
+
+	if linkMode in (LINK_MODE_REFLINK, LINK_MODE_AUTO):
+		try:
+			reflinkFile(sourcePath, destPath)
+			shutil.copymode(sourcePath, destPath)
+			return METHOD_REFLINK
+		except OSError as ex:
+			__removePartialFile(destPath)
+
+			if linkMode == LINK_MODE_REFLINK or ex.errno not in UNSUPPORTED_ERRNOS:
+				raise
+
+	method = spliceFile(destPath, sourcePath, b"", 0, os.path.getsize(sourcePath), b"")
+	shutil.copymode(sourcePath, destPath)
+	return method
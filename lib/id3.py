@@ -1,14 +1,65 @@
-import mutagen.id3 as id3
+# mutagen is imported on first use, so that importing this module is cheap.
+import os
 
 FRAME_TRACK_TITLE = "TIT2"
+ID3V1_SIZE = 128
 
-def dump_tag_string_dict(filePath:str) -> dict:
-	file = id3.ID3(filePath)
+def tag_string_dict(tags) -> dict:
+	import mutagen.id3 as id3
 
 	outDict = {}
 
-	for key in file:
-		value = file[key]
+	for key in tags:
+		value = tags[key]
 		outDict[key] = "<binary data>" if type(value) is id3.APIC else str(value)
 
 	return outDict
+
+def dump_tag_string_dict(filePath:str) -> dict:
+	import mutagen.id3 as id3
+
+	return tag_string_dict(id3.ID3(filePath))
+
+def loadTagsAndAudioRange(filePath:str) -> tuple:
+	"""
+	Returns a tuple of (tags, audio start, audio end, has ID3v1 tag) for an MP3,
+	where the audio range covers everything between the ID3v2 tag at the start
+	of the file and the ID3v1 tag at the end of the file. If the file has no
+	tags, an empty set of tags is returned.
+	"""
+
+	import mutagen.id3 as id3
+
+	fileSize = os.path.getsize(filePath)
+
+	with open(filePath, "rb") as inFile:
+		inFile.seek(max(fileSize - ID3V1_SIZE, 0))
+		hasV1 = fileSize >= ID3V1_SIZE and inFile.read(3) == b"TAG"
+
+	try:
+		tags = id3.ID3(filePath)
+	except id3.ID3NoHeaderError:
+		tags = id3.ID3()
+
+	# The size is that of the ID3v2 tag, so is 0 if the file only has an ID3v1 tag.
+	audioStart = tags.size
+	audioEnd = fileSize - ID3V1_SIZE if hasV1 else fileSize
+
+	return (tags, audioStart, audioEnd, hasV1)
+
+def renderTags(tags, includeV1:bool=False) -> tuple:
+	"""
+	Returns a tuple of (ID3v2 bytes, ID3v1 bytes) for the tags, as mutagen would write
+	them at the start and end of a file. The ID3v1 bytes are empty unless requested.
+	"""
+
+	import io
+
+	buffer = io.BytesIO()
+	tags.save(buffer, v1=2 if includeV1 else 0)
+	data = buffer.getvalue()
+
+	if includeV1:
+		return (data[:-ID3V1_SIZE], data[-ID3V1_SIZE:])
+
+	return (data, b"")
@@ -0,0 +1,240 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+
+# Phases of a run, which are timed separately with --timings.
+PHASE_DISCOVERY = "discovery"
+PHASE_HASHING = "hashing"
+PHASE_VALIDATION = "validation"
+PHASE_CACHE = "cache"
+PHASE_COPY = "copy"
+PHASE_TRANSCODE = "transcode"
+PHASE_FIXUP = "fixup"
+PHASE_DOWNLOAD = "download"
+PHASE_LOAD = "load"
+PHASE_CHECKS = "checks"
+PHASE_OUTPUT = "output"
+
+NO_FILE_TYPE = "(no extension)"
+TRACEMALLOC_TOP_COUNT = 10
+
+# Set while --timings is in effect.
+TIMINGS = None
+
+class PhaseTimings:
+	"""
+	Totals of the wall time, CPU time and number of times each phase was run, overall
+	and for each file type. The CPU time is that of the thread which ran the phase, so
+	phases which run on several threads at once can add up to more than the wall time
+	of the whole run. Phases may be nested, in which case the outer phase includes the
+	inner one. Safe to use from multiple threads.
+	"""
+
+	def __init__(self):
+		self.__lock = threading.Lock()
+
+		# (phase, file type or None) -> [wall time, CPU time, count]
+		self.__entries = {}
+
+	def add(self, phase:str, fileType:str, wallTime:float, cpuTime:float, count:int=1) -> None:
+		keys = [(phase, None)]
+
+		if fileType is not None:
+			keys.append((phase, fileType))
+
+		with self.__lock:
+			for key in keys:
+				entry = self.__entries.setdefault(key, [0.0, 0.0, 0])
+				entry[0] += wallTime
+				entry[1] += cpuTime
+				entry[2] += count
+
+	def merge(self, entries:dict) -> None:
+		# Adds entries returned by getEntries(), eg. from another process.
+		with self.__lock:
+			for key, (wallTime, cpuTime, count) in entries.items():
+				entry = self.__entries.setdefault(key, [0.0, 0.0, 0])
+				entry[0] += wallTime
+				entry[1] += cpuTime
+				entry[2] += count
+
+	def getEntries(self) -> dict:
+		with self.__lock:
+			return {key: tuple(entry) for key, entry in self.__entries.items()}
+
+	@contextlib.contextmanager
+	def phase(self, phase:str, fileType:str=None):
+		wallStart = time.perf_counter()
+		cpuStart = time.thread_time()
+
+		try:
+			yield
+		finally:
+			self.add(phase, fileType, time.perf_counter() - wallStart, time.thread_time() - cpuStart)
+
+def addArguments(parser) -> None:
+	parser.add_argument(
+		"--timings",
+		action="store_true",
+		help="If set, the wall and CPU time spent in each phase of the run (eg. discovery, validation, copying and "
+		"transcoding), overall and for each file type, is printed to stderr once the run has finished."
+	)
+
+	parser.add_argument(
+		"--profile",
+		metavar="PATH",
+		help="Profiles the run with cProfile, and writes the stats to the given file, eg. for viewing with pstats. "
+		"Work done in other processes (eg. by ffmpeg) is not included."
+	)
+
+	parser.add_argument(
+		"--tracemalloc",
+		action="store_true",
+		help="If set, memory allocations are traced, and the peak memory allocated by Python and the largest "
+		f"{TRACEMALLOC_TOP_COUNT} allocation sites are printed to stderr once the run has finished. This slows the "
+		"run down considerably."
+	)
+
+def timingsEnabled() -> bool:
+	return TIMINGS is not None
+
+def getFileType(path:str) -> str:
+	return os.path.splitext(path)[1].lower() or NO_FILE_TYPE
+
+def phase(phase:str, fileType:str=None):
+	# Returns a context manager which times the code within it, if --timings is in effect.
+	return TIMINGS.phase(phase, fileType) if TIMINGS else contextlib.nullcontext()
+
+def mergeTimings(entries:dict) -> None:
+	if TIMINGS and entries:
+		TIMINGS.merge(entries)
+
+def timeIterator(phase:str, iterable):
+	# Times how long each item takes to be produced, eg. by a generator which walks directories.
+	# None items are passed through, but are not counted.
+	if TIMINGS is None:
+		yield from iterable
+		return
+
+	iterator = iter(iterable)
+
+	while True:
+		wallStart = time.perf_counter()
+		cpuStart = time.thread_time()
+
+		try:
+			item = next(iterator)
+		except StopIteration:
+			TIMINGS.add(phase, None, time.perf_counter() - wallStart, time.thread_time() - cpuStart, 0)
+			return
+
+		TIMINGS.add(phase, None, time.perf_counter() - wallStart, time.thread_time() - cpuStart, 0 if item is None else 1)
+		yield item
+
+def __startProfiling() -> list:
+	import cProfile
+
+	profiles = [cProfile.Profile()]
+
+	if sys.version_info < (3, 12):
+		# Until Python 3.12, a profiler only sees the thread which enabled it, so one is
+		# enabled in each new thread the first time that thread calls a function.
+		lock = threading.Lock()
+
+		def profileThread(*_):
+			profile = cProfile.Profile()
+
+			with lock:
+				profiles.append(profile)
+
+			profile.enable()
+
+		threading.setprofile(profileThread)
+
+	profiles[0].enable()
+	return profiles
+
+def __stopProfiling(profiles:list, path:str) -> None:
+	import pstats
+
+	profiles[0].disable()
+	threading.setprofile(None)
+
+	stats = pstats.Stats(profiles[0])
+
+	for profile in profiles[1:]:
+		stats.add(profile)
+
+	stats.dump_stats(path)
+	print(f"Profile written to {path}", file=sys.stderr)
+
+def __printTimings(timings:PhaseTimings, wallTime:float, cpuTime:float) -> None:
+	entries = timings.getEntries()
+
+	print("Timings:", file=sys.stderr)
+	print(f"  {'Phase':<24}{'Wall':>10}{'CPU':>10}{'Count':>8}", file=sys.stderr)
+
+	# Phases are listed in the order they were first run, with the file types of each in alphabetical order.
+	phaseOrder = {}
+
+	for phase, _ in entries:
+		phaseOrder.setdefault(phase, len(phaseOrder))
+
+	for (phase, fileType), (phaseWallTime, phaseCPUTime, count) in sorted(entries.items(), key=lambda item: (phaseOrder[item[0][0]], item[0][1] or "")):
+		name = f"  {fileType}" if fileType is not None else phase
+		print(f"  {name:<24}{phaseWallTime:>9.3f}s{phaseCPUTime:>9.3f}s{count:>8}", file=sys.stderr)
+
+	childTimes = os.times()
+	print(f"  {'Total':<24}{wallTime:>9.3f}s{cpuTime:>9.3f}s", file=sys.stderr)
+	print(f"  {'Child processes':<24}{'':>10}{childTimes.children_user + childTimes.children_system:>9.3f}s", file=sys.stderr)
+
+def __printTracemalloc() -> None:
+	import tracemalloc
+
+	snapshot = tracemalloc.take_snapshot()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	print(f"Memory allocated by Python: {current / (1024 * 1024):.1f}MB at exit, {peak / (1024 * 1024):.1f}MB at peak", file=sys.stderr)
+	print("Largest allocation sites at exit:", file=sys.stderr)
+
+	for statistic in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_COUNT]:
+		print(f"  {statistic}", file=sys.stderr)
+
+@contextlib.contextmanager
+def instrument(args):
+	"""
+	Applies the instrumentation requested by the arguments added by addArguments()
+	to the code run within the context, and reports on it once the code has finished.
+	"""
+
+	global TIMINGS
+
+	if args.tracemalloc:
+		import tracemalloc
+		tracemalloc.start()
+
+	if args.timings:
+		TIMINGS = PhaseTimings()
+
+	profiles = __startProfiling() if args.profile else None
+	wallStart = time.perf_counter()
+	cpuStart = time.process_time()
+
+	try:
+		yield
+	finally:
+		wallTime = time.perf_counter() - wallStart
+		cpuTime = time.process_time() - cpuStart
+
+		if profiles:
+			__stopProfiling(profiles, args.profile)
+
+		if TIMINGS:
+			__printTimings(TIMINGS, wallTime, cpuTime)
+			TIMINGS = None
+
+		if args.tracemalloc:
+			__printTracemalloc()
@@ -0,0 +1,58 @@
+import contextlib
+import json
+import sys
+import threading
+
+FORMAT_TEXT = "text"
+FORMAT_JSONL = "jsonl"
+OUTPUT_FORMATS = [FORMAT_TEXT, FORMAT_JSONL]
+
+EVENT_RESULT = "result"
+EVENT_SUMMARY = "summary"
+
+class JSONLWriter:
+	"""
+	Writes events as JSON objects, one per line, flushing after each one
+	so that they can be consumed as soon as they happen. Safe to use from
+	multiple threads.
+	"""
+
+	def __init__(self, stream):
+		self.__stream = stream
+		self.__lock = threading.Lock()
+
+	def write(self, event:str, fields:dict) -> None:
+		# Non-ASCII characters are escaped, so that paths which aren't valid UTF-8 can still be written.
+		line = json.dumps({"event": event, **fields})
+
+		with self.__lock:
+			self.__stream.write(line + "\n")
+			self.__stream.flush()
+
+def addArgument(parser, resultDescription:str) -> None:
+	parser.add_argument(
+		"--format",
+		choices=OUTPUT_FORMATS,
+		default=FORMAT_TEXT,
+		help=f"Format of the results. \"{FORMAT_TEXT}\" prints a report once the run has finished. \"{FORMAT_JSONL}\" "
+		f"prints {resultDescription} to stdout as a JSON object on its own line as soon as it is known, followed by a "
+		f"summary of the counts. Anything else that would be printed goes to stderr, so stdout only holds JSON. "
+		"Defaults to %(default)s."
+	)
+
+@contextlib.contextmanager
+def openOutput(outputFormat:str):
+	"""
+	Yields a writer for events if the output format is JSON Lines, or None if not.
+	While JSON Lines are being written, anything else printed to stdout is sent to
+	stderr instead, so that consumers of stdout only see events.
+	"""
+
+	if outputFormat != FORMAT_JSONL:
+		yield None
+		return
+
+	writer = JSONLWriter(sys.stdout)
+
+	with contextlib.redirect_stdout(sys.stderr):
+		yield writer
@@ -0,0 +1,93 @@
+import hashlib
+import marshal
+import os
+import struct
+
+# Bump this whenever the structure of the data stored in a snapshot changes.
+SNAPSHOT_FORMAT_VERSION = 3
+SNAPSHOT_EXTENSION = ".snapshot"
+
+# Snapshots sit next to the XML export, which is often in a shared or synced folder, so they
+# only hold plain data (dicts, lists, tuples, sets and strings). Unlike pickle, loading them
+# can never construct arbitrary objects or run code.
+MARSHAL_VERSION = 4
+
+# The header is preceded by its size, so that it can be checked without reading the data.
+# Both are read into memory before being unmarshalled, as marshal.load() reads a file piecemeal.
+HEADER_SIZE_FORMAT = ">I"
+
+KEY_FORMAT_VERSION = "format_version"
+KEY_SOURCE_SIZE = "source_size"
+KEY_SOURCE_MTIME_NS = "source_mtime_ns"
+KEY_SOURCE_SHA256 = "source_sha256"
+
+def default_snapshot_path(xml_path: str):
+	return xml_path + SNAPSHOT_EXTENSION
+
+def hash_file(path: str):
+	hasher = hashlib.sha256()
+
+	with open(path, "rb") as in_file:
+		while True:
+			chunk = in_file.read(1024 * 1024)
+
+			if not chunk:
+				break
+
+			hasher.update(chunk)
+
+	return hasher.hexdigest()
+
+def source_header(xml_path: str, stat_result: os.stat_result = None):
+	if stat_result is None:
+		stat_result = os.stat(xml_path)
+
+	return {
+		KEY_FORMAT_VERSION: SNAPSHOT_FORMAT_VERSION,
+		KEY_SOURCE_SIZE: stat_result.st_size,
+		KEY_SOURCE_MTIME_NS: stat_result.st_mtime_ns,
+		KEY_SOURCE_SHA256: hash_file(xml_path),
+	}
+
+def load_snapshot(xml_path: str, snapshot_path: str, stat_result: os.stat_result = None):
+	"""
+	Returns a tuple of (header, plain data) from the snapshot if it is still valid for the XML file, or None otherwise.
+	A snapshot is valid if the XML file has the same size and modification time as when the snapshot
+	was saved. If only the modification time differs (eg. the export was copied or touched), the
+	contents of the XML file are hashed and compared instead.
+	"""
+
+	try:
+		if stat_result is None:
+			stat_result = os.stat(xml_path)
+
+		with open(snapshot_path, "rb") as in_file:
+			header_size, = struct.unpack(HEADER_SIZE_FORMAT, in_file.read(struct.calcsize(HEADER_SIZE_FORMAT)))
+			header = marshal.loads(in_file.read(header_size))
+
+			if not isinstance(header, dict) or \
+				header.get(KEY_FORMAT_VERSION) != SNAPSHOT_FORMAT_VERSION or \
+				header.get(KEY_SOURCE_SIZE) != stat_result.st_size:
+				return None
+
+			if header.get(KEY_SOURCE_MTIME_NS) != stat_result.st_mtime_ns and \
+				header.get(KEY_SOURCE_SHA256) != hash_file(xml_path):
+				return None
+
+			return (header, marshal.loads(in_file.read()))
+	except Exception:
+		# The snapshot is only a cache, so anything wrong with it (eg. a truncated or corrupt
+		# file, or one in an older format) just means the XML file is parsed instead.
+		return None
+
+def save_snapshot(snapshot_path: str, header: dict, data):
+	# The data must be made up of types which marshal supports, and nothing else.
+	# Written to a temporary file first, so that an interrupted write never leaves a corrupt snapshot behind.
+	temp_path = snapshot_path + ".tmp"
+
+	with open(temp_path, "wb") as out_file:
+		header_bytes = marshal.dumps(header, MARSHAL_VERSION)
+		out_file.write(struct.pack(HEADER_SIZE_FORMAT, len(header_bytes)) + header_bytes)
+		marshal.dump(data, out_file, MARSHAL_VERSION)
+
+	os.replace(temp_path, snapshot_path)
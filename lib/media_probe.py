@@ -0,0 +1,170 @@
+import os
+import struct
+from . import id3, tag_mapping
+
+RIFF_HEADER_SIZE = 12
+RIFF_CHUNK_HEADER_SIZE = 8
+
+class MediaProbe:
+	"""
+	Parses a media file once, and exposes the information that
+	the different checks and fixups need from it. mutagen is only
+	imported when the first file is probed.
+	"""
+
+	def __init__(self, filePath:str):
+		from mutagen import mp3, File
+
+		self.__filePath = filePath
+		self.__extension = os.path.splitext(filePath)[1].lower()
+
+		# Force MP3s to be read as MP3s, rather than letting mutagen guess.
+		self.__mediaFile = mp3.MP3(filePath) if self.__extension == ".mp3" else File(filePath)
+
+		if self.__mediaFile is None:
+			raise ValueError(f'Could not determine the media format of "{filePath}"')
+
+	def getFilePath(self) -> str:
+		return self.__filePath
+
+	def getExtension(self) -> str:
+		return self.__extension
+
+	def getFormat(self) -> str:
+		return type(self.__mediaFile).__name__
+
+	def getDuration(self) -> float:
+		return self.__mediaFile.info.length
+
+	def getBitrate(self) -> int:
+		return getattr(self.__mediaFile.info, "bitrate", 0)
+
+	def getSampleRate(self) -> int:
+		return getattr(self.__mediaFile.info, "sample_rate", 0)
+
+	def getMediaFile(self):
+		return self.__mediaFile
+
+	def getTags(self):
+		return self.__mediaFile.tags
+
+	def hasID3Tags(self) -> bool:
+		from mutagen import id3 as mutID3
+
+		return isinstance(self.__mediaFile.tags, mutID3.ID3)
+
+	def getTagDict(self) -> dict:
+		# Computed on each call, in case the tags have been modified since the file was probed.
+		tags = self.__mediaFile.tags
+
+		if tags is None:
+			return {}
+
+		if self.hasID3Tags():
+			return id3.tag_string_dict(tags)
+
+		outDict = {}
+
+		for key in tags.keys():
+			values = tags[key]
+
+			if not isinstance(values, list):
+				values = [values]
+
+			outDict[key] = "; ".join("<binary data>" if isinstance(value, bytes) else str(value) for value in values)
+
+		return outDict
+
+	def getBasicTagDict(self):
+		"""
+		Returns the basic metadata of the file, keyed on the ID3 frames that ffmpeg
+		writes it to when transcoding to MP3. Returns None if the file's tags are not
+		in a format that can be mapped, as the metadata of the file is then unknown.
+		"""
+
+		from mutagen.flac import FLAC
+		from mutagen.mp4 import MP4
+		from mutagen.ogg import OggFileType
+		from mutagen.wave import WAVE
+
+		tags = self.__mediaFile.tags
+
+		if isinstance(self.__mediaFile, WAVE):
+			return self.__getWAVBasicTagDict()
+
+		if self.hasID3Tags():
+			return tag_mapping.mapID3Frames(tags)
+
+		if isinstance(self.__mediaFile, (FLAC, OggFileType)):
+			return tag_mapping.mapVorbisComments(tags) if tags is not None else {}
+
+		if isinstance(self.__mediaFile, MP4):
+			return tag_mapping.mapMP4Atoms(tags) if tags is not None else {}
+
+		return None
+
+	def __getWAVBasicTagDict(self):
+		# WAVs may have both an ID3 chunk and a RIFF INFO list, and ffmpeg reads both.
+		# Which one wins depends on the order of the chunks, so if they disagree then
+		# the metadata of a transcoded file is treated as unknown.
+		try:
+			info = self.__readRIFFInfo()
+		except UnicodeDecodeError:
+			# ffmpeg copies the raw bytes, so what ends up in an MP3 can't be predicted.
+			return None
+
+		outDict = tag_mapping.mapRIFFInfo(info)
+
+		if self.hasID3Tags():
+			for frame, value in tag_mapping.mapID3Frames(self.__mediaFile.tags).items():
+				if outDict.setdefault(frame, value) != value:
+					return None
+
+		return outDict
+
+	def __readRIFFInfo(self) -> dict:
+		# mutagen only reads the ID3 chunk of WAVs, so the INFO list is read here.
+		info = {}
+
+		with open(self.__filePath, "rb") as inFile:
+			header = inFile.read(RIFF_HEADER_SIZE)
+
+			if len(header) < RIFF_HEADER_SIZE or header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+				return info
+
+			while True:
+				chunkHeader = inFile.read(RIFF_CHUNK_HEADER_SIZE)
+
+				if len(chunkHeader) < RIFF_CHUNK_HEADER_SIZE:
+					break
+
+				chunkID, chunkSize = struct.unpack("<4sI", chunkHeader)
+
+				# Chunks are padded to an even number of bytes.
+				paddedSize = chunkSize + (chunkSize & 1)
+
+				if chunkID == b"LIST" and inFile.read(4) == b"INFO":
+					info.update(self.__parseRIFFInfoList(inFile.read(chunkSize - 4)))
+					inFile.seek(chunkSize & 1, os.SEEK_CUR)
+				else:
+					inFile.seek(paddedSize - (4 if chunkID == b"LIST" else 0), os.SEEK_CUR)
+
+		return info
+
+	@staticmethod
+	def __parseRIFFInfoList(data:bytes) -> dict:
+		info = {}
+		offset = 0
+
+		while offset + RIFF_CHUNK_HEADER_SIZE <= len(data):
+			chunkID, chunkSize = struct.unpack_from("<4sI", data, offset)
+			offset += RIFF_CHUNK_HEADER_SIZE
+
+			# Values are null terminated, and sometimes padded with further nulls.
+			value = data[offset:offset + chunkSize].split(b"\x00", 1)[0].decode("utf-8")
+			offset += chunkSize + (chunkSize & 1)
+
+			if value:
+				info[chunkID.decode("latin-1")] = value
+
+		return info
@@ -1,34 +1,279 @@
-import lxml.etree as ET
+import os
+import sys
+from . import library_snapshot
 
 KEY_NODE_TYPE = "Type"
 KEY_PLAYLIST_ENTRIES = "Entries"
 KEY_TRACK_TITLE = "Name"
 KEY_TRACK_ARTIST = "Artist"
 KEY_TRACK_ALBUM = "Album"
+KEY_TRACK_ID = "TrackID"
+KEY_TRACK_GENRE = "Genre"
+KEY_TRACK_LOCATION = "Location"
 
 NODE_TYPE_FOLDER = "0"
 NODE_TYPE_PLAYLIST = "1"
 
-class MusicLibrary:
-	def __init__(self, fileName: str):
-		with open(fileName, "r") as inFile:
-			self.xml = ET.parse(inFile)
+# Track attributes which are stored in their own slot on a TrackRecord.
+TRACK_RECORD_SLOTS = {
+	KEY_TRACK_ID: "track_id",
+	KEY_TRACK_TITLE: "name",
+	KEY_TRACK_ARTIST: "artist",
+	KEY_TRACK_ALBUM: "album",
+	KEY_TRACK_GENRE: "genre",
+	KEY_TRACK_LOCATION: "location",
+}
+
+# Track attributes whose values tend to be repeated across many tracks.
+# These are interned, so that each distinct value is only stored once.
+INTERNED_TRACK_ATTRIBUTES = frozenset([
+	KEY_TRACK_ARTIST,
+	KEY_TRACK_ALBUM,
+	KEY_TRACK_GENRE,
+	"Composer",
+	"Grouping",
+	"Kind",
+	"Label",
+	"Remixer",
+	"Mix",
+	"Tonality",
+	"Year",
+	"BitRate",
+	"SampleRate",
+	"Rating",
+	"PlayCount",
+	"DiscNumber",
+])
+
+class TrackRecord:
+	"""
+	Compact, read-only record of the attributes of a track in the collection.
+	The commonly used attributes are held in slots, and the rest are held in
+	a flat tuple of alternating names and values, which is only turned into a
+	dict if all of the attributes are requested. Records can be indexed by
+	attribute name in the same way as the dict of XML attributes.
+	"""
+
+	__slots__ = ("track_id", "name", "artist", "album", "genre", "location", "_extra")
+
+	def __init__(self, attributes):
+		extra = []
+
+		self.track_id = None
+		self.name = None
+		self.artist = None
+		self.album = None
+		self.genre = None
+		self.location = None
+
+		for key, value in attributes.items():
+			if key in INTERNED_TRACK_ATTRIBUTES:
+				value = sys.intern(value)
+
+			if key in TRACK_RECORD_SLOTS:
+				setattr(self, TRACK_RECORD_SLOTS[key], value)
+			else:
+				extra.append(sys.intern(key))
+				extra.append(value)
+
+		self._extra = tuple(extra)
+
+	def __getitem__(self, key: str):
+		if key in TRACK_RECORD_SLOTS:
+			value = getattr(self, TRACK_RECORD_SLOTS[key])
+
+			if value is None:
+				raise KeyError(key)
+
+			return value
+
+		extra = self._extra
+
+		for index in range(0, len(extra), 2):
+			if extra[index] == key:
+				return extra[index + 1]
+
+		raise KeyError(key)
+
+	def get(self, key: str, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __contains__(self, key: str):
+		return self.get(key) is not None
+
+	def to_dict(self):
+		out = {}
+
+		for key, slot in TRACK_RECORD_SLOTS.items():
+			value = getattr(self, slot)
+
+			if value is not None:
+				out[key] = value
+
+		extra = self._extra
+
+		for index in range(0, len(extra), 2):
+			out[extra[index]] = extra[index + 1]
+
+		return out
+
+	def __eq__(self, other):
+		if isinstance(other, TrackRecord):
+			return self.to_dict() == other.to_dict()
+
+		if not hasattr(other, "items"):
+			return NotImplemented
+
+		return self.to_dict() == dict(other.items())
+
+	def __repr__(self):
+		return f"TrackRecord({self.to_dict()!r})"
+
+	def __getstate__(self):
+		return (self.track_id, self.name, self.artist, self.album, self.genre, self.location, self._extra)
+
+	def __setstate__(self, state):
+		self.track_id, self.name, self.artist, self.album, self.genre, self.location, self._extra = state
+
+	def from_state(state):
+		# Rebuilds a record from the tuple returned by __getstate__().
+		record = TrackRecord.__new__(TrackRecord)
+		record.__setstate__(state)
+		return record
 
-		self.collection = {track.get("TrackID"): track.attrib for track in self.xml.findall("./COLLECTION/TRACK")}
+class MusicLibrary:
+	def __init__(self, fileName: str, use_snapshot: bool = False, snapshot_path: str = None):
+		self.collection = {}
 		self.playlists = {}
 
-		playlist_root = self.xml.find("./PLAYLISTS/NODE[1]")
+		# Reverse index of track ID to the set of paths of playlists containing that track.
+		self.track_playlists = {}
+
+		if use_snapshot:
+			self.__load_with_snapshot(fileName, snapshot_path or library_snapshot.default_snapshot_path(fileName))
+		else:
+			self.__load(fileName)
+
+	def __load_with_snapshot(self, fileName: str, snapshot_path: str):
+		stat_result = os.stat(fileName)
+		snapshot = library_snapshot.load_snapshot(fileName, snapshot_path, stat_result)
+
+		if snapshot is not None and self.__restore_snapshot_data(snapshot[1]):
+			header = snapshot[0]
+
+			if header[library_snapshot.KEY_SOURCE_MTIME_NS] != stat_result.st_mtime_ns:
+				# The contents matched but the modification time didn't, so record
+				# the new modification time to avoid hashing the XML next time.
+				header[library_snapshot.KEY_SOURCE_MTIME_NS] = stat_result.st_mtime_ns
+				self.__save_snapshot(snapshot_path, header)
+
+			return
+
+		# Taken before parsing, so that any changes made while parsing invalidate the snapshot.
+		header = library_snapshot.source_header(fileName, stat_result)
+		self.__load(fileName)
+		self.__save_snapshot(snapshot_path, header)
+
+	def __restore_snapshot_data(self, data):
+		# Returns whether the data from a snapshot could be restored. Tracks are stored as the
+		# tuples returned by TrackRecord.__getstate__(), as snapshots only hold plain data.
+		try:
+			collection, playlists, track_playlists = data
+			collection = {track_id: TrackRecord.from_state(state) for track_id, state in collection.items()}
+		except (TypeError, ValueError, AttributeError):
+			return False
+
+		if not isinstance(playlists, dict) or not isinstance(track_playlists, dict):
+			return False
+
+		self.collection, self.playlists, self.track_playlists = collection, playlists, track_playlists
+		return True
+
+	def __save_snapshot(self, snapshot_path: str, header: dict):
+		collection = {track_id: track.__getstate__() for track_id, track in self.collection.items()}
+
+		try:
+			library_snapshot.save_snapshot(snapshot_path, header, (collection, self.playlists, self.track_playlists))
+		except OSError as ex:
+			# Not being able to save a snapshot only makes the next load slower.
+			print(f"Warning: could not save library snapshot to {snapshot_path}: {ex}")
+
+	def __load(self, fileName: str):
+		# Imported here so that scripts only pay for lxml when a library is actually loaded.
+		import lxml.etree as ET
+
+		# The XML is streamed rather than parsed into a tree. Only the attributes that are
+		# needed are copied out, and each element is discarded once it has been processed,
+		# so memory use is proportional to the extracted data rather than to the document.
+		playlist_path = []
+
+		# One entry for each open NODE under PLAYLISTS: a tuple of whether the node contributed
+		# a name to playlist_path, and its path and playlist data if it is a playlist.
+		# Each path is built once, top down, and the same tuple is shared by the playlists
+		# dict and every entry in the reverse index.
+		node_stack = []
+		found_playlist_root = False
+		in_playlist_root = False
+
+		# Only TRACK and NODE elements are reported, which skips the overhead
+		# of handling events for the many cue and tempo elements within tracks.
+		for event, element in ET.iterparse(fileName, events=("start", "end"), tag=("TRACK", "NODE")):
+			parent_tag = element.getparent().tag
+
+			if event == "start":
+				if element.tag != "NODE":
+					continue
+
+				if parent_tag == "PLAYLISTS":
+					# Only the first node under PLAYLISTS is used as the root,
+					# and its name is not part of any playlist path.
+					in_playlist_root = not found_playlist_root
+					found_playlist_root = True
+					node_stack.append((False, None, None))
+				elif not in_playlist_root:
+					node_stack.append((False, None, None))
+				else:
+					playlist_path.append(element.get("Name"))
+					path = None
+					data = None
+
+					if element.get(KEY_NODE_TYPE) == NODE_TYPE_PLAYLIST:
+						path = tuple(playlist_path)
+						data = dict(element.attrib)
+						data[KEY_PLAYLIST_ENTRIES] = []
+						self.playlists[path] = data
+
+					node_stack.append((True, path, data))
 
-		for item in playlist_root.iter("NODE"):
-			if item == playlist_root:
 				continue
 
-			if item.attrib[KEY_NODE_TYPE] == NODE_TYPE_PLAYLIST:
-				data = dict(item.attrib)
-				data[KEY_PLAYLIST_ENTRIES] = [track.get("Key") for track in item.findall("TRACK")]
+			if element.tag == "TRACK":
+				if parent_tag == "COLLECTION":
+					self.collection[element.get(KEY_TRACK_ID)] = TrackRecord(element.attrib)
+				elif parent_tag == "NODE" and node_stack and node_stack[-1][2] is not None:
+					_, path, data = node_stack[-1]
+					track_id = element.get("Key")
+					data[KEY_PLAYLIST_ENTRIES].append(track_id)
+					self.track_playlists.setdefault(track_id, set()).add(path)
+			elif node_stack:
+				has_path_entry, _, _ = node_stack.pop()
+
+				if has_path_entry:
+					playlist_path.pop()
+
+			MusicLibrary.__discard_element(element)
+
+	def __discard_element(element):
+		element.clear()
+
+		parent = element.getparent()
 
-				playlist_path = MusicLibrary.__compute_playlist_path(playlist_root, item)
-				self.playlists[playlist_path] = data
+		if parent is not None:
+			while element.getprevious() is not None:
+				del parent[0]
 
 	def playlist_paths(self):
 		return self.playlists.keys()
@@ -39,6 +284,18 @@ class MusicLibrary:
 
 		return self.playlists[playlist_path][KEY_PLAYLIST_ENTRIES]
 
+	def playlist_track_id_set(self, playlist_path: tuple):
+		return frozenset(self.playlist_track_ids(playlist_path))
+
+	def playlists_containing(self, track_id: str):
+		return frozenset(self.track_playlists.get(track_id, ()))
+
+	def track_in_playlist(self, track_id: str, playlist_path: tuple):
+		return playlist_path in self.track_playlists.get(track_id, ())
+
+	def track_in_any_playlist(self, track_id: str, playlist_paths):
+		return not self.track_playlists.get(track_id, set()).isdisjoint(playlist_paths)
+
 	def playlist_tracks(self, playlist_path: str):
 		return self.tracks_by_id(self.playlist_track_ids(playlist_path), True)
 
@@ -82,12 +339,3 @@ class MusicLibrary:
 			out_album.append(title)
 
 		return out
-
-	def __compute_playlist_path(root, item):
-		path = []
-
-		while item != root:
-			path = [item.get('Name')] + path
-			item = item.getparent()
-
-		return tuple(path)
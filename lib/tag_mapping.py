@@ -0,0 +1,68 @@
+# Maps the tags of other formats onto the ID3 frames which ffmpeg writes
+# them to when transcoding to MP3, so that the tags of a transcoded file
+# can be known without having to read them back from the file.
+
+from . import id3
+
+# ffmpeg joins repeated values of the same tag with this separator.
+MULTIPLE_VALUE_SEPARATOR = ";"
+
+FRAME_TRACK_ARTIST = "TPE1"
+FRAME_ALBUM_TITLE = "TALB"
+
+# The frames which tags are mapped onto.
+MAPPED_FRAMES = [
+	id3.FRAME_TRACK_TITLE,
+	FRAME_TRACK_ARTIST,
+	FRAME_ALBUM_TITLE
+]
+
+# Vorbis comment keys are case insensitive, so these are matched in lower case.
+VORBIS_COMMENT_FRAMES = {
+	"title": id3.FRAME_TRACK_TITLE,
+	"artist": FRAME_TRACK_ARTIST,
+	"album": FRAME_ALBUM_TITLE,
+}
+
+# RIFF INFO chunks in WAV files.
+RIFF_INFO_FRAMES = {
+	"INAM": id3.FRAME_TRACK_TITLE,
+	"IART": FRAME_TRACK_ARTIST,
+	"IPRD": FRAME_ALBUM_TITLE,
+}
+
+# iTunes style atoms in MP4 files, including ALAC.
+MP4_ATOM_FRAMES = {
+	"\xa9nam": id3.FRAME_TRACK_TITLE,
+	"\xa9ART": FRAME_TRACK_ARTIST,
+	"\xa9alb": FRAME_ALBUM_TITLE,
+}
+
+def __joinValues(values) -> str:
+	if not isinstance(values, list):
+		values = [values]
+
+	return MULTIPLE_VALUE_SEPARATOR.join(str(value) for value in values)
+
+def mapID3Frames(tags) -> dict:
+	tagDict = id3.tag_string_dict(tags)
+	return {frame: tagDict[frame] for frame in MAPPED_FRAMES if frame in tagDict}
+
+def mapVorbisComments(tags) -> dict:
+	outDict = {}
+
+	for key, values in tags.items():
+		frame = VORBIS_COMMENT_FRAMES.get(key.lower())
+
+		if frame is None:
+			continue
+
+		outDict[frame] = __joinValues(values)
+
+	return outDict
+
+def mapRIFFInfo(info:dict) -> dict:
+	return {RIFF_INFO_FRAMES[key]: value for key, value in info.items() if key in RIFF_INFO_FRAMES}
+
+def mapMP4Atoms(tags) -> dict:
+	return {frame: __joinValues(tags[key]) for key, frame in MP4_ATOM_FRAMES.items() if key in tags}
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+from . import file_transfer
+
+# Bump this whenever the way that keys are computed changes, so
+# that entries written by older versions are never matched.
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+ENTRY_EXTENSION = ".mp3"
+
+# When the cache grows over its maximum size, entries are evicted until
+# it is this fraction of the maximum, so that eviction (which has to scan
+# the whole cache) doesn't need to happen after every new entry.
+EVICTION_TARGET = 0.9
+
+def tagDigest(probe) -> str:
+	"""
+	Returns a digest of all of the tags of a probed file, including any binary
+	values such as pictures, as anything in the tags may be carried over into a
+	transcoded file.
+	"""
+
+	hasher = hashlib.sha256()
+	tags = probe.getTags()
+
+	if tags is not None:
+		for key in sorted(tags.keys()):
+			hasher.update(repr((key, tags[key])).encode("utf-8"))
+
+	for picture in getattr(probe.getMediaFile(), "pictures", []):
+		hasher.update(repr((picture.type, picture.mime, picture.desc)).encode("utf-8"))
+		hasher.update(picture.data)
+
+	return hasher.hexdigest()
+
+def makeKey(audioHash:str, tagDigest:str, quality:int, encoderDigest:str, metadata:dict) -> str:
+	keyData = [CACHE_FORMAT_VERSION, audioHash, tagDigest, quality, encoderDigest, metadata or {}]
+	return hashlib.sha256(json.dumps(keyData, sort_keys=True).encode("utf-8")).hexdigest()
+
+class TranscodeCache:
+	"""
+	Directory of previously transcoded files, addressed by a key which covers
+	everything that affects the output of a transcode. The least recently used
+	entries are evicted when the total size of the cache goes over its maximum.
+	The modification time of an entry records when it was last used, as access
+	times are often not kept up to date by the file system. Safe to use from
+	multiple threads.
+	"""
+
+	def __init__(self, dirPath:str, maxSize:int=DEFAULT_MAX_SIZE):
+		self.__dirPath = dirPath
+		self.__maxSize = maxSize
+		self.__totalSize = None
+		self.__lock = threading.Lock()
+		self.__hits = 0
+		self.__misses = 0
+		self.__stores = 0
+		self.__evictions = 0
+
+	def getDirPath(self) -> str:
+		return self.__dirPath
+
+	def getHits(self) -> int:
+		return self.__hits
+
+	def getMisses(self) -> int:
+		return self.__misses
+
+	def getStores(self) -> int:
+		return self.__stores
+
+	def getEvictions(self) -> int:
+		return self.__evictions
+
+	def __entryPath(self, key:str) -> str:
+		# Entries are spread over subdirectories, to keep directory listings short.
+		return os.path.join(self.__dirPath, key[:2], key + ENTRY_EXTENSION)
+
+	def fetch(self, key:str, destPath:str, linkMode:str=file_transfer.LINK_MODE_AUTO) -> bool:
+		# Produces the destination file from the cached entry, and returns whether there was one.
+		entryPath = self.__entryPath(key)
+
+		try:
+			file_transfer.copyFile(entryPath, destPath, linkMode)
+			os.utime(entryPath)
+		except OSError:
+			# Most likely there is no entry, but it may also have been
+			# evicted by another process while it was being copied.
+			with self.__lock:
+				self.__misses += 1
+
+			return False
+
+		with self.__lock:
+			self.__hits += 1
+
+		return True
+
+	def store(self, key:str, filePath:str, linkMode:str=file_transfer.LINK_MODE_AUTO) -> None:
+		entryPath = self.__entryPath(key)
+		tempPath = f"{entryPath}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+		try:
+			os.makedirs(os.path.dirname(entryPath), exist_ok=True)
+			file_transfer.copyFile(filePath, tempPath, linkMode)
+			os.replace(tempPath, entryPath)
+		except OSError as ex:
+			# Not being able to cache a file only makes a later transcode slower.
+			print(f"Warning: could not store {filePath} in the transcode cache: {ex}")
+
+			try:
+				os.unlink(tempPath)
+			except OSError:
+				pass
+
+			return
+
+		with self.__lock:
+			self.__stores += 1
+
+			if self.__totalSize is None:
+				self.__totalSize = sum(size for _, _, size in self.__listEntries())
+			else:
+				self.__totalSize += os.path.getsize(entryPath)
+
+			if self.__totalSize > self.__maxSize:
+				self.__evict()
+
+	def trim(self) -> None:
+		# Evicts entries if the cache is over its maximum size, eg. because the maximum has been lowered.
+		with self.__lock:
+			self.__totalSize = sum(size for _, _, size in self.__listEntries())
+
+			if self.__totalSize > self.__maxSize:
+				self.__evict()
+
+	def __listEntries(self) -> list:
+		# Returns (modification time, path, size) for each entry.
+		entries = []
+
+		if not os.path.isdir(self.__dirPath):
+			return entries
+
+		with os.scandir(self.__dirPath) as subdirs:
+			for subdir in subdirs:
+				if not subdir.is_dir():
+					continue
+
+				with os.scandir(subdir.path) as files:
+					for entry in files:
+						if entry.name.endswith(ENTRY_EXTENSION) and entry.is_file():
+							stat = entry.stat()
+							entries.append((stat.st_mtime_ns, entry.path, stat.st_size))
+
+		return entries
+
+	def __evict(self) -> None:
+		# Rescanned rather than tracked, as other processes may be using the cache too.
+		entries = sorted(self.__listEntries())
+		self.__totalSize = sum(size for _, _, size in entries)
+		targetSize = int(self.__maxSize * EVICTION_TARGET)
+
+		for _, entryPath, size in entries:
+			if self.__totalSize <= targetSize:
+				break
+
+			try:
+				os.unlink(entryPath)
+			except FileNotFoundError:
+				pass
+
+			self.__totalSize -= size
+			self.__evictions += 1
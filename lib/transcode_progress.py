@@ -0,0 +1,154 @@
+import sys
+import threading
+import time
+from . import ffmpeg, utils
+
+# Minimum time between status lines.
+STATUS_INTERVAL = 5.0
+
+class TranscodeProgress:
+	"""
+	Aggregates the progress reported by concurrent ffmpeg jobs into an overall throughput,
+	and an estimate of the time remaining. The estimate is based on the number of jobs still
+	to run, so is only made if the number of jobs is known up front. While jobs run, a status line is printed to stderr every few seconds if it is a terminal.
+	Safe to use from multiple threads.
+	"""
+
+	def __init__(self, expectedJobs:int=None, live:bool=None):
+		self.__lock = threading.Lock()
+		self.__expectedJobs = expectedJobs
+		self.__live = sys.stderr.isatty() if live is None else live
+		self.__startTime = None
+		self.__endTime = None
+		self.__lastStatusTime = None
+		self.__nextJobID = 0
+
+		# Job ID -> (duration of the input in seconds or None, latest ffmpeg.Progress or None)
+		self.__running = {}
+
+		self.__finishedJobs = 0
+		self.__failedJobs = 0
+		self.__outTime = 0.0
+		self.__totalSize = 0
+
+		# Only the sum and count are kept, so that memory use doesn't grow with the number of jobs.
+		self.__jobSpeedSum = 0.0
+		self.__jobSpeedCount = 0
+
+	def startJob(self, duration:float=None) -> int:
+		# Returns an ID for the job, to pass to getCallback() and finishJob().
+		with self.__lock:
+			if self.__startTime is None:
+				self.__startTime = time.perf_counter()
+				self.__lastStatusTime = self.__startTime
+
+			jobID = self.__nextJobID
+			self.__nextJobID += 1
+			self.__running[jobID] = (duration, None)
+			return jobID
+
+	def skipJob(self):
+		# Called instead of startJob() for an expected job which turned out not to need running.
+		with self.__lock:
+			if self.__expectedJobs is not None:
+				self.__expectedJobs = max(self.__expectedJobs - 1, 0)
+
+	def getCallback(self, jobID:int):
+		# Returns a callback to pass as onProgress when running ffmpeg for the job.
+		return lambda progress: self.update(jobID, progress)
+
+	def update(self, jobID:int, progress:ffmpeg.Progress):
+		with self.__lock:
+			self.__running[jobID] = (self.__running[jobID][0], progress)
+			now = time.perf_counter()
+
+			if not self.__live or now - self.__lastStatusTime < STATUS_INTERVAL:
+				return
+
+			self.__lastStatusTime = now
+			status = self.__getStatus(now)
+
+		print(status, file=sys.stderr, flush=True)
+
+	def finishJob(self, jobID:int, successful:bool):
+		with self.__lock:
+			_, progress = self.__running.pop(jobID)
+			self.__endTime = time.perf_counter()
+
+			if not successful:
+				self.__failedJobs += 1
+				return
+
+			self.__finishedJobs += 1
+
+			if progress:
+				self.__outTime += progress.getOutTime()
+				self.__totalSize += progress.getTotalSize()
+
+				if progress.getElapsed() > 0:
+					self.__jobSpeedSum += progress.getOutTime() / progress.getElapsed()
+					self.__jobSpeedCount += 1
+
+	def getETA(self, now:float=None):
+		# Returns the estimated number of seconds until all jobs have finished, or None if it can't be estimated yet.
+		with self.__lock:
+			return self.__getETA(now if now is not None else time.perf_counter())
+
+	def __getETA(self, now:float):
+		# Without the number of jobs, the running jobs say nothing about how many are still queued.
+		if self.__startTime is None or self.__expectedJobs is None:
+			return None
+
+		# Running jobs count for the fraction of their input which has been transcoded.
+		done = self.__finishedJobs + self.__failedJobs
+
+		for duration, progress in self.__running.values():
+			if duration and progress:
+				done += min(progress.getOutTime() / duration, 1.0)
+
+		if done <= 0:
+			return None
+
+		return (now - self.__startTime) * max(self.__expectedJobs - done, 0) / done
+
+	def __getStatus(self, now:float) -> str:
+		done = self.__finishedJobs + self.__failedJobs
+		total = f"/{self.__expectedJobs}" if self.__expectedJobs is not None else ""
+		speeds = [progress.getSpeed() for _, progress in self.__running.values() if progress and progress.getSpeed()]
+		eta = self.__getETA(now)
+
+		status = f"Transcoded {done}{total} files, {len(self.__running)} running"
+
+		if speeds:
+			status += f" at {sum(speeds):.1f}x realtime"
+
+		if eta is not None:
+			status += f", {utils.formatDuration(eta)} remaining"
+
+		return status
+
+	def printSummary(self):
+		with self.__lock:
+			if self.__startTime is None:
+				return
+
+			wallTime = (self.__endTime or time.perf_counter()) - self.__startTime
+			finishedJobs = self.__finishedJobs
+			failedJobs = self.__failedJobs
+			outTime = self.__outTime
+			totalSize = self.__totalSize
+			jobSpeedSum = self.__jobSpeedSum
+			jobSpeedCount = self.__jobSpeedCount
+
+		summary = (
+			f"Transcoded {finishedJobs} files ({failedJobs} failed) in {utils.formatDuration(wallTime)}: "
+			f"{utils.formatDuration(outTime)} of audio, {utils.formatSize(totalSize)} written"
+		)
+
+		if wallTime > 0 and outTime > 0:
+			summary += f", {outTime / wallTime:.1f}x realtime overall"
+
+		if jobSpeedCount:
+			summary += f", {jobSpeedSum / jobSpeedCount:.1f}x per job on average"
+
+		print(summary)
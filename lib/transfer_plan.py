@@ -0,0 +1,78 @@
+import contextlib
+import json
+import os
+
+# Bump this whenever the format of plan files changes.
+PLAN_FORMAT_VERSION = 2
+
+ACTION_COPY = "copy"
+ACTION_TRANSCODE = "transcode"
+ACTION_SKIP = "skip"
+ACTION_DUPLICATE = "duplicate"
+ACTION_FAIL = "fail"
+
+KEY_VERSION = "version"
+KEY_OPTIONS = "options"
+
+class PlanWriter:
+	"""
+	Writes a plan as JSON Lines: a header holding the format version and the options
+	the plan was made with, followed by one entry for each source file, in order.
+	"""
+
+	def __init__(self, outFile, options:dict):
+		self.__outFile = outFile
+		self.__writeLine({KEY_VERSION: PLAN_FORMAT_VERSION, KEY_OPTIONS: options})
+
+	def __writeLine(self, fields:dict) -> None:
+		self.__outFile.write(json.dumps(fields) + "\n")
+
+	def write(self, entry:dict) -> None:
+		self.__writeLine(entry)
+
+def getSourceIdentity(path:str):
+	# Returns [size, modification time in nanoseconds] for the file, or None if it is not a file.
+	# A source whose identity is unchanged is assumed to have the same contents as when it was planned.
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+
+	return [stat.st_size, stat.st_mtime_ns] if os.path.isfile(path) else None
+
+def sourceIsUnchanged(entry:dict) -> bool:
+	identity = entry.get("identity")
+	return identity is not None and getSourceIdentity(entry["sourcePath"]) == identity
+
+@contextlib.contextmanager
+def openWriter(path:str, options:dict):
+	# Written to a temporary file first, so that an interrupted run never leaves a partial plan behind.
+	tempPath = path + ".tmp"
+
+	try:
+		with open(tempPath, "w", encoding="utf-8") as outFile:
+			yield PlanWriter(outFile, options)
+
+		os.replace(tempPath, path)
+	finally:
+		if os.path.isfile(tempPath):
+			os.unlink(tempPath)
+
+def countPlannedActions(path:str, action:str) -> int:
+	# Returns the number of entries in a plan file with the given action, without keeping the entries in memory.
+	with openPlan(path) as (_, entries):
+		return sum(1 for entry in entries if entry.get("action") == action)
+
+@contextlib.contextmanager
+def openPlan(path:str):
+	# Yields (options, iterator of entries), reading the entries as they are needed.
+	with open(path, "r", encoding="utf-8") as inFile:
+		try:
+			header = json.loads(inFile.readline())
+		except json.JSONDecodeError:
+			header = None
+
+		if not isinstance(header, dict) or header.get(KEY_VERSION) != PLAN_FORMAT_VERSION:
+			raise ValueError(f"{path} is not a plan file, or was written by a different version of makedj")
+
+		yield (header[KEY_OPTIONS], (json.loads(line) for line in inFile if line.strip()))
@@ -1,6 +1,8 @@
 TRANSFER_TYPE_UNKNOWN = "Unknown"
 TRANSFER_TYPE_COPY = "Copy"
 TRANSFER_TYPE_TRANSCODE = "Transcode"
+TRANSFER_TYPE_SKIP = "Skip"
+TRANSFER_TYPE_DUPLICATE = "Duplicate"
 
 TRANSFER_ERROR_NONE = "No error"
 TRANSFER_ERROR_UNHANDLED = "Unhandled error"
@@ -20,6 +22,7 @@ class TransferResult():
 		self.__transferError = transferError
 		self.__transferErrorReason = ""
 		self.__replacedTargetFile = False
+		self.__fromCache = False
 
 	def getSourcePath(self) -> str:
 		return self.__sourcePath
@@ -54,5 +57,11 @@ class TransferResult():
 	def setReplacedTargetFile(self, replaced:bool):
 		self.__replacedTargetFile = replaced
 
+	def getFromCache(self) -> bool:
+		return self.__fromCache
+
+	def setFromCache(self, fromCache:bool):
+		self.__fromCache = fromCache
+
 	def getSuccessful(self):
 		return self.__transferError == TRANSFER_ERROR_NONE
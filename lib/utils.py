@@ -4,6 +4,13 @@ from . import config
 MP3_QUALITY_STD = 320
 MP3_QUALITY_DRAFT = 258
 
+SIZE_SUFFIXES = {
+	"K": 1024,
+	"M": 1024 ** 2,
+	"G": 1024 ** 3,
+	"T": 1024 ** 4
+}
+
 def isChildPath(parent:str, child:str) -> bool:
 	try:
 		return not os.path.relpath(child, parent).startswith("..")
@@ -13,13 +20,40 @@ def isChildPath(parent:str, child:str) -> bool:
 def isDestNewer(sourcePath:str, destPath:str):
 	return os.path.getmtime(sourcePath) < os.path.getmtime(destPath)
 
+def parseSize(text:str) -> int:
+	# Parses a number of bytes, optionally followed by a K, M, G or T suffix (eg. "512M" or "20G").
+	text = text.strip().upper().removesuffix("B")
+	multiplier = 1
+
+	if text and text[-1] in SIZE_SUFFIXES:
+		multiplier = SIZE_SUFFIXES[text[-1]]
+		text = text[:-1]
+
+	return int(float(text) * multiplier)
+
+def formatSize(size:int) -> str:
+	for suffix, multiplier in reversed(SIZE_SUFFIXES.items()):
+		if size >= multiplier:
+			return f"{size / multiplier:.1f}{suffix}"
+
+	return f"{size}B"
+
+def formatDuration(seconds:float) -> str:
+	if seconds < 60:
+		return f"{seconds:.1f}s"
+
+	minutes, seconds = divmod(int(seconds), 60)
+	hours, minutes = divmod(minutes, 60)
+	return f"{hours}h{minutes:02}m{seconds:02}s" if hours else f"{minutes}m{seconds:02}s"
+
 def indentLines(lines:str, indent:str):
 	return indent + (("\n" + indent).join(lines.split("\n")))
 
 def removeFileAndEmptyParentDirs(path:str, limit=None):
 	os.unlink(path)
-	path = os.path.dirname(path)
+	removeEmptyDirs(os.path.dirname(path), limit)
 
+def removeEmptyDirs(path:str, limit=None):
 	realLimit = os.path.realpath(limit) if limit else None
 
 	while True:
@@ -29,7 +63,7 @@ def removeFileAndEmptyParentDirs(path:str, limit=None):
 		if realLimit and (not isChildPath(realLimit, path) or realLimit == os.path.realpath(path)):
 			return
 
-		if os.listdir(path):
+		if not os.path.isdir(path) or os.listdir(path):
 			return
 
 		os.rmdir(path)
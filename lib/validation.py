@@ -1,6 +1,9 @@
 import os
-from . import id3
-from mutagen import id3 as mutID3, mp3, File
+from .media_probe import MediaProbe
+
+# Bump this whenever the checks below change, so that any cached
+# validation results are discarded.
+VALIDATION_RULES_VERSION = 3
 
 MEDIA_FORMAT_LOSSLESS = [
 	".flac",
@@ -46,30 +49,84 @@ def __anyTagsHaveNonPrintableCharacters(tags:dict):
 
 	return False
 
-def __performChecksOnFileContents(filePath:str, extension:str) -> list:
+def __checkBasicTags(tagDict:dict) -> list:
+	validationErrors = []
+
+	if __fileIsMissingBasicTags(tagDict):
+		validationErrors.append(MISSING_BASIC_METADATA)
+
+	if __anyTagsHaveNonPrintableCharacters(tagDict):
+		validationErrors.append(INVALID_METADATA_CHARACTERS)
+
+	return validationErrors
+
+def __performChecks(extension:str, duration:float, bitrate:int, tagDict:dict) -> list:
+	# For MP3s, the tag dict is None if the MP3 has no ID3 tags. For lossless files, it holds the
+	# basic tags mapped onto ID3 frames, or is None if the tags of the file can't be mapped.
 	validationErrors = []
 
 	if extension in MEDIA_FORMAT_ALLOWED:
-		if File(filePath).info.length > 10 * 60:
+		if duration > 10 * 60:
 			validationErrors.append(OVER_TEN_MINUTES_LONG)
 
 	if extension == ".mp3":
-		if mp3.MP3(filePath).info.bitrate < 320000:
+		if bitrate < 320000:
 			validationErrors.append(MP3_LESS_THAN_320K)
 
-		# TODO: Do this for all supported files, not just MP3s?
-		tagDict = id3.dump_tag_string_dict(filePath)
-
-		if __fileIsMissingBasicTags(tagDict):
-			validationErrors.append(MISSING_BASIC_METADATA)
+		if tagDict is None:
+			validationErrors.append(NO_ID3_TAGS)
+			return validationErrors
 
-		if __anyTagsHaveNonPrintableCharacters(tagDict):
-			validationErrors.append(INVALID_METADATA_CHARACTERS)
+		validationErrors += __checkBasicTags(tagDict)
+	elif extension in MEDIA_FORMAT_LOSSLESS and tagDict is not None:
+		# Checked here so that lossless files which would fail validation once
+		# transcoded can be rejected before they are transcoded.
+		validationErrors += __checkBasicTags(tagDict)
 
 	return validationErrors
 
-def validateFile(filePath:str, logExceptions=True) -> list:
+def __getTagDict(probe:MediaProbe):
+	extension = probe.getExtension()
+
+	if extension == ".mp3":
+		return probe.getTagDict() if probe.hasID3Tags() else None
+
+	if extension in MEDIA_FORMAT_LOSSLESS:
+		return probe.getBasicTagDict()
+
+	return None
+
+def __performChecksOnProbe(probe:MediaProbe) -> list:
+	return __performChecks(probe.getExtension(), probe.getDuration(), probe.getBitrate(), __getTagDict(probe))
+
+def __performChecksOnExtension(extension:str) -> list:
+	if extension not in MEDIA_FORMAT_ALLOWED:
+		return [UNSUPPORTED_FORMAT]
+	elif extension != ".mp3":
+		return [NOT_AN_MP3]
+
+	return []
+
+def __handleValidationException(filePath:str, ex:Exception, logExceptions:bool) -> str:
+	from mutagen import id3 as mutID3
+
+	if isinstance(ex, mutID3.ID3NoHeaderError):
+		return NO_ID3_TAGS
+
+	if logExceptions:
+		print(f'validate_file(): Unexpected exception when validating "{filePath}": {ex}')
+
+	return UNEXPECTED_ERROR
+
+def fileTypeIsSupported(path:str) -> bool:
+	# Whether a file should be picked up when searching directories for media.
+	return os.path.splitext(path)[1].lower() in ALL_MEDIA_FORMATS and not os.path.basename(path).startswith(".")
+
+def probeAndValidateFile(filePath:str, logExceptions=True) -> tuple:
+	# Returns a tuple of (probe, validation errors), so that callers which go on to use the
+	# file don't need to probe it again. The probe is None if the file could not be probed.
 	validationErrors = []
+	probe = None
 
 	# Catch exceptions so that we don't crash an entire script
 	# mid way through
@@ -77,27 +134,40 @@ def validateFile(filePath:str, logExceptions=True) -> list:
 		exists = os.path.isfile(filePath)
 
 		extension = os.path.splitext(filePath)[1].lower()
-
-		if extension not in MEDIA_FORMAT_ALLOWED:
-			validationErrors.append(UNSUPPORTED_FORMAT)
-		elif extension != ".mp3":
-			validationErrors.append(NOT_AN_MP3)
+		validationErrors += __performChecksOnExtension(extension)
 
 		if not exists:
 			validationErrors.append(DOES_NOT_EXIST)
 
 			# Checks below all require the file to exist,
 			# so quit here if it does not.
-			return validationErrors
+			return (probe, validationErrors)
 
-		validationErrors += __performChecksOnFileContents(filePath, extension)
+		probe = MediaProbe(filePath)
+		validationErrors += __performChecksOnProbe(probe)
 
-	except mutID3.ID3NoHeaderError:
-		validationErrors.append(NO_ID3_TAGS)
 	except Exception as ex:
-		if logExceptions:
-			print(f'validate_file(): Unexpected exception when validating "{filePath}": {ex}')
+		validationErrors.append(__handleValidationException(filePath, ex, logExceptions))
 
-		validationErrors.append(UNEXPECTED_ERROR)
+	return (probe, validationErrors)
+
+def validateFile(filePath:str, logExceptions=True) -> list:
+	return probeAndValidateFile(filePath, logExceptions)[1]
+
+def validateProbe(probe:MediaProbe, logExceptions=True) -> list:
+	validationErrors = __performChecksOnExtension(probe.getExtension())
+
+	try:
+		validationErrors += __performChecksOnProbe(probe)
+	except Exception as ex:
+		validationErrors.append(__handleValidationException(probe.getFilePath(), ex, logExceptions))
 
 	return validationErrors
+
+def validateTranscodedMP3(duration:float, bitrate:int, tagDict:dict) -> list:
+	# Validates an MP3 that has been transcoded, from what is already known about it
+	# (eg. from the source file and the encoder settings), rather than by probing it.
+	return __performChecks(".mp3", duration, bitrate, tagDict)
+
+def validateFiles(filePaths:list, logExceptions=True) -> list:
+	return [validateFile(filePath, logExceptions) for filePath in filePaths]
@@ -0,0 +1,237 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from . import crawler
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher:
+	"""
+	Reports files which are created or modified under a set of directories,
+	using Linux's inotify API. Subdirectories are watched as they are created.
+	"""
+
+	def __init__(self, dirs:list, fileFilter=None, useExcludeFiles:bool=False):
+		libcName = ctypes.util.find_library("c")
+
+		if not sys.platform.startswith("linux") or not libcName:
+			raise OSError("inotify is not available on this platform")
+
+		self.__libc = ctypes.CDLL(libcName, use_errno=True)
+		self.__fileFilter = fileFilter
+		self.__useExcludeFiles = useExcludeFiles
+		self.__watchDescriptors = {}
+
+		self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+		if self.__fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1() failed")
+
+		for dirPath in dirs:
+			self.__watchTree(dirPath)
+
+	def close(self):
+		os.close(self.__fd)
+
+	def readChangedFiles(self, timeout:float) -> list:
+		readable, _, _ = select.select([self.__fd], [], [], timeout)
+
+		if not readable:
+			return []
+
+		try:
+			data = os.read(self.__fd, 64 * 1024)
+		except BlockingIOError:
+			return []
+
+		changedFiles = []
+		offset = 0
+
+		while offset < len(data):
+			wd, mask, _, nameLength = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+			offset += INOTIFY_EVENT_HEADER.size
+			name = os.fsdecode(data[offset:offset + nameLength].rstrip(b"\0"))
+			offset += nameLength
+
+			if mask & IN_Q_OVERFLOW:
+				# Events were dropped. Re-scanning everything would defeat the point,
+				# so just report it - the files will be picked up if they change again.
+				print("Warning: inotify event queue overflowed, some changes may have been missed", file=sys.stderr)
+				continue
+
+			dirPath = self.__watchDescriptors.get(wd)
+
+			if dirPath is None or not name:
+				continue
+
+			path = os.path.join(dirPath, name)
+
+			if mask & IN_ISDIR:
+				if mask & (IN_CREATE | IN_MOVED_TO):
+					# Anything already inside a directory that was moved in
+					# will not generate events of its own.
+					changedFiles += self.__watchTree(path)
+			elif self.__fileFilter is None or self.__fileFilter(name):
+				changedFiles.append(path)
+
+		return changedFiles
+
+	def __watchTree(self, rootPath:str) -> list:
+		# Adds watches to a directory and all of its subdirectories,
+		# and returns any files that already exist within them.
+		existingFiles = []
+		stack = [rootPath]
+
+		while stack:
+			dirPath = stack.pop()
+			wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(dirPath), INOTIFY_WATCH_MASK)
+
+			if wd < 0:
+				print(f"Warning: could not watch {dirPath} (error {ctypes.get_errno()})", file=sys.stderr)
+				continue
+
+			self.__watchDescriptors[wd] = dirPath
+			files, subdirs = crawler.scanDirectory(dirPath, self.__fileFilter, self.__useExcludeFiles)
+			existingFiles += files
+			stack += subdirs
+
+		return existingFiles
+
+class PollingWatcher:
+	"""
+	Reports files which are created or modified under a set of directories,
+	by periodically re-scanning them. Used where inotify is not available,
+	or does not see changes (eg. on network mounts).
+	"""
+
+	def __init__(self, dirs:list, fileFilter=None, pollInterval:float=10.0, useExcludeFiles:bool=False):
+		self.__dirs = dirs
+		self.__fileFilter = fileFilter
+		self.__useExcludeFiles = useExcludeFiles
+		self.__pollInterval = pollInterval
+		self.__lastPollTime = time.monotonic()
+		self.__snapshot = self.__takeSnapshot()
+
+	def close(self):
+		pass
+
+	def readChangedFiles(self, timeout:float) -> list:
+		remaining = self.__lastPollTime + self.__pollInterval - time.monotonic()
+
+		if remaining > timeout:
+			time.sleep(timeout)
+			return []
+
+		time.sleep(max(remaining, 0))
+		self.__lastPollTime = time.monotonic()
+
+		snapshot = self.__takeSnapshot()
+		changedFiles = [path for path, identity in snapshot.items() if self.__snapshot.get(path) != identity]
+		self.__snapshot = snapshot
+
+		return changedFiles
+
+	def __takeSnapshot(self) -> dict:
+		snapshot = {}
+
+		for dirPath in self.__dirs:
+			for path in crawler.crawlFiles(dirPath, True, self.__fileFilter, self.__useExcludeFiles):
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+
+				snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+
+		return snapshot
+
+class FileWatcher:
+	"""
+	Watches directories for files that are created or modified, and yields
+	each file once it has stopped changing for settleTime seconds, so that
+	files which are still being written are not picked up part way through.
+	inotify is used where available, and polling otherwise. If useExcludeFiles is set,
+	files listed in the .exclude file of their directory are not yielded.
+	"""
+
+	def __init__(self, dirs:list, fileFilter=None, settleTime:float=2.0, pollInterval:float=10.0, forcePolling:bool=False, useExcludeFiles:bool=False):
+		self.__settleTime = settleTime
+		self.__useExcludeFiles = useExcludeFiles
+		self.__pending = {}
+
+		if forcePolling:
+			self.__watcher = PollingWatcher(dirs, fileFilter, pollInterval, useExcludeFiles)
+			return
+
+		try:
+			self.__watcher = InotifyWatcher(dirs, fileFilter, useExcludeFiles)
+		except OSError as ex:
+			print(f"Could not use inotify ({ex}), falling back to polling every {pollInterval} seconds", file=sys.stderr)
+			self.__watcher = PollingWatcher(dirs, fileFilter, pollInterval, useExcludeFiles)
+
+	def getMethod(self) -> str:
+		return "inotify" if isinstance(self.__watcher, InotifyWatcher) else "polling"
+
+	def watch(self, tickInterval:float=0.5):
+		# Generator which never finishes by itself. Yields the path of each file that
+		# has settled, or None every tickInterval seconds when there is nothing to report.
+		try:
+			while True:
+				now = time.monotonic()
+
+				for path in self.__watcher.readChangedFiles(tickInterval):
+					self.__pending[path] = (None, now)
+
+				settledFiles = self.__collectSettledFiles()
+
+				if settledFiles:
+					yield from settledFiles
+				else:
+					yield None
+		finally:
+			self.__watcher.close()
+
+	def __collectSettledFiles(self) -> list:
+		now = time.monotonic()
+		settledFiles = []
+
+		for path, (lastIdentity, lastChangeTime) in list(self.__pending.items()):
+			try:
+				stat = os.stat(path)
+			except OSError:
+				# Removed again before it settled, eg. a temporary file.
+				del self.__pending[path]
+				continue
+
+			identity = (stat.st_size, stat.st_mtime_ns)
+
+			if identity != lastIdentity:
+				self.__pending[path] = (identity, now)
+			elif now - lastChangeTime >= self.__settleTime:
+				del self.__pending[path]
+
+				# The .exclude file is read again for each settled file, rather than being cached,
+				# so that changes to it take effect straight away. Settled files are few and far between.
+				if not self.__isExcluded(path):
+					settledFiles.append(path)
+
+		return settledFiles
+
+	def __isExcluded(self, path:str) -> bool:
+		if not self.__useExcludeFiles:
+			return False
+
+		dirPath, fileName = os.path.split(path)
+		return fileName in crawler.readExcludedFiles(dirPath)
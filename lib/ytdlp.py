@@ -1,6 +1,9 @@
-import subprocess
+import asyncio
+import json
+import locale
+import os
 import re
-from . import config
+from . import config, instrumentation
 
 RE_VIDEO_ID_ONLY = re.compile(r"^\w+$", re.ASCII)
 RE_STANDARD_YOUTUBE_URL = re.compile(r"^(https://|www\.|https://www\.)youtube\.com/watch\?v=", re.ASCII)
@@ -10,22 +13,290 @@ RE_VIDEO_ID_SEGMENT = re.compile(r"([\w-]+)(&|$)", re.ASCII)
 RE_AUDIO_NAME_FROM_TRANSCODE = re.compile(r"^\[ExtractAudio\] Destination: (.+)$", re.MULTILINE)
 RE_FILE_EXISTED = re.compile(r"^\[ExtractAudio\] Not converting audio (.+); file is already in target format", re.MULTILINE)
 
-def runYTDLP(configFile:config.Config, args:list):
+# When several videos are downloaded by one yt-dlp process, it is asked to print one of these
+# lines as each video is finished with, so that the output can be mapped back to the video.
+BATCH_DONE_MARKER = "[ytdraft-done]"
+RE_BATCH_DONE = re.compile(r"^\[ytdraft-done\] ([\w-]+) (.+)$", re.ASCII)
+RE_VIDEO_ERROR = re.compile(r"^ERROR: \[[\w:]+\] ([\w-]+): ", re.ASCII)
+
+ARCHIVE_FILE_NAME = ".ytdraft-archive.txt"
+ARCHIVE_EXTRACTOR = "youtube"
+
+# yt-dlp can print long lines (eg. JSON or progress updates),
+# so lines are allowed to be longer than asyncio's default limit.
+MAX_LINE_LENGTH = 1024 * 1024
+
+class DownloadResult:
+	"""
+	The outcome of downloading one video, built up line by line
+	from the output of yt-dlp while it runs.
+	"""
+
+	def __init__(self, videoID:str):
+		self.__videoID = videoID
+		self.__returnCode = None
+		self.__outputLines = []
+		self.__errorLines = []
+		self.__audioName = None
+		self.__existingName = None
+		self.__fileExisted = False
+		self.__error = None
+
+	def getVideoID(self) -> str:
+		return self.__videoID
+
+	def getReturnCode(self) -> int:
+		return self.__returnCode
+
+	def setReturnCode(self, returnCode:int):
+		self.__returnCode = returnCode
+
+	def getOutput(self) -> str:
+		return "\n".join(self.__outputLines)
+
+	def getErrorOutput(self) -> str:
+		return "\n".join(self.__errorLines)
+
+	def getAudioName(self):
+		return self.__audioName
+
+	def getFileExisted(self) -> bool:
+		return self.__fileExisted
+
+	def getExistingName(self):
+		return self.__existingName
+
+	def getError(self):
+		# Returns a description of why yt-dlp could not be run, or None if it was.
+		return self.__error
+
+	def setError(self, error:str):
+		self.__error = error
+
+	def setAudioName(self, audioName:str):
+		self.__audioName = audioName
+
+	def setExistingName(self, existingName:str):
+		self.__fileExisted = True
+		self.__existingName = existingName
+
+	def addOutputLine(self, line:str):
+		self.__outputLines.append(line)
+
+		audioNameMatch = RE_AUDIO_NAME_FROM_TRANSCODE.match(line)
+
+		if audioNameMatch:
+			self.setAudioName(audioNameMatch.group(1))
+			return
+
+		existedMatch = RE_FILE_EXISTED.match(line)
+
+		if existedMatch:
+			self.setExistingName(existedMatch.group(1))
+
+	def addErrorLine(self, line:str):
+		self.__errorLines.append(line)
+
+class DownloadArchive:
+	"""
+	IDs of videos which have already been downloaded, stored one per line in the same
+	format as yt-dlp's --download-archive, so that the file can also be given to yt-dlp.
+	"""
+
+	def __init__(self, filePath:str):
+		self.__filePath = filePath
+		self.__videoIDs = set()
+
+		if os.path.isfile(filePath):
+			with open(filePath, "r", encoding="utf-8") as inFile:
+				for line in inFile:
+					fields = line.split()
+
+					if len(fields) == 2 and fields[0] == ARCHIVE_EXTRACTOR:
+						self.__videoIDs.add(fields[1])
+
+	def contains(self, videoID:str) -> bool:
+		return videoID in self.__videoIDs
+
+	def add(self, videoID:str):
+		if videoID in self.__videoIDs:
+			return
+
+		with open(self.__filePath, "a", encoding="utf-8") as outFile:
+			outFile.write(f"{ARCHIVE_EXTRACTOR} {videoID}\n")
+
+		self.__videoIDs.add(videoID)
+
+def getExecutable(configFile:config.Config) -> str:
 	ytdlp = configFile.getYTDLPOverridePath()
-	args = [ytdlp if ytdlp else "yt-dlp"] + args
-	return subprocess.run(args, shell=False, capture_output=True, text=True)
+	return ytdlp if ytdlp else "yt-dlp"
 
-def downloadYouTubeVideo(configFile:config.Config, videoID:str, outputDir:str, quality:int=320):
-	return runYTDLP(configFile, [
+def getDownloadArgs(videoIDs:list, outputDir:str, quality:int=320, batched:bool=False) -> list:
+	args = [
 		"--no-overwrites",
 		"--format", "bestaudio",
 		"--extract-audio",
 		"--audio-format", "mp3",
 		"--audio-quality", f"{quality}K",
 		"--paths", outputDir,
-		"--output", r"%(title)s.%(ext)s",
-		f"https://www.youtube.com/watch?v={videoID}"
-	])
+		"--output", r"%(title)s.%(ext)s"
+	]
+
+	if batched:
+		# Printing implies --quiet, so the marker lines are the only output other than errors.
+		args += [
+			"--no-abort-on-error",
+			"--print", f"after_move:{BATCH_DONE_MARKER} %(id)s %(filepath)j"
+		]
+
+	return args + [f"https://www.youtube.com/watch?v={videoID}" for videoID in videoIDs]
+
+async def __readLines(stream, addLine):
+	# Decoded in the same way as subprocess.run(text=True) would.
+	encoding = locale.getpreferredencoding(False)
+
+	while True:
+		line = await stream.readline()
+
+		if not line:
+			return
+
+		addLine(line.decode(encoding, errors="replace").rstrip("\r\n"))
+
+async def downloadYouTubeVideoAsync(configFile:config.Config, videoID:str, outputDir:str, quality:int=320) -> DownloadResult:
+	result = DownloadResult(videoID)
+
+	with instrumentation.phase(instrumentation.PHASE_DOWNLOAD):
+		process = await asyncio.create_subprocess_exec(
+			getExecutable(configFile),
+			*getDownloadArgs([videoID], outputDir, quality),
+			stdin=asyncio.subprocess.DEVNULL,
+			stdout=asyncio.subprocess.PIPE,
+			stderr=asyncio.subprocess.PIPE,
+			limit=MAX_LINE_LENGTH
+		)
+
+		# Both streams are read at once, so that neither pipe can fill up and block yt-dlp.
+		await asyncio.gather(
+			__readLines(process.stdout, result.addOutputLine),
+			__readLines(process.stderr, result.addErrorLine)
+		)
+
+		result.setReturnCode(await process.wait())
+
+	return result
+
+async def downloadYouTubeVideoBatchAsync(configFile:config.Config, videoIDs:list, outputDir:str, quality:int=320, onFinished=None) -> list:
+	"""
+	Downloads several videos with one yt-dlp process, so that its start up cost is only paid once.
+	Each video's result is worked out from the marker line that yt-dlp prints once it has finished
+	with the video, or from the error it reports for it, and onFinished is called with the result as
+	soon as either arrives. Returns the results in the same order as the video IDs.
+	"""
+
+	results = {videoID: DownloadResult(videoID) for videoID in videoIDs}
+	finished = set()
+	unmatchedErrorLines = []
+
+	# yt-dlp doesn't say whether a file already existed when printing, so this is checked against what was there beforehand.
+	existingNames = set(os.listdir(outputDir)) if os.path.isdir(outputDir) else set()
+
+	def finish(result:DownloadResult, returnCode:int):
+		if result.getVideoID() in finished:
+			return
+
+		finished.add(result.getVideoID())
+		result.setReturnCode(returnCode)
+
+		if onFinished:
+			onFinished(result)
+
+	def addOutputLine(line:str):
+		match = RE_BATCH_DONE.match(line)
+
+		if not match or match.group(1) not in results:
+			return
+
+		result = results[match.group(1)]
+		filePath = json.loads(match.group(2))
+
+		if os.path.basename(filePath) in existingNames:
+			result.setExistingName(filePath)
+		else:
+			result.setAudioName(filePath)
+
+		finish(result, 0)
+
+	def addErrorLine(line:str):
+		match = RE_VIDEO_ERROR.match(line)
+
+		if not match or match.group(1) not in results:
+			unmatchedErrorLines.append(line)
+			return
+
+		result = results[match.group(1)]
+		result.addErrorLine(line)
+		finish(result, 1)
+
+	with instrumentation.phase(instrumentation.PHASE_DOWNLOAD):
+		process = await asyncio.create_subprocess_exec(
+			getExecutable(configFile),
+			*getDownloadArgs(videoIDs, outputDir, quality, True),
+			stdin=asyncio.subprocess.DEVNULL,
+			stdout=asyncio.subprocess.PIPE,
+			stderr=asyncio.subprocess.PIPE,
+			limit=MAX_LINE_LENGTH
+		)
+
+		await asyncio.gather(
+			__readLines(process.stdout, addOutputLine),
+			__readLines(process.stderr, addErrorLine)
+		)
+
+		returnCode = await process.wait()
+
+	for result in results.values():
+		if result.getVideoID() not in finished:
+			for line in unmatchedErrorLines + ["yt-dlp did not report a result for this video"]:
+				result.addErrorLine(line)
+
+			finish(result, returnCode if returnCode != 0 else 1)
+
+	return [results[videoID] for videoID in videoIDs]
+
+async def downloadYouTubeVideosAsync(configFile:config.Config, videoIDs:list, outputDir:str, quality:int=320, jobs:int=1, onFinished=None, batchSize:int=1) -> list:
+	# Downloads up to the given number of batches of videos at once, with one yt-dlp process for each batch.
+	# Returns a result for each video, in the same order as the video IDs, and calls onFinished with each
+	# result as soon as that video has finished.
+	semaphore = asyncio.Semaphore(max(jobs, 1))
+	batchSize = max(batchSize, 1)
+
+	async def download(batch:list) -> list:
+		async with semaphore:
+			try:
+				if batchSize == 1:
+					results = [await downloadYouTubeVideoAsync(configFile, batch[0], outputDir, quality)]
+				else:
+					return await downloadYouTubeVideoBatchAsync(configFile, batch, outputDir, quality, onFinished)
+			except OSError as ex:
+				# Most likely yt-dlp is not installed, but let each video report it rather than stopping the others.
+				results = []
+
+				for videoID in batch:
+					results.append(DownloadResult(videoID))
+					results[-1].setError(f"Could not run yt-dlp: {ex}")
+
+		if onFinished:
+			for result in results:
+				onFinished(result)
+
+		return results
+
+	batches = [videoIDs[index:index + batchSize] for index in range(0, len(videoIDs), batchSize)]
+	return [result for results in await asyncio.gather(*[download(batch) for batch in batches]) for result in results]
+
+def downloadYouTubeVideos(configFile:config.Config, videoIDs:list, outputDir:str, quality:int=320, jobs:int=1, onFinished=None, batchSize:int=1) -> list:
+	return asyncio.run(downloadYouTubeVideosAsync(configFile, videoIDs, outputDir, quality, jobs, onFinished, batchSize))
 
 def extractVideoIDFromURL(url:str):
 	if RE_VIDEO_ID_ONLY.match(url):
@@ -47,18 +318,3 @@ def extractVideoIDFromURL(url:str):
 		raise ValueError(f"Could not infer video ID from YouTube URL \"{url}\"")
 
 	raise ValueError(f"Could not recognise YouTube URL \"{url}\"")
-
-def extractAudioNameFromResult(result:subprocess.CompletedProcess):
-	try:
-		transcodeResult = RE_AUDIO_NAME_FROM_TRANSCODE.search(result.stdout)
-	except Exception:
-		transcodeResult = None
-
-	if not transcodeResult:
-		raise ValueError("Could not parse extracted audio file name from subprocess result")
-
-	return transcodeResult.group(1)
-
-def fileAlreadyExistedOnDisk(result:subprocess.CompletedProcess):
-	match = RE_FILE_EXISTED.search(result.stdout)
-	return (bool(match), match.group(1) if match else None)
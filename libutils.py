@@ -1,4 +1,5 @@
 import argparse
+from lib import instrumentation
 from lib.music_library import MusicLibrary, KEY_TRACK_TITLE
 
 def addCheckOption(parser: argparse.ArgumentParser, optName: str, helpStr: str, defaultVal: bool = True):
@@ -21,36 +22,49 @@ def parseArgs():
 		help="Rekordbox library XML to read"
 	)
 
+	parser.add_argument(
+		"--no-snapshot",
+		action="store_true",
+		help="If set, the library XML is always parsed, rather than loading a snapshot of the parsed library "
+		"that was saved alongside it by a previous run."
+	)
+
 	addCheckOption(
 		parser,
 		"missing-from-everything",
 		"Check for any tracks missing from the 'Everything' playlist"
 	)
 
+	instrumentation.addArguments(parser)
+
 	return parser.parse_args()
 
 def checkMissingFromEverything(library: MusicLibrary):
-	everything = {id: True for id in library.playlist_track_ids(("DnB","Everything"))}
+	everything = ("DnB", "Everything")
 
-	playlistsToSkip = [
-		("DnB","Everything"),
+	playlistsToSkip = set([
+		everything,
 		("DnB", "[Import]"),
 		("DnB", "Drafts"),
-	]
+	])
 
-	missing = {}
+	# Raises if the playlist doesn't exist.
+	library.playlist_track_ids(everything)
 
-	for path in library.playlist_paths():
-		if path[0] != "DnB" or path in playlistsToSkip:
-			continue
+	playlistsToCheck = [path for path in library.playlist_paths() if path[0] == "DnB" and path not in playlistsToSkip]
+	missing = {}
 
+	for path in playlistsToCheck:
 		for id in library.playlist_track_ids(path):
+			if id in missing:
+				continue
+
 			title = library.collection[id][KEY_TRACK_TITLE]
 
 			if title.startswith("DRAFT ") or title == "--------------------":
 				continue
 
-			if id not in everything:
+			if not library.track_in_playlist(id, everything):
 				missing[id] = True
 
 	if missing:
@@ -73,11 +87,18 @@ def checkMissingFromEverything(library: MusicLibrary):
 	else:
 		print("No tracks were missing from the 'Everything' playlist")
 
+def run(args):
+	with instrumentation.phase(instrumentation.PHASE_LOAD):
+		library = MusicLibrary(args.path[0], use_snapshot=not args.no_snapshot)
+
+	if args.check_missing_from_everything == "yes":
+		with instrumentation.phase(instrumentation.PHASE_CHECKS):
+			checkMissingFromEverything(library)
+
 def main():
 	args = parseArgs()
-	library = MusicLibrary(args.path[0])
 
-	if args.check_missing_from_everything == "yes":
-		checkMissingFromEverything(library)
+	with instrumentation.instrument(args):
+		run(args)
 
 main()
@@ -1,5 +1,5 @@
 import argparse
-from lib import id3
+from lib.media_probe import MediaProbe
 
 def parseArgs():
 	parser = argparse.ArgumentParser(
@@ -17,7 +17,7 @@ def parseArgs():
 
 def main():
 	args = parseArgs()
-	tags = id3.dump_tag_string_dict(args.file[0])
+	tags = MediaProbe(args.file[0]).getTagDict()
 
 	for key in tags:
 		print(f"{key}: {tags[key]}")
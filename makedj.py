@@ -1,13 +1,45 @@
 import argparse
+import contextlib
 import os
 import shutil
 import traceback
 import sys
-from lib import config, validation, utils, ffmpeg, id3
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from lib import config, validation, utils, ffmpeg, id3, crawler, watcher, audio_hash, file_transfer, transcode_cache, transcode_progress, transfer_plan, instrumentation, jsonl_output
 from lib.transfer_result import *
-from mutagen import id3 as mutID3
+from lib.media_probe import MediaProbe
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
+CATEGORY_UP_TO_DATE = "Up to date"
+CATEGORY_DUPLICATE = "Skipped (duplicate audio)"
+
+# Parent directories of output files that were removed after a failed transfer.
+# These are only pruned once all transfers have finished, so that a directory
+# is never removed while another worker is about to write into it.
+REMOVED_OUTPUT_DIRS = set()
+REMOVED_OUTPUT_DIRS_LOCK = threading.Lock()
+
+# Set up by main() if transcoded files should be cached.
+TRANSCODE_CACHE = None
+
+# Set up by main() to report on the progress of transcodes.
+TRANSCODE_PROGRESS = None
+
+# Options which affect the outcome of planning, so are stored in a plan file and restored when it is executed.
+PLAN_OPTIONS = [
+	"input_root",
+	"output_root",
+	"recursive",
+	"link_mode",
+	"sync",
+	"allow_overwrite",
+	"skip_duplicates",
+	"allow_low_bitrate",
+	"allow_missing_metadata",
+	"allow_long_duration"
+]
 
 def parseArgs():
 	parser = argparse.ArgumentParser(
@@ -50,6 +82,28 @@ def parseArgs():
 		help="If set, any folders provided will be searched recursively."
 	)
 
+	parser.add_argument(
+		"--watch",
+		action="store_true",
+		help="If set, runs until interrupted, watching the input root and the configured Draft directory for "
+		"new or modified files and processing each one once it has finished being written. Any files or list "
+		"files provided are ignored. Combine with --sync to re-transfer files which are modified."
+	)
+
+	parser.add_argument(
+		"--watch-polling",
+		action="store_true",
+		help="If set, --watch periodically re-scans directories rather than using inotify. This is also the "
+		"fallback where inotify is not available."
+	)
+
+	parser.add_argument(
+		"--settle-time",
+		type=float,
+		default=2.0,
+		help="Number of seconds a file must remain unchanged before --watch processes it (default: %(default)s)."
+	)
+
 	parser.add_argument(
 		"--commit",
 		action="store_true",
@@ -57,12 +111,95 @@ def parseArgs():
 		"performed, so that the results of running the command can be inspected."
 	)
 
+	parser.add_argument(
+		"--plan-out",
+		metavar="PATH",
+		help="Writes the outcome of a dry run for each file (the action to take, or why the file can't be "
+		"transferred) to the given plan file, along with the size and modification time of each source. Can't be "
+		"combined with --commit."
+	)
+
+	parser.add_argument(
+		"--execute-plan",
+		metavar="PATH",
+		help="Carries out a plan written by --plan-out, rather than discovering and validating the files again. "
+		"Sources whose size or modification time has changed since planning are validated again, as are any "
+		"whose destination has changed in a way that affects the outcome. The input and output roots, the link "
+		"mode, whether folders are searched recursively, and the options which affect validation and overwriting "
+		"are taken from the plan. Implies --commit."
+	)
+
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Number of files to validate, copy or transcode concurrently. Defaults to the number of CPUs "
+		"(%(default)s)."
+	)
+
+	parser.add_argument(
+		"--scan-threads",
+		type=int,
+		default=1,
+		help="Number of threads to list directories on when searching recursively. Values above 1 help on "
+		"high-latency network mounts, but files are then processed in a non-deterministic order. Defaults to 1."
+	)
+
+	parser.add_argument(
+		"--link-mode",
+		choices=file_transfer.LINK_MODES,
+		default=file_transfer.LINK_MODE_AUTO,
+		help="How MP3s which don't need transcoding are transferred. \"copy\" copies the data, within the kernel "
+		"where possible. \"reflink\" makes a copy-on-write clone, which takes no extra space, and fails if the file "
+		"system does not support it. \"hardlink\" links the destination to the source, so that the two are the same "
+		"file, and fails if they are on different file systems. \"auto\" makes a reflink where possible, and copies "
+		"otherwise. Drafts are always copied, as their title is rewritten. Defaults to %(default)s."
+	)
+
+	parser.add_argument(
+		"--transcode-cache",
+		help="Directory to cache transcoded files in, so that a source whose audio, tags and transcode settings "
+		"have been seen before is copied from the cache rather than being transcoded again (eg. after being moved, "
+		"or when transferring to a different output root). Defaults to the \"transcode-cache\" directory in "
+		"config.json, if there is one; otherwise, no cache is used."
+	)
+
+	parser.add_argument(
+		"--no-transcode-cache",
+		action="store_true",
+		help="If set, the transcode cache is not used, even if one is configured."
+	)
+
+	parser.add_argument(
+		"--cache-max-size",
+		type=utils.parseSize,
+		default=transcode_cache.DEFAULT_MAX_SIZE,
+		help="Maximum total size of the transcode cache, eg. \"500M\" or \"20G\". The least recently used files are "
+		f"removed from the cache when it grows over this size. Defaults to {utils.formatSize(transcode_cache.DEFAULT_MAX_SIZE)}."
+	)
+
 	parser.add_argument(
 		"--allow-overwrite",
 		action="store_true",
 		help="If set, allows overwriting destination files when copying or transcoding."
 	)
 
+	parser.add_argument(
+		"--sync",
+		action="store_true",
+		help="If set, sources whose destination file is newer than the source (and, for plain copies, is the "
+		"same size) are skipped without being validated. Destinations which are out of date are overwritten."
+	)
+
+	parser.add_argument(
+		"--skip-duplicates",
+		action="store_true",
+		help="If set, the audio data of each source is hashed, ignoring any tags. Sources are skipped if their audio "
+		"is the same as an earlier source, or as a file whose transferred copy already exists in the output root. "
+		"Hashes are cached alongside the config file, and are shared with the dedupe script."
+	)
+
 	parser.add_argument(
 		"--allow-low-bitrate",
 		action="store_true",
@@ -81,10 +218,13 @@ def parseArgs():
 		help="If set, allows copying/transcoding MP3s with a length over 10 minutes."
 	)
 
+	jsonl_output.addArgument(parser, "the result for each file")
+	instrumentation.addArguments(parser)
+
 	return parser.parse_args()
 
 def loadConfig():
-	return config.Config(os.path.join(SCRIPT_DIR, "config.json"))
+	return config.Config(config.getConfigFilePath(SCRIPT_DIR))
 
 def prunePathsOutsideRoot(configFile, root:str, paths:list):
 	outPaths = []
@@ -104,77 +244,177 @@ def prunePathsOutsideRoot(configFile, root:str, paths:list):
 
 	return outPaths
 
-def fileTypeIsSupported(path:str):
-	return os.path.splitext(path)[1].lower() in validation.ALL_MEDIA_FORMATS and not os.path.basename(path).startswith(".")
+def discoverFiles(args, configFile:config.Config, paths:list):
+	# Yields (source path, destination path) as files are found on disk. If a provided
+	# path does not exist, it is yielded with a destination path of None.
+	seenPaths = set()
 
-def getExcludedFiles(dirPath:str):
-	if os.path.isfile(dirPath):
-		return []
-
-	try:
-		with open(os.path.join(dirPath, ".exclude"), "r") as inFile:
-			return [line.strip() for line in inFile.readlines()]
-	except Exception:
-		return []
+	for path in paths:
+		absPath = path if os.path.isabs(path) else os.path.abspath(os.path.join(args.input_root, path))
 
-def findFilesInDirectory(absPath:str):
-	if os.path.isfile(absPath):
-		return [absPath]
+		if not os.path.isfile(absPath) and not os.path.isdir(absPath):
+			if absPath not in seenPaths:
+				seenPaths.add(absPath)
+				yield (absPath, None)
 
-	excludedFiles = getExcludedFiles(absPath)
-	outFiles = []
+			continue
 
-	if os.path.isdir(absPath):
-		for contents in os.listdir(absPath):
-			fullPath = os.path.join(absPath, contents)
+		for sourcePath in crawler.crawlFiles(absPath, args.recursive, validation.fileTypeIsSupported, True, args.scan_threads):
+			if sourcePath in seenPaths:
+				continue
 
-			if os.path.isfile(fullPath) and fileTypeIsSupported(contents) and contents not in excludedFiles:
-				outFiles.append(fullPath)
+			seenPaths.add(sourcePath)
+			yield (sourcePath, getDestPath(args, configFile, sourcePath))
 
-	return outFiles
+def getDestPath(args, configFile:config.Config, sourcePath:str) -> str:
+	if utils.fileIsDraft(configFile, sourcePath):
+		return os.path.join(args.output_root, "_Draft", os.path.splitext(os.path.basename(sourcePath))[0] + ".mp3")
 
-def findFilesResursively(absPath: str):
-	if os.path.isfile(absPath):
-		return [absPath]
+	return os.path.join(args.output_root, os.path.relpath(sourcePath, args.input_root))
 
-	outFiles = []
+def watchFiles(args, configFile:config.Config):
+	# Yields (source path, destination path) for each new or modified file in the
+	# Personal and Draft directories, or None periodically if nothing has changed.
+	dirs = [args.input_root, configFile.getDraftDirPath()]
+	fileWatcher = watcher.FileWatcher(dirs, validation.fileTypeIsSupported, args.settle_time, forcePolling=args.watch_polling, useExcludeFiles=True)
 
-	if os.path.isdir(absPath):
-		for root, dirs, files in os.walk(absPath):
-			excludedFiles = getExcludedFiles(root)
+	print(f"Watching for changes using {fileWatcher.getMethod()}:")
 
-			for file in files:
-				if fileTypeIsSupported(file) and file not in excludedFiles:
-					outFiles.append(os.path.join(root, file))
+	for dirPath in dirs:
+		print(f"  {dirPath}")
 
-	return outFiles
+	print("Press Ctrl+C to stop.")
+	print()
 
-def buildTargetFileList(configFile, root:str, paths:list, recursive:bool):
-	filePaths = {}
-	ignoredPaths = {}
+	for sourcePath in fileWatcher.watch():
+		if sourcePath is None:
+			yield None
+		elif utils.isChildPath(args.output_root, sourcePath):
+			# Don't feed our own output back in, if it happens to be inside a watched directory.
+			continue
+		elif utils.fileIsDraft(configFile, sourcePath) or utils.isChildPath(args.input_root, sourcePath):
+			yield (sourcePath, getDestPath(args, configFile, sourcePath))
 
-	for path in paths:
-		absPath = path if os.path.isabs(path) else os.path.abspath(os.path.join(root, path))
+def findExistingCopy(args, configFile:config.Config, hashIndex:audio_hash.AudioHashIndex, sourcePath:str, destPath:str, audioHash:str):
+	# Returns the path of a file in the output root which has the same audio as the
+	# source, other than the source's own destination, or None if there isn't one.
+	ownDestPath = os.path.normcase(os.path.abspath(getFinalDestPath(sourcePath, destPath)))
 
-		if not os.path.isfile(absPath) and not os.path.isdir(absPath):
-			ignoredPaths[absPath] = True
+	for path in hashIndex.findPaths(audioHash):
+		if path == sourcePath:
 			continue
 
-		if recursive:
-			resolvedPaths = findFilesResursively(absPath)
+		if utils.isChildPath(args.output_root, path):
+			copyPath = path
+		elif utils.fileIsDraft(configFile, path) or utils.isChildPath(args.input_root, path):
+			copyPath = getFinalDestPath(path, getDestPath(args, configFile, path))
 		else:
-			resolvedPaths = findFilesInDirectory(absPath)
+			continue
+
+		if os.path.normcase(os.path.abspath(copyPath)) != ownDestPath and os.path.isfile(copyPath):
+			return copyPath
+
+	return None
+
+def getTransferredCopy(canonicalFutures:dict, sourcePath:str):
+	# Waits for the source to be dealt with, and returns the path of the file which holds its
+	# audio in the output root, or None if it failed. It was provided to processFiles() before
+	# the file being checked, so has already been submitted, and waiting on it can't deadlock.
+	result = canonicalFutures[sourcePath].result()
+
+	if not result.getSuccessful():
+		return None
+
+	return result.getDestPath()
+
+def findPlannedCopy(hashIndex:audio_hash.AudioHashIndex, canonicalFutures:dict, sourcePath:str, audioHash:str):
+	# Returns the destination of an earlier file with a planned action which has the same audio as the
+	# source, once it has been transferred, or None if there isn't one. Files with a planned action
+	# aren't hashed again, so the hashes recorded for them when the plan was made are used.
+	for path in hashIndex.findPaths(audioHash):
+		if path != sourcePath and canonicalFutures.get(path) is not None:
+			duplicatePath = getTransferredCopy(canonicalFutures, path)
+
+			if duplicatePath is not None:
+				return duplicatePath
+
+	return None
+
+def checkForDuplicate(args, configFile:config.Config, hashIndex:audio_hash.AudioHashIndex, seenHashes:dict, canonicalFutures:dict, file, hashFuture:Future):
+	# Returns the file unchanged if it should be processed, or a result if it is a duplicate.
+	if hashFuture is None:
+		return file
+
+	sourcePath, destPath = file
+	audioHash = hashIndex.finish(sourcePath, hashFuture)
+
+	if audioHash is None:
+		# Let validation report the problem with the file.
+		return file
+
+	duplicatePath = None
+	canonicalPath = seenHashes.get(audioHash)
+
+	if canonicalPath is not None:
+		# An earlier source only counts if it was transferred (eg. it may have failed validation
+		# where this one passes, as the hash ignores tags). If not, this source may take its place.
+		duplicatePath = getTransferredCopy(canonicalFutures, canonicalPath)
+
+		if duplicatePath is None:
+			del seenHashes[audioHash]
+			del canonicalFutures[canonicalPath]
+
+	if duplicatePath is None:
+		duplicatePath = findPlannedCopy(hashIndex, canonicalFutures, sourcePath, audioHash)
+
+	if duplicatePath is None:
+		duplicatePath = findExistingCopy(args, configFile, hashIndex, sourcePath, destPath, audioHash)
+
+	if duplicatePath is not None:
+		return TransferResult(TRANSFER_TYPE_DUPLICATE, sourcePath, duplicatePath, TRANSFER_ERROR_NONE)
+
+	seenHashes[audioHash] = sourcePath
+
+	# Filled in by processFiles() once the file has been submitted.
+	canonicalFutures[sourcePath] = None
+	return file
+
+def skipDuplicateFiles(args, configFile:config.Config, hashIndex:audio_hash.AudioHashIndex, canonicalFutures:dict, files):
+	# Passes through the files provided, replacing any which are duplicates with a result saying so.
+	# Files are hashed concurrently, but are checked in the order they were provided, so which one
+	# of a set of duplicates gets transferred does not depend on how long each one took to hash.
+	# The first of a set is only treated as the original once it has been transferred successfully.
+	# Results, and files with a planned action, are passed through in order without being hashed.
+	seenHashes = {}
+	inFlight = deque()
+	maxInFlight = max(args.jobs, 1) * 4
+
+	for file in files:
+		if isinstance(file, TransferResult):
+			inFlight.append((file, None))
+		elif file is not None and len(file) > 2:
+			# Its future is recorded, so that files which are hashed can be checked against it.
+			canonicalFutures[file[0]] = None
+			inFlight.append((file, None))
+		elif file is not None:
+			sourcePath, destPath = file
+			inFlight.append((file, hashIndex.submit(sourcePath) if destPath is not None else None))
 
-		for resolvedPath in resolvedPaths:
-			pathKey = resolvedPath if utils.fileIsDraft(configFile, resolvedPath) else os.path.relpath(resolvedPath, root)
-			filePaths[pathKey] = True
+		while inFlight and (len(inFlight) >= maxInFlight or inFlight[0][1] is None or inFlight[0][1].done()):
+			yield checkForDuplicate(args, configFile, hashIndex, seenHashes, canonicalFutures, *inFlight.popleft())
 
-	return (list(filePaths.keys()), list(ignoredPaths.keys()))
+		if file is None:
+			yield None
 
-def validateFile(args, configFile:config.Config, path:str, sourcePath:str=None):
-	validationErrors = validation.validateFile(path)
+	while inFlight:
+		yield checkForDuplicate(args, configFile, hashIndex, seenHashes, canonicalFutures, *inFlight.popleft())
 
-	if utils.fileIsDraft(configFile, sourcePath if sourcePath is not None else path):
+def validateFile(args, configFile:config.Config, path:str, sourcePath:str=None, probe:MediaProbe=None):
+	validationErrors = validation.validateProbe(probe) if probe else validation.validateFile(path)
+	return relaxValidationErrors(args, configFile, sourcePath if sourcePath is not None else path, validationErrors)
+
+def relaxValidationErrors(args, configFile:config.Config, sourcePath:str, validationErrors:list):
+	if utils.fileIsDraft(configFile, sourcePath):
 		# File is a draft, so restrictions are more lax.
 		restrictionsToRemove = set([
 			validation.MISSING_BASIC_METADATA,
@@ -194,18 +434,55 @@ def validateFile(args, configFile:config.Config, path:str, sourcePath:str=None):
 
 	return validationErrors
 
-def performPostTransferFixups(configFile:config.Config, sourcePath:str, destPath:str):
+def removeOutputFile(path:str):
+	os.unlink(path)
+
+	with REMOVED_OUTPUT_DIRS_LOCK:
+		REMOVED_OUTPUT_DIRS.add(os.path.dirname(path))
+
+def pruneRemovedOutputDirs(args):
+	# Deepest directories first, so that parents are empty by the time they are checked.
+	for dirPath in sorted(REMOVED_OUTPUT_DIRS, key=len, reverse=True):
+		utils.removeEmptyDirs(dirPath, args.output_root)
+
+	REMOVED_OUTPUT_DIRS.clear()
+
+def getDraftTitle(sourcePath:str, title=None) -> str:
+	if title is None:
+		title = os.path.splitext(os.path.basename(sourcePath))[0]
+
+	return f"DRAFT {title}"
+
+def applyDraftTitle(tags, sourcePath:str):
+	from mutagen import id3 as mutID3
+
+	title = getDraftTitle(sourcePath, tags[id3.FRAME_TRACK_TITLE] if id3.FRAME_TRACK_TITLE in tags else None)
+
+	tags.delall(id3.FRAME_TRACK_TITLE)
+	tags.add(mutID3.TIT2(encoding=3, text=title))
+
+def performPostTransferFixups(configFile:config.Config, sourcePath:str, destPath:str, probe:MediaProbe=None):
 	if utils.fileIsDraft(configFile, sourcePath):
-		id3tags = mutID3.ID3(destPath)
+		with instrumentation.phase(instrumentation.PHASE_FIXUP, instrumentation.getFileType(destPath)):
+			if probe is None:
+				probe = MediaProbe(destPath)
 
-		if id3.FRAME_TRACK_TITLE in id3tags:
-			title = id3tags[id3.FRAME_TRACK_TITLE]
-		else:
-			title = os.path.splitext(os.path.basename(sourcePath))[0]
+			if not probe.hasID3Tags():
+				probe.getMediaFile().add_tags()
+
+			applyDraftTitle(probe.getTags(), sourcePath)
+			probe.getMediaFile().save()
 
-		id3tags.delall(id3.FRAME_TRACK_TITLE)
-		id3tags.add(mutID3.TIT2(encoding=3, text=f"DRAFT {title}"))
-		id3tags.save()
+def copyDraftFile(sourcePath:str, destPath:str):
+	# The destination is written with its new tags in one pass, rather than copying
+	# the source and then rewriting the copy: the new ID3v2 tag is written first,
+	# followed by the audio from the source, and then a new ID3v1 tag if it had one.
+	tags, audioStart, audioEnd, hasID3v1 = id3.loadTagsAndAudioRange(sourcePath)
+	applyDraftTitle(tags, sourcePath)
+	prefix, suffix = id3.renderTags(tags, hasID3v1)
+
+	file_transfer.spliceFile(destPath, sourcePath, prefix, audioStart, audioEnd, suffix)
+	shutil.copymode(sourcePath, destPath)
 
 def transferFile(args, configFile, sourcePath:str, destPath:str) -> TransferResult:
 	result = TransferResult(TRANSFER_TYPE_COPY, sourcePath, destPath)
@@ -219,7 +496,7 @@ def transferFile(args, configFile, sourcePath:str, destPath:str) -> TransferResu
 	existed = os.path.isfile(destPath)
 
 	if existed:
-		if args.allow_overwrite:
+		if args.allow_overwrite or args.sync:
 			if args.commit:
 				os.unlink(destPath)
 		else:
@@ -229,8 +506,19 @@ def transferFile(args, configFile, sourcePath:str, destPath:str) -> TransferResu
 	try:
 		if args.commit:
 			os.makedirs(os.path.dirname(destPath), exist_ok=True)
-			shutil.copy(sourcePath, destPath)
-			performPostTransferFixups(configFile, sourcePath, destPath)
+
+			with instrumentation.phase(instrumentation.PHASE_COPY, instrumentation.getFileType(sourcePath)):
+				if utils.fileIsDraft(configFile, sourcePath):
+					copyDraftFile(sourcePath, destPath)
+				else:
+					file_transfer.copyFile(sourcePath, destPath, args.link_mode)
+	except OSError as ex:
+		if ex.errno in file_transfer.UNSUPPORTED_ERRNOS and args.link_mode in (file_transfer.LINK_MODE_REFLINK, file_transfer.LINK_MODE_HARDLINK):
+			result.setTransferError(TRANSFER_ERROR_INVALID_DESTINATION)
+			result.setTransferErrorReason(f"Could not {args.link_mode} to the destination: {ex.strerror}")
+		else:
+			result.setTransferError(TRANSFER_ERROR_UNHANDLED)
+			result.setTransferErrorReason(traceback.format_exc())
 	except Exception:
 		result.setTransferError(TRANSFER_ERROR_UNHANDLED)
 		result.setTransferErrorReason(traceback.format_exc())
@@ -238,14 +526,43 @@ def transferFile(args, configFile, sourcePath:str, destPath:str) -> TransferResu
 	result.setReplacedTargetFile(existed)
 	return result
 
-def transcodeFile(args, configFile:config.Config, sourcePath:str, destPath:str) -> TransferResult:
+def predictTranscodedTags(sourceProbe:MediaProbe):
+	# Returns the basic tags that ffmpeg will write to an MP3 transcoded from the source,
+	# or None if they can't be determined and so the MP3 must be probed once written.
+	if sourceProbe is None:
+		return None
+
+	# Below 32kHz, MP3s are MPEG-2, which can't be encoded at the requested bitrate.
+	if sourceProbe.getSampleRate() < 32000:
+		return None
+
+	return sourceProbe.getBasicTagDict()
+
+def openTranscodeCache(args, configFile:config.Config):
+	if args.no_transcode_cache or not args.commit:
+		return None
+
+	dirPath = args.transcode_cache if args.transcode_cache else configFile.getTranscodeCacheDirPath()
+	return transcode_cache.TranscodeCache(dirPath, args.cache_max_size) if dirPath else None
+
+def getTranscodeCacheKey(configFile:config.Config, sourcePath:str, sourceProbe:MediaProbe, quality:int, metadata:dict) -> str:
+	audioHash = audio_hash.hashAudioPayload(sourcePath)
+	tagDigest = transcode_cache.tagDigest(sourceProbe)
+	return transcode_cache.makeKey(audioHash, tagDigest, quality, ffmpeg.getVersionDigest(configFile), metadata)
+
+def getCacheLinkMode(args) -> str:
+	# Files in the cache must never be hard linked, so that changing a transferred
+	# file (or an entry being evicted) can't affect anything else.
+	return file_transfer.LINK_MODE_AUTO if args.link_mode == file_transfer.LINK_MODE_HARDLINK else args.link_mode
+
+def transcodeFile(args, configFile:config.Config, sourcePath:str, destPath:str, sourceProbe:MediaProbe=None) -> TransferResult:
 	result = TransferResult(TRANSFER_TYPE_TRANSCODE, sourcePath, destPath)
 	result.setTransferError(TRANSFER_ERROR_NONE)
 
 	existed = os.path.isfile(destPath)
 
 	if existed:
-		if args.allow_overwrite:
+		if args.allow_overwrite or args.sync:
 			if args.commit:
 				os.unlink(destPath)
 		else:
@@ -257,22 +574,78 @@ def transcodeFile(args, configFile:config.Config, sourcePath:str, destPath:str)
 	if args.commit:
 		try:
 			os.makedirs(os.path.dirname(destPath), exist_ok=True)
-			quality = utils.MP3_QUALITY_DRAFT if utils.fileIsDraft(configFile, sourcePath) else utils.MP3_QUALITY_STD
-			transcodeResult = ffmpeg.toMP3(configFile, sourcePath, destPath, quality)
-			performPostTransferFixups(configFile, sourcePath, destPath)
-
-			try:
-				# Re-validate the MP3 to check that it has the required ID3 tags.
-				# It's easier to do this than to write separate tag validation
-				# for the different file formats we may encounter before transcoding.
-				validationErrors = validateFile(args, configFile, destPath, sourcePath)
-			except Exception:
-				utils.removeFileAndEmptyParentDirs(destPath, args.output_root)
-				raise
-
-			if validationErrors:
+			isDraft = utils.fileIsDraft(configFile, sourcePath)
+			quality = utils.MP3_QUALITY_DRAFT if isDraft else utils.MP3_QUALITY_STD
+			predictedTags = predictTranscodedTags(sourceProbe)
+			metadata = None
+
+			if isDraft and predictedTags is not None:
+				# Have ffmpeg write the draft title, rather than rewriting the tags afterwards.
+				predictedTags[id3.FRAME_TRACK_TITLE] = getDraftTitle(sourcePath, predictedTags.get(id3.FRAME_TRACK_TITLE))
+				metadata = {"title": predictedTags[id3.FRAME_TRACK_TITLE]}
+
+			# The cache can only be used if the tags of the output are known, as they
+			# are what determine whether a cached file would pass validation.
+			cacheKey = None
+
+			fileType = instrumentation.getFileType(sourcePath)
+
+			if TRANSCODE_CACHE and predictedTags is not None:
+				with instrumentation.phase(instrumentation.PHASE_CACHE, fileType):
+					cacheKey = getTranscodeCacheKey(configFile, sourcePath, sourceProbe, quality, metadata)
+
+			if cacheKey:
+				with instrumentation.phase(instrumentation.PHASE_CACHE, fileType):
+					result.setFromCache(TRANSCODE_CACHE.fetch(cacheKey, destPath, getCacheLinkMode(args)))
+
+			if result.getFromCache():
+				TRANSCODE_PROGRESS.skipJob()
+				returncode = 0
+			else:
+				jobID = TRANSCODE_PROGRESS.startJob(sourceProbe.getDuration() if sourceProbe else None)
+				returncode = None
+
+				try:
+					with instrumentation.phase(instrumentation.PHASE_TRANSCODE, fileType):
+						returncode = ffmpeg.toMP3(
+							configFile,
+							sourcePath,
+							destPath,
+							quality,
+							args.jobs > 1,
+							metadata,
+							TRANSCODE_PROGRESS.getCallback(jobID)
+						).returncode
+				finally:
+					TRANSCODE_PROGRESS.finishJob(jobID, returncode == 0)
+
+			if returncode == 0:
+				try:
+					with instrumentation.phase(instrumentation.PHASE_VALIDATION, instrumentation.getFileType(destPath)):
+						if predictedTags is not None:
+							# The MP3 is validated from what is already known about it, so
+							# it does not need to be read back after ffmpeg has written it.
+							transcodeErrors = validation.validateTranscodedMP3(sourceProbe.getDuration(), quality * 1000, predictedTags)
+							validationErrors = relaxValidationErrors(args, configFile, sourcePath, transcodeErrors)
+						else:
+							# Probe the MP3 once, and use the same probe for the fixups and for
+							# re-validating the MP3 to check that it has the required ID3 tags.
+							probe = MediaProbe(destPath)
+							performPostTransferFixups(configFile, sourcePath, destPath, probe)
+							validationErrors = validateFile(args, configFile, destPath, sourcePath, probe)
+				except Exception:
+					removeOutputFile(destPath)
+					raise
+
+				if validationErrors:
 					# Don't leave the MP3 lying around.
-					utils.removeFileAndEmptyParentDirs(destPath, args.output_root)
+					removeOutputFile(destPath)
+				elif cacheKey and not result.getFromCache():
+					with instrumentation.phase(instrumentation.PHASE_CACHE, fileType):
+						TRANSCODE_CACHE.store(cacheKey, destPath, getCacheLinkMode(args))
+			elif os.path.isfile(destPath):
+				# Don't leave a partially written MP3 lying around either.
+				removeOutputFile(destPath)
 		except FileNotFoundError:
 			result.setTransferError(TRANSFER_ERROR_TRANSCODING_FAILED)
 
@@ -287,9 +660,9 @@ def transcodeFile(args, configFile:config.Config, sourcePath:str, destPath:str)
 			result.setTransferErrorReason(str(ex))
 			return result
 
-		if transcodeResult.returncode != 0:
+		if returncode != 0:
 			result.setTransferError(TRANSFER_ERROR_TRANSCODING_FAILED)
-			result.setTransferErrorReason(f"Transcode operation returned error code {transcodeResult.returncode}")
+			result.setTransferErrorReason(f"Transcode operation returned error code {returncode}")
 			return result
 
 	result.setReplacedTargetFile(existed)
@@ -300,16 +673,71 @@ def transcodeFile(args, configFile:config.Config, sourcePath:str, destPath:str)
 
 	return result
 
-def processFile(args, configFile:config.Config, sourcePath:str, destPath:str) -> TransferResult:
+def getFinalDestPath(sourcePath:str, destPath:str) -> str:
+	# Anything that is not already an MP3 gets transcoded to one.
+	if os.path.splitext(sourcePath)[1].lower() == ".mp3":
+		return destPath
+
+	return os.path.splitext(destPath)[0] + ".mp3"
+
+def destinationIsUpToDate(configFile:config.Config, sourcePath:str, destPath:str) -> bool:
+	if not os.path.isfile(destPath):
+		return False
+
+	# A hard linked destination is the source, so has the same modification time.
+	if os.path.samefile(sourcePath, destPath):
+		return True
+
+	if not utils.isDestNewer(sourcePath, destPath):
+		return False
+
+	destSize = os.path.getsize(destPath)
+
+	if destSize == 0:
+		return False
+
+	# Plain copies of MP3s should be identical to their source. Transcodes
+	# and drafts are rewritten, so their size can't be compared.
+	if os.path.splitext(sourcePath)[1].lower() == ".mp3" and not utils.fileIsDraft(configFile, sourcePath):
+		return destSize == os.path.getsize(sourcePath)
+
+	return True
+
+def probeSource(sourcePath:str):
+	try:
+		return MediaProbe(sourcePath)
+	except Exception:
+		return None
+
+def processFile(args, configFile:config.Config, sourcePath:str, destPath:str, plannedAction:str=None) -> TransferResult:
+	# If a planned action is given, the source has already been validated, so the action is carried out directly.
 	result = TransferResult(TRANSFER_TYPE_UNKNOWN, sourcePath, destPath)
 
 	try:
-		validationErrors = validateFile(args, configFile, sourcePath)
+		if args.sync:
+			finalDestPath = getFinalDestPath(sourcePath, destPath)
+
+			if destinationIsUpToDate(configFile, sourcePath, finalDestPath):
+				if plannedAction == transfer_plan.ACTION_TRANSCODE:
+					TRANSCODE_PROGRESS.skipJob()
+
+				return TransferResult(TRANSFER_TYPE_SKIP, sourcePath, finalDestPath, TRANSFER_ERROR_NONE)
+
+		if plannedAction == transfer_plan.ACTION_COPY:
+			return transferFile(args, configFile, sourcePath, destPath)
+
+		if plannedAction == transfer_plan.ACTION_TRANSCODE:
+			# Probing the source is cheap next to transcoding it, and lets the transcode cache be used.
+			return transcodeFile(args, configFile, sourcePath, os.path.splitext(destPath)[0] + ".mp3", probeSource(sourcePath))
+
+		with instrumentation.phase(instrumentation.PHASE_VALIDATION, instrumentation.getFileType(sourcePath)):
+			sourceProbe, validationErrors = validation.probeAndValidateFile(sourcePath)
+			validationErrors = relaxValidationErrors(args, configFile, sourcePath, validationErrors)
 
 		if not validationErrors:
 			result = transferFile(args, configFile, sourcePath, destPath)
 		elif validationErrors == [validation.NOT_AN_MP3]:
-			result = transcodeFile(args, configFile, sourcePath, os.path.splitext(destPath)[0] + ".mp3")
+			result = transcodeFile(args, configFile, sourcePath, os.path.splitext(destPath)[0] + ".mp3", sourceProbe)
 		else:
 			result.setTransferError(TRANSFER_ERROR_VALIDATION_FAILED)
 			result.setTransferErrorReason("; ".join(validationErrors))
@@ -319,31 +747,162 @@ def processFile(args, configFile:config.Config, sourcePath:str, destPath:str) ->
 
 	return result
 
-def addToResults(success:dict, failure:dict, result:TransferResult):
-	error = result.getTransferError()
-	category = "Unknown error"
+def processFileAfter(previous:Future, args, configFile:config.Config, sourcePath:str, destPath:str, plannedAction:str=None) -> TransferResult:
+	if previous is not None:
+		# The previous file has the same destination, so must finish first.
+		# It was submitted earlier, so is already running or has finished.
+		wait([previous])
 
-	if error == TRANSFER_ERROR_NONE:
-		target = success
+	return processFile(args, configFile, sourcePath, destPath, plannedAction)
 
-		if result.getTransferType() == TRANSFER_TYPE_TRANSCODE:
-			category = "Transcoded (overwritten)" if result.getReplacedTargetFile() else "Transcoded"
-		else:
-			category = "Overwritten" if result.getReplacedTargetFile() else "Copied"
-	else:
-		target = failure
-		category = error
+def destinationGroupKey(destPath:str) -> str:
+	# Sources which differ only by extension (or by case, on case insensitive
+	# file systems) end up at the same destination once transcoded to MP3.
+	return os.path.normpath(os.path.splitext(destPath)[0]).lower()
+
+def processFiles(args, configFile:config.Config, files, canonicalFutures:dict=None):
+	# Yields results in the same order as the files were provided, regardless of the
+	# order in which the transfers finish. Files are submitted as soon as they are
+	# provided, so transfers can begin while files are still being discovered.
+	# Files may also contain None entries, which just give an opportunity to yield
+	# any results which have finished while waiting for more files to be provided,
+	# and results for files which have already been dealt with. Files may carry a
+	# planned action as a third element, which is passed on to processFile(). The
+	# future of any source which is a key in canonicalFutures is stored there.
+	lastFutureForDest = {}
+
+	# (destination group key or None, future), in the order the files were provided.
+	inFlight = deque()
+
+	def popResult():
+		# A destination is forgotten once the result of its last transfer is yielded,
+		# so that memory doesn't grow with the number of files.
+		key, future = inFlight.popleft()
+
+		if key is not None and lastFutureForDest.get(key) is future:
+			del lastFutureForDest[key]
+
+		return future.result()
+
+	with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+		for file in files:
+			if file is None:
+				while inFlight and inFlight[0][1].done():
+					yield popResult()
+
+				if not inFlight:
+					pruneRemovedOutputDirs(args)
+
+				continue
+
+			if isinstance(file, TransferResult):
+				future = Future()
+				future.set_result(file)
+				inFlight.append((None, future))
+				continue
+
+			sourcePath, destPath = file[:2]
+			plannedAction = file[2] if len(file) > 2 else None
+
+			key = None
+
+			if destPath is None:
+				future = Future()
+				future.set_result(TransferResult(TRANSFER_TYPE_UNKNOWN, sourcePath, "", TRANSFER_ERROR_INVALID_SOURCE))
+			else:
+				key = destinationGroupKey(destPath)
+				previous = lastFutureForDest.get(key)
+
+				if previous is not None and previous.done():
+					previous = None
+
+				future = executor.submit(processFileAfter, previous, args, configFile, sourcePath, destPath, plannedAction)
+				lastFutureForDest[key] = future
+
+				if canonicalFutures is not None and sourcePath in canonicalFutures:
+					canonicalFutures[sourcePath] = future
+
+			inFlight.append((key, future))
+
+			while inFlight and inFlight[0][1].done():
+				yield popResult()
+
+		while inFlight:
+			yield popResult()
+
+	pruneRemovedOutputDirs(args)
+
+def transferFiles(args, configFile:config.Config, files):
+	# Yields a result for each file provided, in the same way as processFiles(),
+	# having first skipped any duplicates if this was requested.
+	if not args.skip_duplicates:
+		yield from processFiles(args, configFile, files)
+		return
+
+	# Source path -> future of the source which is treated as the original of its audio.
+	canonicalFutures = {}
+
+	with audio_hash.openIndex(configFile, args.jobs) as hashIndex:
+		yield from processFiles(args, configFile, skipDuplicateFiles(args, configFile, hashIndex, canonicalFutures, files), canonicalFutures)
+
+def getResultCategory(result:TransferResult) -> str:
+	if result.getTransferError() != TRANSFER_ERROR_NONE:
+		return result.getTransferError()
+
+	if result.getTransferType() == TRANSFER_TYPE_SKIP:
+		return CATEGORY_UP_TO_DATE
+
+	if result.getTransferType() == TRANSFER_TYPE_DUPLICATE:
+		return CATEGORY_DUPLICATE
+
+	if result.getTransferType() == TRANSFER_TYPE_TRANSCODE:
+		category = "Transcoded (overwritten)" if result.getReplacedTargetFile() else "Transcoded"
+		return category + " from cache" if result.getFromCache() else category
+
+	return "Overwritten" if result.getReplacedTargetFile() else "Copied"
+
+def addToResults(success:dict, failure:dict, result:TransferResult):
+	target = success if result.getSuccessful() else failure
+	category = getResultCategory(result)
 
 	if category not in target:
 		target[category] = []
 
 	target[category].append(result)
 
+def countResult(successCounts:dict, failureCounts:dict, result:TransferResult):
+	target = successCounts if result.getSuccessful() else failureCounts
+	category = getResultCategory(result)
+	target[category] = target.get(category, 0) + 1
+
+def getResultFields(result:TransferResult) -> dict:
+	fields = {
+		"successful": result.getSuccessful(),
+		"category": getResultCategory(result),
+		"transferType": result.getTransferType(),
+		"sourcePath": result.getSourcePath(),
+		"destPath": result.getDestPath(),
+		"replacedTargetFile": result.getReplacedTargetFile(),
+		"fromCache": result.getFromCache()
+	}
+
+	if not result.getSuccessful():
+		fields["reason"] = result.getTransferErrorReason()
+
+	return fields
+
+def writeResult(writer:jsonl_output.JSONLWriter, result:TransferResult):
+	writer.write(jsonl_output.EVENT_RESULT, getResultFields(result))
+
 def printSuccessfulResult(result:TransferResult):
 	sourcePath = result.getSourcePath()
 	destPath = result.getDestPath()
 	print(f"    {sourcePath}")
-	print(f"      ---> {destPath}")
+
+	if result.getTransferType() == TRANSFER_TYPE_DUPLICATE:
+		print(f"      same as {destPath}")
+	else:
+		print(f"      ---> {destPath}")
 
 def printUnsuccessfulResult(result:TransferResult):
 	sourcePath = result.getSourcePath()
@@ -355,6 +914,14 @@ def printUnsuccessfulResult(result:TransferResult):
 		indentedReason = utils.indentLines(reason, "  ")
 		print(f"    {indentedReason}")
 
+def printResult(result:TransferResult):
+	print(f"{'Successful' if result.getSuccessful() else 'Failed'}: {getResultCategory(result)}")
+
+	if result.getSuccessful():
+		printSuccessfulResult(result)
+	else:
+		printUnsuccessfulResult(result)
+
 def printResults(title:str, results:dict):
 	print(f"{title}:")
 
@@ -363,6 +930,11 @@ def printResults(title:str, results:dict):
 			resultsInCategory = results[category]
 			print(f"  {category}: {len(resultsInCategory)} files")
 
+			if category == CATEGORY_UP_TO_DATE:
+				# There are usually lots of these, and nothing happened to them.
+				print()
+				continue
+
 			for result in resultsInCategory:
 				if result.getSuccessful():
 					printSuccessfulResult(result)
@@ -373,39 +945,139 @@ def printResults(title:str, results:dict):
 	else:
 		print("  0 files")
 
-def main():
-	args = parseArgs()
-	configFile = loadConfig()
-
-	if not args.files and not args.listfile:
-		print("No files or list files were provided.", file=sys.stderr)
-		sys.exit(1)
+def runWatchMode(args, configFile:config.Config, writer:jsonl_output.JSONLWriter):
+	if not args.commit:
+		print("Dry run, no operations will be performed. Prospective results will be printed as files change.")
 
-	if not args.input_root:
-		args.input_root = configFile.getPersonalDirPath()
+	try:
+		for result in transferFiles(args, configFile, watchFiles(args, configFile)):
+			if writer:
+				writeResult(writer, result)
+			else:
+				printResult(result)
+				print()
+	except KeyboardInterrupt:
+		print("Stopped watching.")
+
+def closeTranscodeCache():
+	if TRANSCODE_CACHE:
+		TRANSCODE_CACHE.trim()
+
+		print(
+			f"Transcode cache ({TRANSCODE_CACHE.getDirPath()}): {TRANSCODE_CACHE.getHits()} hits, "
+			f"{TRANSCODE_CACHE.getMisses()} misses, {TRANSCODE_CACHE.getStores()} stored, "
+			f"{TRANSCODE_CACHE.getEvictions()} evicted"
+		)
+
+def closeTranscodeProgress():
+	TRANSCODE_PROGRESS.printSummary()
+
+def getPlanAction(result:TransferResult) -> str:
+	if not result.getSuccessful():
+		return transfer_plan.ACTION_FAIL
+
+	return {
+		TRANSFER_TYPE_COPY: transfer_plan.ACTION_COPY,
+		TRANSFER_TYPE_TRANSCODE: transfer_plan.ACTION_TRANSCODE,
+		TRANSFER_TYPE_SKIP: transfer_plan.ACTION_SKIP,
+		TRANSFER_TYPE_DUPLICATE: transfer_plan.ACTION_DUPLICATE
+	}[result.getTransferType()]
+
+def getPlanEntry(result:TransferResult, destPath:str, identity) -> dict:
+	entry = {
+		"sourcePath": result.getSourcePath(),
+		"destPath": destPath,
+		"action": getPlanAction(result),
+		"resultPath": result.getDestPath(),
+		"identity": identity
+	}
+
+	if not result.getSuccessful():
+		entry["error"] = result.getTransferError()
+		entry["reason"] = result.getTransferErrorReason()
+
+	return entry
+
+def planFiles(args, configFile:config.Config, planWriter:transfer_plan.PlanWriter, files):
+	# Yields a result for each file provided, in the same way as transferFiles(),
+	# and writes each one to the plan as it is yielded.
+	planned = {}
+
+	def recordFiles():
+		# The identity is taken before the file is validated, so that any change made
+		# to it while planning causes it to be validated again when the plan is executed.
+		for file in files:
+			if file is not None:
+				sourcePath, destPath = file
+				planned[sourcePath] = (destPath, transfer_plan.getSourceIdentity(sourcePath) if destPath else None)
+
+			yield file
+
+	for result in transferFiles(args, configFile, recordFiles()):
+		destPath, identity = planned.pop(result.getSourcePath(), (None, None))
+		planWriter.write(getPlanEntry(result, destPath, identity))
+		yield result
+
+def getPlanOptions(args) -> dict:
+	return {option: getattr(args, option) for option in PLAN_OPTIONS}
+
+def applyPlanOptions(args, options:dict):
+	for option in PLAN_OPTIONS:
+		setattr(args, option, options[option])
+
+def getPlannedFiles(args, configFile:config.Config, entries):
+	# Yields files for transferFiles() from the entries of a plan. Sources which haven't changed since
+	# planning are either given their planned action, or their planned result if there is nothing to
+	# do. Anything else is yielded as a plain file, so that it is validated again.
+	for entry in entries:
+		sourcePath = entry["sourcePath"]
+		destPath = entry["destPath"]
+		action = entry["action"]
+
+		if destPath is None:
+			# The path wasn't found when planning, but may exist now.
+			yield from discoverFiles(args, configFile, [sourcePath])
+			continue
 
-	if not args.output_root:
-		args.output_root = configFile.getDJDirPath()
+		if not transfer_plan.sourceIsUnchanged(entry):
+			yield (sourcePath, destPath)
+		elif action in (transfer_plan.ACTION_COPY, transfer_plan.ACTION_TRANSCODE):
+			yield (sourcePath, destPath, action)
+		elif action == transfer_plan.ACTION_SKIP and destinationIsUpToDate(configFile, sourcePath, entry["resultPath"]):
+			yield TransferResult(TRANSFER_TYPE_SKIP, sourcePath, entry["resultPath"], TRANSFER_ERROR_NONE)
+		elif action == transfer_plan.ACTION_DUPLICATE and os.path.isfile(entry["resultPath"]):
+			yield TransferResult(TRANSFER_TYPE_DUPLICATE, sourcePath, entry["resultPath"], TRANSFER_ERROR_NONE)
+		elif action == transfer_plan.ACTION_FAIL and entry["error"] == TRANSFER_ERROR_VALIDATION_FAILED:
+			# Validation only depends on the source, which hasn't changed.
+			result = TransferResult(TRANSFER_TYPE_UNKNOWN, sourcePath, entry["resultPath"], TRANSFER_ERROR_VALIDATION_FAILED)
+			result.setTransferErrorReason(entry["reason"])
+			yield result
+		else:
+			yield (sourcePath, destPath)
 
-	listFiles = utils.convertRelativePathsToAbsolute(args.input_root, args.listfile if args.listfile else [])
-	paths = prunePathsOutsideRoot(configFile, args.input_root, args.files + utils.parseAllLinesFromFiles(listFiles))
-	filesToProcess, ignoredFiles = buildTargetFileList(configFile, args.input_root, paths, args.recursive)
+def writeAllResults(args, writer:jsonl_output.JSONLWriter, results):
+	# Each result is written as soon as it is known, and only counts are kept, so
+	# that memory use does not grow with the number of files.
+	successCounts = {}
+	failureCounts = {}
 
-	successfulTransfers = {}
-	failedTransfers = {}
+	for result in results:
+		with instrumentation.phase(instrumentation.PHASE_OUTPUT):
+			writeResult(writer, result)
 
-	for file in ignoredFiles:
-		addToResults(successfulTransfers, failedTransfers, TransferResult(TRANSFER_TYPE_UNKNOWN, file, "", TRANSFER_ERROR_INVALID_SOURCE))
+		countResult(successCounts, failureCounts, result)
 
-	for file in filesToProcess:
-		sourcePath = file if os.path.isabs(file) else os.path.join(args.input_root, file)
+	writer.write(jsonl_output.EVENT_SUMMARY, {
+		"commit": args.commit,
+		"successful": successCounts,
+		"failed": failureCounts
+	})
 
-		if utils.fileIsDraft(configFile, sourcePath):
-			destPath = os.path.join(args.output_root, "_Draft", os.path.splitext(os.path.basename(sourcePath))[0] + ".mp3")
-		else:
-			destPath = os.path.join(args.output_root, file)
+def printAllResults(args, results):
+	successfulTransfers = {}
+	failedTransfers = {}
 
-		result = processFile(args, configFile, sourcePath, destPath)
+	for result in results:
 		addToResults(successfulTransfers, failedTransfers, result)
 
 	if not args.commit:
@@ -414,8 +1086,9 @@ def main():
 		print("####################################################################")
 		print()
 
-	printResults("Successful", successfulTransfers)
-	printResults("Failed", failedTransfers)
+	with instrumentation.phase(instrumentation.PHASE_OUTPUT):
+		printResults("Successful", successfulTransfers)
+		printResults("Failed", failedTransfers)
 
 	if not args.commit:
 		print()
@@ -423,6 +1096,86 @@ def main():
 		print("# Dry run, no operations performed. Prospective results are above. #")
 		print("####################################################################")
 
+def outputAllResults(args, writer:jsonl_output.JSONLWriter, results):
+	if writer:
+		writeAllResults(args, writer, results)
+	else:
+		printAllResults(args, results)
+
+def run(args, writer:jsonl_output.JSONLWriter):
+	global TRANSCODE_CACHE
+	global TRANSCODE_PROGRESS
+
+	configFile = loadConfig()
+
+	if args.execute_plan:
+		if args.files or args.listfile or args.watch or args.plan_out:
+			print("Files, list files, --watch and --plan-out can't be used with --execute-plan.", file=sys.stderr)
+			sys.exit(1)
+
+		args.commit = True
+	elif not args.files and not args.listfile and not args.watch:
+		print("No files or list files were provided.", file=sys.stderr)
+		sys.exit(1)
+
+	if args.plan_out and (args.commit or args.watch):
+		print("--plan-out can only be used for a dry run, without --commit or --watch.", file=sys.stderr)
+		sys.exit(1)
+
+	with contextlib.ExitStack() as stack:
+		if args.execute_plan:
+			options, entries = stack.enter_context(transfer_plan.openPlan(args.execute_plan))
+			applyPlanOptions(args, options)
+
+		if not args.input_root:
+			args.input_root = configFile.getPersonalDirPath()
+
+		if not args.output_root:
+			args.output_root = configFile.getDJDirPath()
+
+		if args.plan_out:
+			# So that the plan can be executed from any working directory.
+			args.input_root = os.path.abspath(args.input_root)
+			args.output_root = os.path.abspath(args.output_root)
+
+		TRANSCODE_CACHE = openTranscodeCache(args, configFile)
+		# The number of transcodes is only known up front when executing a plan.
+		expectedTranscodes = None
+
+		if args.execute_plan:
+			expectedTranscodes = transfer_plan.countPlannedActions(args.execute_plan, transfer_plan.ACTION_TRANSCODE)
+
+		TRANSCODE_PROGRESS = transcode_progress.TranscodeProgress(expectedTranscodes)
+
+		if args.watch:
+			runWatchMode(args, configFile, writer)
+		elif args.execute_plan:
+			files = instrumentation.timeIterator(instrumentation.PHASE_DISCOVERY, getPlannedFiles(args, configFile, entries))
+			outputAllResults(args, writer, transferFiles(args, configFile, files))
+		else:
+			listFiles = utils.convertRelativePathsToAbsolute(args.input_root, args.listfile if args.listfile else [])
+			paths = prunePathsOutsideRoot(configFile, args.input_root, args.files + utils.parseAllLinesFromFiles(listFiles))
+
+			files = instrumentation.timeIterator(instrumentation.PHASE_DISCOVERY, discoverFiles(args, configFile, paths))
+
+			if args.plan_out:
+				planWriter = stack.enter_context(transfer_plan.openWriter(args.plan_out, getPlanOptions(args)))
+				outputAllResults(args, writer, planFiles(args, configFile, planWriter, files))
+			else:
+				outputAllResults(args, writer, transferFiles(args, configFile, files))
+
+		closeTranscodeProgress()
+		closeTranscodeCache()
+
+	if args.plan_out:
+		print(f"Plan written to {args.plan_out}")
+
+def main():
+	args = parseArgs()
+
+	with instrumentation.instrument(args), jsonl_output.openOutput(args.format) as writer:
+		run(args, writer)
+
 if __name__ != "__main__":
 	raise RuntimeError("Expected file to be run as a script")
 
@@ -1,7 +1,9 @@
 import os
 import sys
 import argparse
-from lib import config, ffmpeg
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from lib import config, ffmpeg, instrumentation, transcode_progress, validation
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
 
@@ -14,21 +16,33 @@ def parseArgs():
 	parser.add_argument(
 		"input",
 		nargs="+",
-		help="Input files or folders to convert."
+		help="Input files or folders to convert. Files within folders are skipped if their output is at least as new "
+		"as they are, so that an interrupted conversion can be resumed. Files given explicitly are always converted."
 	)
 
 	parser.add_argument(
 		"-o", "--output",
-		help="Output file, or folder to output multiple files to.",
+		help="Output file, or folder to output multiple files to. The structure of input folders is mirrored within "
+		"the output folder.",
 		required=False
 	)
 
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=os.cpu_count() or 1,
+		help="Number of files to convert concurrently. Defaults to the number of CPUs (%(default)s)."
+	)
+
+	instrumentation.addArguments(parser)
+
 	return parser.parse_args()
 
 def loadConfig():
-	return config.Config(os.path.join(SCRIPT_DIR, "config.json"))
+	return config.Config(config.getConfigFilePath(SCRIPT_DIR))
 
-def convertSingleFile(configFile, input:str, output:str):
+def getOutputPath(input:str, output:str) -> str:
 	outputPath = output
 
 	if outputPath is None:
@@ -40,39 +54,121 @@ def convertSingleFile(configFile, input:str, output:str):
 		fileName = os.path.splitext(os.path.basename(input))[0]
 		outputPath = os.path.join(outputPath, fileName + ".flac")
 
-	print(f"Converting: {input} -> {outputPath}")
-	ffmpeg.toFLAC(configFile, input, outputPath)
+	return outputPath
+
+def outputIsUpToDate(input:str, outputPath:str) -> bool:
+	# An output at least as new as its input was converted after the input was last changed, so
+	# re-running an interrupted conversion only picks up the files which were not finished.
+	try:
+		return os.path.getmtime(outputPath) >= os.path.getmtime(input)
+	except FileNotFoundError:
+		return False
+
+def convertFile(configFile, input:str, outputPath:str, quiet:bool, progress:transcode_progress.TranscodeProgress) -> bool:
+	# ffmpeg writes to a temporary file, which only replaces the output once it is complete, so
+	# an interrupted conversion never leaves a partial output which would look up to date.
+	outputDir, outputName = os.path.split(outputPath)
+	tempPath = os.path.join(outputDir, f".{os.getpid()}.{threading.get_ident()}.{outputName}")
+
+	jobID = progress.startJob()
+	returncode = None
+
+	try:
+		with instrumentation.phase(instrumentation.PHASE_TRANSCODE, instrumentation.getFileType(input)):
+			returncode = ffmpeg.toFLAC(configFile, input, tempPath, quiet, progress.getCallback(jobID)).returncode
+
+		if returncode != 0:
+			print(f"Failed to convert {input}: ffmpeg returned error code {returncode}", file=sys.stderr)
+			return False
 
-def convertMultipleFiles(configFile, input:list, output:str):
-	if output is None or os.path.isfile(output):
-		raise ValueError("Output must be a directory when converting multiple input files")
+		os.replace(tempPath, outputPath)
+		return True
+	finally:
+		progress.finishJob(jobID, returncode == 0)
 
-	if not os.path.isdir(output):
-		os.makedirs(output)
+		if os.path.isfile(tempPath):
+			os.unlink(tempPath)
+
+def findInputFiles(item:str, output:str):
+	# Yields (input, output path, whether it can be skipped) for each media file within the folder, at any depth.
+	for dirPath, dirNames, fileNames in os.walk(item):
+		dirNames.sort()
+		outputDir = os.path.join(output, os.path.relpath(dirPath, item))
+
+		for fileName in sorted(fileNames):
+			if validation.fileTypeIsSupported(fileName):
+				filePath = os.path.abspath(os.path.join(dirPath, fileName))
+				yield (filePath, getOutputPath(filePath, os.path.normpath(outputDir)), True)
+
+def getConversions(input:list, output:str) -> list:
+	conversions = []
 
 	for item in input:
 		if os.path.isfile(item):
-			convertSingleFile(configFile, item, output)
+			filePath = os.path.abspath(item)
+			# Files given explicitly are always converted.
+			conversions.append((filePath, getOutputPath(filePath, output), False))
 			continue
 
 		if os.path.isdir(item):
-			for file in os.listdir(item):
-				filePath = os.path.abspath(os.path.join(item, file))
-				if os.path.isfile(filePath):
-					convertSingleFile(configFile, filePath, output)
-
+			conversions += findInputFiles(item, output)
 			continue
 
 		print("Input", item, "was not found on disk, skipping", file=sys.stderr)
 
+	return conversions
+
+def convertFiles(args, configFile, conversions:list):
+	toConvert = []
+	outputPaths = {}
+	skipped = 0
+
+	for input, outputPath, skippable in conversions:
+		key = os.path.normcase(outputPath)
+
+		if key in outputPaths:
+			# Eg. "Track.wav" and "Track.aiff" in the same folder.
+			print(f"Skipping {input}, as {outputPaths[key]} is also converted to {outputPath}", file=sys.stderr)
+			continue
+
+		outputPaths[key] = input
+
+		if skippable and outputIsUpToDate(input, outputPath):
+			skipped += 1
+			continue
+
+		toConvert.append((input, outputPath))
+
+	if skipped:
+		print(f"Skipping {skipped} files whose output is newer than the input")
+
+	progress = transcode_progress.TranscodeProgress(len(toConvert))
+
+	def convert(input:str, outputPath:str) -> bool:
+		os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+		# Written in one go, so that lines from concurrent conversions aren't interleaved.
+		print(f"Converting: {input} -> {outputPath}\n", end="", flush=True)
+		return convertFile(configFile, input, outputPath, args.jobs > 1, progress)
+
+	with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+		list(executor.map(lambda conversion: convert(*conversion), toConvert))
+
+	progress.printSummary()
+
+def run(args):
+	configFile = loadConfig()
+
+	if len(args.input) != 1 or not os.path.isfile(args.input[0]):
+		if args.output is None or os.path.isfile(args.output):
+			raise ValueError("Output must be a directory when converting multiple input files")
+
+	convertFiles(args, configFile, getConversions(args.input, args.output))
+
 def main():
 	args = parseArgs()
-	configFile = loadConfig()
 
-	if len(args.input) == 1 and os.path.isfile(args.input[0]):
-		convertSingleFile(configFile, os.path.abspath(args.input[0]), args.output)
-	else:
-		convertMultipleFiles(configFile, args.input, args.output)
+	with instrumentation.instrument(args):
+		run(args)
 
 if __name__ != "__main__":
 	raise RuntimeError("Expected file to be run as a script")
@@ -1,9 +1,13 @@
 import os
 import argparse
-from lib import config, ytdlp, utils
+from lib import config, ytdlp, utils, instrumentation
 
 SCRIPT_DIR = os.path.realpath(os.path.dirname(__file__))
 
+# Downloads are mostly limited by the network and by YouTube,
+# so only a few are run at once, regardless of the number of CPUs.
+DEFAULT_JOBS = 3
+
 def parseArgs():
 	parser = argparse.ArgumentParser(
 		"ytdraft",
@@ -22,13 +26,77 @@ def parseArgs():
 		help="Directory for output files. Defaults to the configured draft directory."
 	)
 
+	parser.add_argument(
+		"-j",
+		"--jobs",
+		type=int,
+		default=DEFAULT_JOBS,
+		help="Number of videos to download concurrently (default: %(default)s). With --batch-size, this is the "
+		"number of batches instead."
+	)
+
+	parser.add_argument(
+		"--batch-size",
+		type=int,
+		default=1,
+		help="Number of videos to download with each yt-dlp process (default: %(default)s). Larger batches avoid "
+		"starting yt-dlp for every video, but yt-dlp's own output is not shown for each video."
+	)
+
+	parser.add_argument(
+		"--ignore-archive",
+		action="store_true",
+		help=f"If set, videos are downloaded even if they are recorded in the {ytdlp.ARCHIVE_FILE_NAME} file in the "
+		"output directory as having been downloaded before. By default, they are skipped. Videos which are downloaded "
+		"successfully are recorded either way."
+	)
+
+	instrumentation.addArguments(parser)
+
 	return parser.parse_args()
 
 def loadConfig():
-	return config.Config(os.path.join(SCRIPT_DIR, "config.json"))
+	return config.Config(config.getConfigFilePath(SCRIPT_DIR))
 
-def main():
-	args = parseArgs()
+def getAudioName(result:ytdlp.DownloadResult) -> str:
+	# Returns the name of the downloaded audio file, or raises if the download failed.
+	if result.getError():
+		raise RuntimeError(result.getError())
+
+	if result.getReturnCode() != 0:
+		errorOutput = result.getErrorOutput().strip()
+		lastError = f": {errorOutput.splitlines()[-1]}" if errorOutput else ""
+		raise RuntimeError(f"yt-dlp returned error code {result.getReturnCode()}{lastError}")
+
+	if result.getFileExisted():
+		if result.getExistingName():
+			raise RuntimeError(f"File {result.getExistingName()} already existed on disk")
+		else:
+			raise RuntimeError("File already existed on disk")
+
+	if result.getAudioName() is None:
+		raise ValueError("Could not parse extracted audio file name from yt-dlp output")
+
+	return result.getAudioName()
+
+def printResult(result:ytdlp.DownloadResult, archive:ytdlp.DownloadArchive):
+	# Called as soon as each video has finished, while others may still be downloading.
+	try:
+		getAudioName(result)
+		status = "done"
+
+		archive.add(result.getVideoID())
+	except Exception as ex:
+		status = f"failed ({ex})"
+
+	print(f"Finished video {result.getVideoID()}: {status}")
+
+	if result.getOutput():
+		print(utils.indentLines(result.getOutput(), "  "))
+
+	print()
+
+def run(args):
 	configFile = loadConfig()
 
 	if not args.output_dir:
@@ -45,33 +113,52 @@ def main():
 		except ValueError as ex:
 			print(f"{ex}, ignoring")
 
+	# The same video given twice would only fail the second time, as the file would already exist.
+	videoIDs = list(dict.fromkeys(videoIDs))
+	skipped = []
+	archive = ytdlp.DownloadArchive(os.path.join(args.output_dir, ytdlp.ARCHIVE_FILE_NAME))
+
+	if not args.ignore_archive:
+		skipped = [videoID for videoID in videoIDs if archive.contains(videoID)]
+		videoIDs = [videoID for videoID in videoIDs if not archive.contains(videoID)]
+
+	if skipped:
+		print("Skipped:", len(skipped), "videos which were already downloaded")
+
+		for videoID in skipped:
+			print(f"  {videoID}")
+
 	if not videoIDs:
 		return
 
 	os.makedirs(args.output_dir, exist_ok=True)
 
+	batchSize = max(args.batch_size, 1)
+	jobs = max(args.jobs, 1)
+
+	if batchSize > 1:
+		print(f"Downloading {len(videoIDs)} videos in batches of up to {batchSize}, {jobs} batches at a time")
+	else:
+		print(f"Downloading {len(videoIDs)} videos, {jobs} at a time")
+
+	results = ytdlp.downloadYouTubeVideos(
+		configFile,
+		videoIDs,
+		args.output_dir,
+		utils.MP3_QUALITY_DRAFT,
+		jobs,
+		lambda result: printResult(result, archive),
+		batchSize
+	)
+
 	successful = []
 	failed = []
 
-	for videoID in videoIDs:
+	for result in results:
 		try:
-			print("Downloading video", videoID)
-
-			result = ytdlp.downloadYouTubeVideo(configFile, videoID, args.output_dir, utils.MP3_QUALITY_DRAFT)
-			print(result.stdout)
-			result.check_returncode()
-
-			existed, name = ytdlp.fileAlreadyExistedOnDisk(result)
-
-			if existed:
-				if name:
-					raise RuntimeError(f"File {name} already existed on disk")
-				else:
-					raise RuntimeError("File already existed on disk")
-
-			successful.append(ytdlp.extractAudioNameFromResult(result))
+			successful.append(getAudioName(result))
 		except Exception as ex:
-			failed.append(f"{videoID}: {ex}")
+			failed.append(f"{result.getVideoID()}: {ex}")
 
 	print("Success:", len(successful), "files")
 
@@ -85,6 +172,12 @@ def main():
 		for entry in failed:
 			print(f"  {entry}")
 
+def main():
+	args = parseArgs()
+
+	with instrumentation.instrument(args):
+		run(args)
+
 if __name__ != "__main__":
 	raise RuntimeError("Expected file to be run as a script")
 